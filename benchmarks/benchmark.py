@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import logging
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+# benchmark the working tree rather than an installed version
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+from qrlipsync.synthetic import generate_records, write_data_file  # noqa: E402
+
+logger = logging.getLogger("benchmark")
+
+# synthetic captures rendered with qr-lipsync-generate, then detected
+CAPTURES = [
+    {"duration": 30, "size": "640x360", "framerate": 30},
+    {"duration": 30, "size": "1280x720", "framerate": 30},
+    {"duration": 30, "size": "1920x1080", "framerate": 60},
+]
+QUICK_CAPTURES = CAPTURES[:1]
+# durations (in s) of synthetic 30 fps data files, about 31 records per second
+# (10h is over 10^6 records)
+DATA_FILES = [3600, 36000]
+QUICK_DATA_FILES = [600]
+STARTUP_RUNS = 3
+
+# metrics compared with --compare, and whether higher values are better
+METRICS = {"fps": True, "records_per_s": True, "duration": False, "peak_rss_kb": False}
+# changes for the worse beyond this (in %) are reported as regressions
+REGRESSION_PERCENT = 5
+
+FPS_RE = re.compile(r"took ([0-9.]+)s \(([0-9]+) fps\)")
+
+
+def run(cmd, cwd=None):
+    # run a python module, measuring its duration and peak memory usage
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT_DIR, os.environ.get("PYTHONPATH")])))
+    begin = time.monotonic()
+    proc = subprocess.Popen(
+        [sys.executable, "-m"] + cmd, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+    output = proc.stdout.read()
+    proc.stdout.close()
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    result = {
+        "duration": round(time.monotonic() - begin, 3),
+        # in kB on linux
+        "peak_rss_kb": rusage.ru_maxrss,
+    }
+    if proc.returncode != 0:
+        logger.error("%s failed:\n%s" % (" ".join(cmd), output))
+        result["error"] = proc.returncode
+    return result, output
+
+
+def get_fps(output):
+    # "Rendering of ... took" and "Processing took" log lines
+    match = FPS_RE.search(output)
+    if match:
+        return float(match.group(1)), int(match.group(2))
+    return None, None
+
+
+def bench_startup():
+    results = list()
+    for script in ("detect", "analyze"):
+        runs = [run(["qrlipsync.scripts.%s" % script, "--help"])[0] for _ in range(STARTUP_RUNS)]
+        best = min(runs, key=lambda r: r["duration"])
+        best.update({"name": "startup %s" % script, "kind": "startup"})
+        results.append(best)
+    return results
+
+
+def bench_captures(captures, work_dir, detect_args):
+    results = list()
+    for capture in captures:
+        name = "%(size)s@%(framerate)s %(duration)ss" % capture
+        capture_dir = os.path.join(work_dir, name.replace(" ", "_").replace("@", "_"))
+        os.makedirs(capture_dir)
+        result, output = run([
+            "qrlipsync.scripts.generate",
+            "-d", str(capture["duration"]),
+            "-r", str(capture["framerate"]),
+            "-s", capture["size"],
+            "-o", capture_dir,
+        ])
+        result["render_duration"], result["fps"] = get_fps(output)
+        result.update({"name": "generate %s" % name, "kind": "generate", **capture})
+        results.append(result)
+        if "error" in result:
+            continue
+        media_file = [f for f in os.listdir(capture_dir) if f.endswith(".qt")][0]
+        result, output = run(
+            ["qrlipsync.scripts.detect", "-s"] + detect_args + [media_file], cwd=capture_dir
+        )
+        result["processing_duration"], result["fps"] = get_fps(output)
+        result.update({"name": "detect %s" % name, "kind": "detect", "detect_args": detect_args, **capture})
+        results.append(result)
+    return results
+
+
+def bench_analyzer(durations, work_dir):
+    results = list()
+    for duration in durations:
+        for binary_format in (False, True):
+            data_file = os.path.join(work_dir, "synthetic_%s_data.%s" % (duration, "bin" if binary_format else "txt"))
+            begin = time.monotonic()
+            records = write_data_file(data_file, generate_records(duration), binary_format)
+            logger.info("Wrote %s records into %s in %.1fs" % (records, data_file, time.monotonic() - begin))
+            result, _ = run(["qrlipsync.scripts.analyze", "-n", data_file])
+            result.update({
+                "name": "analyze %ss %s" % (duration, "binary" if binary_format else "text"),
+                "kind": "analyze",
+                "records": records,
+                "file_size": os.path.getsize(data_file),
+                "records_per_s": round(records / result["duration"]),
+            })
+            results.append(result)
+            os.remove(data_file)
+    return results
+
+
+def get_version():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], cwd=ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_comparable_name(name):
+    # text data files used to be called json
+    if name.startswith("analyze ") and name.endswith(" json"):
+        return name[:-len("json")] + "text"
+    return name
+
+
+def compare(results, previous):
+    # print how the main metrics of each benchmark evolved, and whether for
+    # the better or the worse
+    previous_results = {get_comparable_name(r["name"]): r for r in previous["benchmarks"]}
+    for result in results["benchmarks"]:
+        before = previous_results.get(result["name"])
+        for metric, higher_is_better in METRICS.items():
+            if before and result.get(metric) and before.get(metric):
+                change = 100 * (result[metric] / before[metric] - 1)
+                better = change > 0 if higher_is_better else change < 0
+                if not change:
+                    verdict = ""
+                elif better:
+                    verdict = "better"
+                elif abs(change) > REGRESSION_PERCENT:
+                    verdict = "REGRESSION"
+                else:
+                    verdict = "worse"
+                logger.log(
+                    logging.WARNING if verdict == "REGRESSION" else logging.INFO,
+                    "%-40s %-14s %12s -> %12s (%+.1f%%) %s"
+                    % (result["name"], metric, before[metric], result[metric], change, verdict)
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark qr-lipsync generation, detection and analysis",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("-o", "--output", help="json file to write results into", default="benchmark.json")
+    parser.add_argument("--quick", help="only run small benchmarks", action="store_true")
+    parser.add_argument("--compare", help="json results of a previous run to compare with")
+    parser.add_argument("--skip-captures", help="do not generate and detect captures", action="store_true")
+    parser.add_argument(
+        "--detect-args",
+        help="extra qr-lipsync-detect arguments, e.g. '--luma --audio-detector goertzel'",
+        default="",
+    )
+    options = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s %(name)s %(levelname)s %(message)s", level=logging.INFO)
+
+    results = {
+        "version": get_version(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "benchmarks": bench_startup(),
+    }
+    with tempfile.TemporaryDirectory() as work_dir:
+        if not options.skip_captures:
+            captures = QUICK_CAPTURES if options.quick else CAPTURES
+            results["benchmarks"] += bench_captures(captures, work_dir, options.detect_args.split())
+        durations = QUICK_DATA_FILES if options.quick else DATA_FILES
+        results["benchmarks"] += bench_analyzer(durations, work_dir)
+
+    with open(options.output, "w") as f:
+        json.dump(results, f, indent=2)
+    logger.info("Wrote results into %s" % options.output)
+    if options.compare:
+        with open(options.compare) as f:
+            compare(results, json.load(f))
+    return 1 if any("error" in r for r in results["benchmarks"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,32 +1,91 @@
 import time
 import logging
 import os
+import re
 import json
-import statistics
 import fractions
+import functools
+import resource
+import sys
 import numpy as np
 
+from qrlipsync import binary
+from qrlipsync.columns import ColumnStore
+from qrlipsync.stats import DriftDetector, IntegerHistogram
+from qrlipsync.timeseries import WindowedSeries, format_window, parse_windows
+
 logger = logging.getLogger(__name__)
 
 SECOND = 1000000000
 NAN = "could not measure"
 
+QRCODE_COLUMNS = (
+    ("qrcode_timestamp", np.float64),
+    ("decoded_timestamp", np.float64),
+    ("qrcode_frame_number", np.int64),
+    ("qrcode_framerate", np.float64),
+    # -1 when the qrcode does not carry a beep frequency
+    ("beep_freq", np.int64),
+)
+
+BEEP_COLUMNS = (
+    ("timestamp", np.float64),
+    ("peak_value", np.float64),
+    ("beep_freq", np.int64),
+)
+
+
+@functools.lru_cache(maxsize=16)
+def parse_framerate(framerate):
+    # qrcodes all carry the same few framerate strings, parse each only once
+    return float(fractions.Fraction(framerate))
+
+
+def get_peak_rss_mb():
+    # ru_maxrss is in kB on linux but in bytes on macos
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_rss /= 1024
+    return round(peak_rss / 1024, 1)
+
+
+def get_report_prefix(input_file, source=None):
+    # report files are written next to the data file, one set per source if given
+    prefix = os.path.splitext(input_file)[0]
+    if source is not None:
+        prefix = "%s.%s" % (prefix, re.sub(r"\W+", "_", source))
+    return prefix
+
+
+def find_first_reaching(values, start, value):
+    # index of the first of values[start:] reaching value, looked for in
+    # chunks of growing size so that the cost depends on the distance to it
+    size = 16
+    while start < len(values):
+        running_max = np.maximum.accumulate(values[start:start + size])
+        index = int(np.searchsorted(running_max, value, side="left"))
+        if index < len(running_max):
+            return start + index
+        start += size
+        size *= 2
+
 
 class QrLipsyncAnalyzer:
-    def __init__(self, input_file, options):
+    def __init__(self, input_file, options, source=None):
         self._input_file = input_file
         self.options = options
 
         self._fd_result_log = -1
         self._fd_graph = -1
+        # windowed time series, only kept when written next to the reports
+        self.series = list()
         if not options.no_report_files:
-            dirname = os.path.dirname(input_file)
-            media_name = os.path.splitext(os.path.basename(input_file))[0]
-            self._result_file = os.path.join(dirname, "%s.report.json" % media_name)
-            self._result_log = os.path.join(dirname, "%s.report.txt" % media_name)
-            self._result_graph_file = os.path.join(
-                dirname, "%s.graph.txt" % (media_name)
-            )
+            prefix = get_report_prefix(input_file, source)
+            self._result_file = "%s.report.json" % prefix
+            self._result_log = "%s.report.txt" % prefix
+            self._result_graph_file = "%s.graph.txt" % prefix
+            self._result_series_prefix = "%s.windows" % prefix
+            self.series = [WindowedSeries(w) for w in parse_windows(options.windows)]
 
         self.expected_qrcode_name = options.qrcode_name
         self.custom_data_name = options.custom_data_name
@@ -36,6 +95,7 @@ class QrLipsyncAnalyzer:
         self.dropped_frames_count = 0
         self.duplicated_frames_count = 0
         self.missing_beeps_count = 0
+        self.qrcodes_with_freq_count = 0
 
         self.video_duration_s = 0
         self.audio_duration_s = 0
@@ -44,24 +104,30 @@ class QrLipsyncAnalyzer:
         self.max_delay_ts = 0
 
         self.qrcode_names = list()
-        self.all_audio_beeps = list()
-        self.all_qrcodes = list()
-        self.all_qrcodes_with_freq = list()
+        self.all_audio_beeps = ColumnStore(BEEP_COLUMNS)
+        self.all_qrcodes = ColumnStore(QRCODE_COLUMNS)
         self.all_qrcode_framerates = list()
-        self.audio_video_delays_ms = list()
-        self.audio_video_delays_tc = list()
+        self.audio_video_delays_ms = np.empty(0, dtype=np.int64)
+        self.audio_video_delays_tc = np.empty(0, dtype=np.float64)
+        # exact distribution of delays, whose size only depends on their range
+        self.av_delays = IntegerHistogram()
+        self.drift = DriftDetector()
+
+    def feed(self, record):
+        # record is a detector line, either as a dict or as a json string
+        if isinstance(record, str):
+            record = json.loads(record)
+        self.parse_line(record)
 
     def start(self):
+        if binary.is_binary_file(self._input_file):
+            return self.start_binary()
         result = 0
         logger.info("Reading file %s" % self._input_file)
         begin = time.time()
 
         with open(self._input_file, "r") as fd_input_file:
-            if not self.options.no_report_files:
-                self._fd_result_file = open(self._result_file, "w")
-                self._fd_result_log = open(self._result_log, "w")
-                self._fd_graph = open(self._result_graph_file, "w")
-                self.write_graphfile("time\tdelay")
+            self.open_files()
             try:
                 fd_input_file.seek(0)
             except Exception as e:
@@ -74,10 +140,41 @@ class QrLipsyncAnalyzer:
 
         if result == 0:
             logger.info("Finished reading, took %is" % (time.time() - begin))
-            self.check_av_sync()
-            self.check_video_stats()
-            result = self.check_qrcode_names()
-        return result == 0
+            return self.finish()
+        return False
+
+    def start_binary(self):
+        logger.info("Reading binary file %s" % self._input_file)
+        begin = time.time()
+        if self.custom_data_name != binary.CUSTOM_DATA_NAME:
+            logger.warning(
+                "Binary data files only contain %s custom data, ignoring %s"
+                % (binary.CUSTOM_DATA_NAME, self.custom_data_name)
+            )
+        try:
+            binary.check_header(self._input_file)
+        except ValueError as e:
+            logger.error(e)
+            return False
+        self.open_files()
+        for records in binary.iter_records(self._input_file):
+            self.parse_records(records)
+        logger.info("Finished reading, took %is" % (time.time() - begin))
+        return self.finish()
+
+    def finish(self):
+        self.check_av_sync()
+        self.check_video_stats()
+        return self.check_qrcode_names() == 0
+
+    def open_files(self):
+        if not self.options.no_report_files:
+            self._fd_result_file = open(self._result_file, "w")
+            self._fd_result_log = open(self._result_log, "w")
+            self._fd_graph = open(self._result_graph_file, "w")
+            self.write_graphfile("time\tdelay")
+            for series in self.series:
+                series.open_csv(self.get_series_file(series, "csv"))
 
     def close_files(self):
         if not self.options.no_report_files:
@@ -112,14 +209,12 @@ class QrLipsyncAnalyzer:
                 "decoded_timestamp": decoded_timestamp,
                 "qrcode_frame_number": qrcode_frame_number,
                 "qrcode_name": qrcode_name,
-                "qrcode_framerate": float(fractions.Fraction(line.get("FRAMERATE"))),
+                "qrcode_framerate": parse_framerate(line.get("FRAMERATE")),
             }
 
             beep_freq = line.get(self.custom_data_name)
             if beep_freq is not None and len(beep_freq) > 0:
-                qrcode["beep_freq"] = beep_freq
-                if qrcode not in self.all_qrcodes_with_freq:
-                    self.all_qrcodes_with_freq.append(qrcode)
+                qrcode["beep_freq"] = int(beep_freq)
             return qrcode
 
     def get_timecode_from_seconds(self, seconds):
@@ -147,109 +242,180 @@ class QrLipsyncAnalyzer:
         # this is expected behaviour but may be interpreted as backwards frames
         # we estimate that the sample is 30fps and is at least 10s long
         max_backwards_diff = -30 * 10
-        start_timestamp = end_timestamp = None
         frame_duration = None
 
-        qrcode_framerate = 0
-
-        last_qrcode = None
         logger.info(f"Detected {len(self.all_qrcodes)} qrcodes and {len(self.all_audio_beeps)} beeps")
-        for qrcode in self.all_qrcodes:
-            if not self.frame_duration_ms:
-                frame_duration = 1 / qrcode["qrcode_framerate"]
-                self.frame_duration_ms = frame_duration * 1000
-                logger.info(
-                    "Detected original sample frame duration of %.1fms" % (self.frame_duration_ms)
-                )
+        timestamps = self.all_qrcodes.column("decoded_timestamp")
+        frame_numbers = self.all_qrcodes.column("qrcode_frame_number")
+        if not len(frame_numbers):
+            return
+        if not self.frame_duration_ms:
+            # a python float, numpy rounds differently in get_ms_to_frames
+            frame_duration = 1 / float(self.all_qrcodes.column("qrcode_framerate")[0])
+            self.frame_duration_ms = frame_duration * 1000
+            logger.info(
+                "Detected original sample frame duration of %.1fms" % (self.frame_duration_ms)
+            )
 
-            timestamp = qrcode["decoded_timestamp"]
-            if last_qrcode is not None:
-                qrcode_frame_number = qrcode["qrcode_frame_number"]
-                last_frame_nb = last_qrcode["qrcode_frame_number"]
-                qrcode_frame_number_diff = qrcode_frame_number - last_frame_nb
-                if qrcode_frame_number_diff == 1:
-                    # normal behaviour
-                    qrcode_framerate += 1
-                elif qrcode_frame_number_diff > 1:
-                    qrcode_framerate += 1
-                    dropped_frames = qrcode_frame_number_diff - 1
-                    self.dropped_frames_count += dropped_frames
-                    logger.debug(
-                        "%s dropped frame(s): %s > %s at %s"
-                        % (
-                            dropped_frames,
-                            last_frame_nb,
-                            qrcode_frame_number,
-                            self.get_timecode_from_seconds(timestamp),
-                        )
-                    )
-                elif qrcode_frame_number == last_frame_nb:
-                    logger.debug(
-                        "1 duplicated frame at  %s"
-                        % self.get_timecode_from_seconds(timestamp)
+        # diffs[i] is the frame number jump between qrcode i and qrcode i + 1
+        diffs = np.diff(frame_numbers)
+        dropped = diffs > 1
+        duplicated = diffs == 0
+        backwards = (diffs < 0) & (diffs > max_backwards_diff)
+        # jumps below max_backwards_diff mean the video is starting over
+        self.dropped_frames_count += int(np.sum(diffs[dropped] - 1))
+        self.duplicated_frames_count += int(np.count_nonzero(duplicated))
+        for series in self.series:
+            # the first qrcode and those with a new frame number are distinct frames
+            series.add("frames", timestamps[np.concatenate(([True], diffs != 0))])
+            series.add("dropped_frames", timestamps[1:][dropped], diffs[dropped] - 1)
+            series.add("duplicated_frames", timestamps[1:][duplicated])
+        self.log_video_events(timestamps, frame_numbers, diffs, dropped, duplicated, backwards)
+
+        if frame_duration is not None:
+            self.all_qrcode_framerates.extend(
+                self.get_framerates(timestamps, diffs != 0, frame_duration)
+            )
+
+    def log_video_events(self, timestamps, frame_numbers, diffs, dropped, duplicated, backwards):
+        debug = logger.isEnabledFor(logging.DEBUG)
+        events = dropped | duplicated if debug else np.zeros_like(dropped)
+        for i in np.flatnonzero(events | backwards).tolist():
+            qrcode_frame_number = int(frame_numbers[i + 1])
+            last_frame_nb = int(frame_numbers[i])
+            timestamp = float(timestamps[i + 1])
+            if dropped[i]:
+                logger.debug(
+                    "%s dropped frame(s): %s > %s at %s"
+                    % (
+                        int(diffs[i]) - 1,
+                        last_frame_nb,
+                        qrcode_frame_number,
+                        self.get_timecode_from_seconds(timestamp),
                     )
-                    self.duplicated_frames_count += 1
-                elif qrcode_frame_number_diff < 0:
-                    qrcode_framerate += 1
-                    if qrcode_frame_number_diff > max_backwards_diff:
-                        logger.warning(
-                            "Backwards frame: %s > %s"
-                            % (qrcode_frame_number, last_frame_nb)
-                        )
-                    else:
-                        # video is starting over
-                        pass
-            if frame_duration is not None:
-                if start_timestamp is None:
-                    start_timestamp = int(timestamp)
-                    end_timestamp = start_timestamp + 1 - frame_duration
-                elif timestamp >= end_timestamp:
-                    self.all_qrcode_framerates.append(qrcode_framerate)
-                    start_timestamp = end_timestamp = None
-                    qrcode_framerate = 0
-            last_qrcode = qrcode
+                )
+            elif duplicated[i]:
+                logger.debug(
+                    "1 duplicated frame at  %s"
+                    % self.get_timecode_from_seconds(timestamp)
+                )
+            else:
+                logger.warning(
+                    "Backwards frame: %s > %s"
+                    % (qrcode_frame_number, last_frame_nb)
+                )
+
+    def get_framerates(self, timestamps, counted, frame_duration):
+        # count the qrcodes with a new frame number inside consecutive windows
+        # of about one second; a window opens on a qrcode and closes on the first
+        # following qrcode reaching the next second (minus one frame)
+        counts = np.concatenate(([0], np.cumsum(counted)))
+        # running maximum so that the first timestamp reaching a value can be bisected
+        running_max = np.maximum.accumulate(timestamps)
+        framerates = list()
+        opening = 0
+        while opening < len(timestamps):
+            end_timestamp = int(timestamps[opening]) + 1 - frame_duration
+            closing = int(np.searchsorted(running_max, end_timestamp, side="left"))
+            if closing <= opening:
+                # an earlier qrcode already went past the end of this window
+                closing = find_first_reaching(timestamps, opening + 1, end_timestamp)
+                if closing is None:
+                    break
+            elif closing == len(timestamps):
+                break
+            # qrcodes from opening to closing (included) belong to this window
+            framerates.append(int(counts[closing] - counts[opening - 1]) if opening else int(counts[closing]))
+            opening = closing + 1
+        return framerates
+
+    def get_qrcodes_with_freq(self):
+        # return the indexes of distinct qrcodes carrying a beep frequency, in order
+        qrcodes = self.all_qrcodes
+        with_freq = np.flatnonzero(qrcodes.column("beep_freq") >= 0)
+        records = np.rec.fromarrays([qrcodes.column(name)[with_freq] for name in qrcodes.names])
+        _, first_indexes = np.unique(records, return_index=True)
+        return with_freq[np.sort(first_indexes)]
 
     def check_av_sync(self):
-        if len(self.all_qrcodes_with_freq) > 0:
+        indexes = self.get_qrcodes_with_freq()
+        self.qrcodes_with_freq_count = len(indexes)
+        if self.qrcodes_with_freq_count > 0:
             logger.info("Checking AV sync")
-            # for each new qrcode found that contains frequency information
-            for f in self.all_qrcodes_with_freq:
-                qrcode_freq = int(f["beep_freq"])
-                # actual buffer timestamp, not the one written in the qrcode
-                qrcode_ts = f["decoded_timestamp"]
-                audio_candidates = self.filter_audio_samples(
-                    timestamp=qrcode_ts, width=5
-                )
-                ts = self.find_beep(audio_candidates, qrcode_freq)
-                if ts:
-                    # timestamps are in s
-                    diff_ms = round((ts - qrcode_ts) * 1000)
+            qrcode_freqs = self.all_qrcodes.column("beep_freq")[indexes]
+            # actual buffer timestamp, not the one written in the qrcode
+            qrcodes_ts = self.all_qrcodes.column("decoded_timestamp")[indexes]
+            beeps_ts = self.find_beeps(qrcodes_ts, qrcode_freqs, width=5)
+            # a beep at timestamp 0 is considered as not found
+            found = np.nan_to_num(beeps_ts) != 0
+            # timestamps are in s
+            delays_ms = np.round((beeps_ts[found] - qrcodes_ts[found]) * 1000).astype(np.int64)
+            self.audio_video_delays_ms = delays_ms
+            self.audio_video_delays_tc = beeps_ts[found]
+            self.missing_beeps_count = int(np.count_nonzero(~found))
+            for series in self.series:
+                series.add("missing_beeps", qrcodes_ts[~found])
+            if len(delays_ms):
+                max_index = np.argmax(np.abs(delays_ms))
+                if delays_ms[max_index]:
+                    self.max_delay_ms = int(delays_ms[max_index])
+                    self.max_delay_ts = float(self.audio_video_delays_tc[max_index])
+
+            delays = iter(delays_ms.tolist())
+            for qrcode_freq, qrcode_ts, ts, is_found in zip(
+                qrcode_freqs.tolist(), qrcodes_ts.tolist(), beeps_ts.tolist(), found.tolist()
+            ):
+                if is_found:
+                    diff_ms = next(delays)
                     logger.debug("Found beep at %ss, diff: %sms" % (ts, diff_ms))
                     self.write_graphfile("%s\t%s" % (ts, diff_ms))
-                    self.audio_video_delays_ms.append(diff_ms)
-                    self.audio_video_delays_tc.append(ts)
-                    if abs(diff_ms) > abs(self.max_delay_ms):
-                        self.max_delay_ms = diff_ms
-                        self.max_delay_ts = ts
+                    self.add_av_delay(ts, diff_ms)
                 else:
                     logger.warning(
                         "Did not find %s Hz beep at %s"
                         % (qrcode_freq, self.get_timecode_from_seconds(qrcode_ts))
                     )
-                    self.missing_beeps_count += 1
 
-    def filter_audio_samples(self, timestamp, width):
-        # return audio buffers between timestamp - width and timestamp + width
-        start = timestamp - width / 2
-        end = timestamp + width / 2
-        samples = [a for a in self.all_audio_beeps if start < a["timestamp"] < end]
-        return samples
+    def add_av_delay(self, ts, diff_ms):
+        self.av_delays.add(diff_ms)
+        for series in self.series:
+            series.add_delay(ts, diff_ms)
+        if self.drift.add(ts, diff_ms):
+            logger.warning(
+                "Delay drift changed at %s, it was %s ms/s before"
+                % (self.get_timecode_from_seconds(ts), self.drift.segments[-1]["drift_ms_per_s"])
+            )
 
-    def find_beep(self, audio_samples, frequency):
+    def find_beeps(self, timestamps, frequencies, width):
+        # return the timestamp of the first beep in file order matching each
+        # frequency between timestamp - width / 2 and timestamp + width / 2
+        # (nan if none), as the incremental analyzer finds them
         threshold_hz = 50
-        for i, item in enumerate(audio_samples):
-            if abs(item["beep_freq"] - frequency) < threshold_hz:
-                return audio_samples[i]["timestamp"]
+        all_beeps_ts = self.all_audio_beeps.column("timestamp")
+        order = np.argsort(all_beeps_ts, kind="stable")
+        beeps_ts = all_beeps_ts[order]
+        beeps_freqs = self.all_audio_beeps.column("beep_freq")[order]
+        found = np.full(len(timestamps), np.nan)
+        for frequency in np.unique(frequencies):
+            # beeps close enough to this frequency, by timestamp
+            matching = np.abs(beeps_freqs - frequency) < threshold_hz
+            bucket = beeps_ts[matching]
+            if not len(bucket):
+                continue
+            selected = frequencies == frequency
+            # beeps of each window are bucket[first:last]
+            first = np.searchsorted(bucket, timestamps[selected] - width / 2, side="right")
+            last = np.searchsorted(bucket, timestamps[selected] + width / 2, side="left")
+            # lowest file index of each window, bounds alternating in a single
+            # reduceat (the extra index makes last always valid)
+            indexes = np.append(order[matching], len(all_beeps_ts))
+            bounds = np.empty(2 * len(first), dtype=np.intp)
+            bounds[0::2] = first
+            bounds[1::2] = last
+            first_in_file = np.minimum.reduceat(indexes, bounds)[0::2]
+            in_window = first < last
+            found[np.flatnonzero(selected)[in_window]] = all_beeps_ts[first_in_file[in_window]]
+        return found
 
     def parse_line(self, line):
         name = line.get("ELEMENTNAME")
@@ -257,19 +423,54 @@ class QrLipsyncAnalyzer:
             self.qrcode_frames_count += 1
             qrcode = self.get_qrcode_data(line)
             if qrcode:
-                self.all_qrcodes.append(qrcode)
+                self.all_qrcodes.append(
+                    qrcode["qrcode_timestamp"],
+                    qrcode["decoded_timestamp"],
+                    qrcode["qrcode_frame_number"],
+                    qrcode["qrcode_framerate"],
+                    qrcode.get("beep_freq", -1),
+                )
         elif name == "spectrum":
-            audio_data = {}
-            audio_data["timestamp"] = float(line["TIMESTAMP"]) / SECOND
-            audio_data["peak_value"] = line["PEAK"]
-            audio_data["beep_freq"] = line["FREQ"]
-            self.all_audio_beeps.append(audio_data)
+            self.all_audio_beeps.append(
+                float(line["TIMESTAMP"]) / SECOND,
+                line["PEAK"],
+                line["FREQ"],
+            )
         else:
             if line.get("AUDIODURATION"):
                 self.audio_duration_s = round(float(line["AUDIODURATION"]) / SECOND, 3)
             if line.get("VIDEODURATION"):
                 self.video_duration_s = round(float(line["VIDEODURATION"]) / SECOND, 3)
 
+    def parse_records(self, records):
+        # same as parse_line, for a whole array of binary records at once
+        kinds = records["kind"]
+        qrcodes = records[kinds == binary.KIND_QRCODE]
+        self.qrcode_frames_count += len(qrcodes)
+        names, first_indexes = np.unique(qrcodes["name"], return_index=True)
+        for name in names[np.argsort(first_indexes)]:
+            if name.decode() not in self.qrcode_names:
+                self.qrcode_names.append(name.decode())
+
+        qrcodes = qrcodes[qrcodes["name"] == self.expected_qrcode_name.encode()]
+        self.all_qrcodes.extend(
+            qrcode_timestamp=qrcodes["qrcode_timestamp"] / SECOND,
+            decoded_timestamp=qrcodes["timestamp"] / SECOND,
+            qrcode_frame_number=qrcodes["frame_number"],
+            qrcode_framerate=qrcodes["framerate_num"] / qrcodes["framerate_denom"],
+            beep_freq=qrcodes["freq"],
+        )
+
+        beeps = records[kinds == binary.KIND_BEEP]
+        self.all_audio_beeps.extend(
+            timestamp=beeps["timestamp"] / SECOND,
+            peak_value=beeps["peak"],
+            beep_freq=beeps["freq"],
+        )
+
+        for duration in records[kinds == binary.KIND_DURATION]:
+            self.parse_line(binary.unpack_record(duration))
+
     def read_and_parse_line(self, fd_input_file):
         result = 0
         json_line = None
@@ -285,35 +486,104 @@ class QrLipsyncAnalyzer:
             result = 1
         return result, json_line
 
-    def write_line(self, line_content, dfile):
+    def write_line(self, line_content, dfile, flush=True):
         if not self.options.no_report_files:
             if line_content is not None:
                 line_content += "\n"
                 dfile.write(line_content)
-                dfile.flush()
+                if flush:
+                    dfile.flush()
 
     def write_logfile(self, line_content):
         logger.info(line_content)
         self.write_line(line_content, self._fd_result_log)
 
     def write_graphfile(self, line_content):
-        self.write_line(line_content, self._fd_graph)
+        # one line per beep, left to the file buffering
+        self.write_line(line_content, self._fd_graph, flush=False)
+
+    def get_series_file(self, series, extension):
+        return "%s_%s.%s" % (self._result_series_prefix, format_window(series.window_s), extension)
+
+    def write_series(self):
+        # windows not written yet
+        for series in self.series:
+            series.close()
+            if self.options.windows_npz:
+                series.write_npz(self.get_series_file(series, "npz"), self.get_series_file(series, "csv"))
+        if self.series:
+            logger.info(
+                "Wrote %s time series into %s_*.csv"
+                % (", ".join(format_window(s.window_s) for s in self.series), self._result_series_prefix)
+            )
+
+    def get_av_delay_mean(self):
+        if self.av_delays.count:
+            return round(self.av_delays.mean(), 2)
+        return NAN
+
+    def get_av_delay_median(self):
+        if self.av_delays.count:
+            return round(self.av_delays.median())
+        return NAN
+
+    def get_av_delay_percentiles(self):
+        # min, p50, p95, p99 and max delays in ms
+        names = ("min", "p50", "p95", "p99", "max")
+        if not self.av_delays.count:
+            return dict.fromkeys(names, NAN)
+        return {
+            "min": self.av_delays.min(),
+            "p50": round(self.av_delays.percentile(50), 1),
+            "p95": round(self.av_delays.percentile(95), 1),
+            "p99": round(self.av_delays.percentile(99), 1),
+            "max": self.av_delays.max(),
+        }
+
+    def get_av_delay_histogram(self):
+        # number of delays by multiple of the frame duration they are closest to
+        if not self.av_delays.count or not self.frame_duration_ms:
+            return []
+        return [
+            {"frames": frames, "count": count}
+            for frames, count in self.av_delays.bins(self.frame_duration_ms).items()
+        ]
+
+    def get_av_delay_accel(self):
+        num_samples = self.drift.total.count
+        if num_samples:
+            min_values = self.get_min_accel_samples()
+            if num_samples < min_values:
+                logger.info(f"Got only {num_samples} samples, we need at least {min_values} samples to detect drifts")
+                return 0
+            # we assume that beeps are every second, so this is a trend per second
+            slope = self.drift.total.slope
+            logger.debug("%.2f ms/s accel slope found" % slope)
+            return int(slope)
+        return NAN
+
+    def get_av_delay_drift(self, ndigits=3):
+        # drift over the whole run with its confidence interval, in ms/s
+        if self.drift.total.count < 3:
+            return NAN, NAN
+        low, high = self.drift.total.slope_interval()
+        return round(self.drift.total.slope, ndigits), [round(low, ndigits), round(high, ndigits)]
+
+    def get_avg_real_framerate(self):
+        return self.get_mean(self.all_qrcode_framerates, 2)
+
+    def get_total_beeps(self):
+        return len(self.all_audio_beeps)
 
     def get_results_dict(self):
-        avg_av_delay_ms = (
-            self.get_mean(self.audio_video_delays_ms)
-            if len(self.audio_video_delays_ms) > 0
-            else NAN
-        )
+        avg_av_delay_ms = self.get_av_delay_mean()
         avg_av_delay_frames = (
             self.get_ms_to_frames(avg_av_delay_ms) if avg_av_delay_ms != NAN else NAN
         )
 
-        median_av_delay_ms = (
-            self.get_median(self.audio_video_delays_ms, 0)
-            if len(self.audio_video_delays_ms) > 0
-            else NAN
-        )
+        median_av_delay_ms = self.get_av_delay_median()
+        percentiles = self.get_av_delay_percentiles()
+        drift, drift_ci95 = self.get_av_delay_drift()
         median_av_delay_frames = (
             self.get_ms_to_frames(median_av_delay_ms)
             if median_av_delay_ms != NAN
@@ -330,13 +600,22 @@ class QrLipsyncAnalyzer:
                 self.dropped_frames_count, self.qrcode_frames_count
             ),
             "total_frames": self.qrcode_frames_count,
-            "total_beeps": len(self.all_audio_beeps),
-            "avg_real_framerate": self.get_mean(self.all_qrcode_framerates, 2),
+            "total_beeps": self.get_total_beeps(),
+            "avg_real_framerate": self.get_avg_real_framerate(),
             "median_av_delay_ms": median_av_delay_ms,
             "median_av_delay_frames": median_av_delay_frames,
             "avg_av_delay_ms": avg_av_delay_ms,
             "avg_av_delay_frames": avg_av_delay_frames,
-            "av_delay_accel": self.get_accel(self.audio_video_delays_tc, self.audio_video_delays_ms),
+            "av_delay_min_ms": percentiles["min"],
+            "av_delay_p50_ms": percentiles["p50"],
+            "av_delay_p95_ms": percentiles["p95"],
+            "av_delay_p99_ms": percentiles["p99"],
+            "av_delay_max_ms": percentiles["max"],
+            "av_delay_histogram_frames": self.get_av_delay_histogram(),
+            "av_delay_accel": self.get_av_delay_accel(),
+            "av_delay_drift_ms_per_s": drift,
+            "av_delay_drift_ci95": drift_ci95,
+            "drift_segments": self.drift.get_segments(),
             "max_delay_ms": self.max_delay_ms,
             "max_delay_ts": self.max_delay_ts,
             "video_duration": self.video_duration_s,
@@ -360,49 +639,22 @@ class QrLipsyncAnalyzer:
             return 1
         return 0
 
-    def try_mean(self, list):
-        result = 0
-        if list:
-            try:
-                result = statistics.mean(list)
-            except Exception as e:
-                logger.error(f'statistics.mean failed: {e}')
-                result = -1
-        return result
-
-    def get_mean(self, list, ndigits=2):
-        return round(self.try_mean(list), ndigits)
-
-    def get_median(self, list, ndigits=2):
-        if ndigits != 0:
-            return round(statistics.median(list), ndigits)
-        else:
-            return round(statistics.median(list))
+    def get_mean(self, values, ndigits=2):
+        if len(values) == 0:
+            return 0
+        return round(float(np.mean(values)), ndigits)
 
     def get_percent(self, value, total, ndigits=1):
+        if not total:
+            return 0
         return round(100 * value / total, ndigits)
 
     def get_ms_to_frames(self, value):
         return int(round(value / self.frame_duration_ms, 1))
 
-    def get_accel(self, x_values, y_values):
+    def get_min_accel_samples(self):
         # we need enough samples so that +/- 1 frame is negligible
-        num_samples = len(y_values)
-        if num_samples:
-            min_values = int(os.environ.get("QRLIPSYNC_MIN_ACCEL_SAMPLES", int(self.frame_duration_ms * 2)))
-            if num_samples < min_values:
-                logger.info(f"Got only {num_samples} samples, we need at least {min_values} samples to detect drifts")
-                return 0
-            else:
-                order = 1
-                result = np.polyfit(x_values, y_values, order)
-                # we assume that beeps are every second, so this is a trend per second
-                slope = result[-2]
-                logger.debug("%.2f ms/s accel slope found" % slope)
-                # ignore values below 1ms
-            return int(slope)
-        else:
-            return NAN
+        return int(os.environ.get("QRLIPSYNC_MIN_ACCEL_SAMPLES", int(self.frame_duration_ms * 2)))
 
     def show_summary_and_exit(self):
         results_dict = self.get_results_dict()
@@ -429,7 +681,7 @@ class QrLipsyncAnalyzer:
             "Average framerate (based on qrcode content) is %s"
             % results_dict["avg_real_framerate"]
         )
-        if len(self.audio_video_delays_ms) > 0:
+        if results_dict["median_av_delay_ms"] != NAN:
             median_value = results_dict["median_av_delay_ms"]
             median_value_frames = results_dict["median_av_delay_frames"]
             if int(round(median_value)) == 0:
@@ -453,10 +705,38 @@ class QrLipsyncAnalyzer:
                     self.get_timecode_from_seconds(self.max_delay_ts),
                 )
             self.write_logfile(string_median_delay)
+            self.write_logfile(
+                "Delay percentiles: min %sms, p50 %sms, p95 %sms, p99 %sms, max %sms"
+                % (
+                    results_dict["av_delay_min_ms"],
+                    results_dict["av_delay_p50_ms"],
+                    results_dict["av_delay_p95_ms"],
+                    results_dict["av_delay_p99_ms"],
+                    results_dict["av_delay_max_ms"],
+                )
+            )
+            if results_dict["av_delay_histogram_frames"]:
+                self.write_logfile(
+                    "Delays by frames: %s"
+                    % ", ".join(
+                        "%+d: %s" % (b["frames"], b["count"])
+                        for b in results_dict["av_delay_histogram_frames"]
+                    )
+                )
             if results_dict["av_delay_accel"] not in [0, NAN]:
                 self.write_logfile(
                     "Warning, %s ms/s drift detected" % results_dict["av_delay_accel"]
                 )
+            if results_dict["av_delay_drift_ms_per_s"] != NAN:
+                self.write_logfile(
+                    "Delay drift is %s ms/s (95%% confidence interval: %s to %s) over %s segment(s)"
+                    % (
+                        results_dict["av_delay_drift_ms_per_s"],
+                        results_dict["av_delay_drift_ci95"][0],
+                        results_dict["av_delay_drift_ci95"][1],
+                        len(results_dict["drift_segments"]),
+                    )
+                )
         self.write_logfile(
             "Video duration is %ss (%s)"
             % (
@@ -472,17 +752,17 @@ class QrLipsyncAnalyzer:
                     self.get_timecode_from_seconds(self.audio_duration_s),
                 )
             )
-            if len(self.all_qrcodes_with_freq) == 0:
+            if self.qrcodes_with_freq_count == 0:
                 self.write_logfile("Found no qrcodes with freq, cannot measure lipsync")
             else:
                 self.write_logfile(
                     "Missed %s beeps out of %s qrcodes (%i%%)"
                     % (
                         self.missing_beeps_count,
-                        len(self.all_qrcodes_with_freq),
+                        self.qrcodes_with_freq_count,
                         100
                         * self.missing_beeps_count
-                        / len(self.all_qrcodes_with_freq),
+                        / self.qrcodes_with_freq_count,
                     )
                 )
         else:
@@ -490,9 +770,12 @@ class QrLipsyncAnalyzer:
         self.write_logfile(
             "---------------------------------------------------------------------"
         )
+        peak_rss_mb = get_peak_rss_mb()
+        logger.info("Peak memory usage: %s MB" % peak_rss_mb)
         if not self.options.no_report_files:
             with open(self._result_file, "w") as f:
-                json.dump(results_dict, f)
+                json.dump(dict(results_dict, peak_rss_mb=peak_rss_mb), f)
             logger.info("Wrote results as JSON into %s" % self._result_file)
+            self.write_series()
         self.close_files()
         return self.get_exit_code(results_dict)
@@ -0,0 +1,93 @@
+import copy
+import time
+import logging
+
+from gi.repository import GLib
+from qrlipsync.detect import QrLipsyncDetector, get_result_file
+from qrlipsync.discover import discover_options
+from qrlipsync.processes import get_process_pool
+from qrlipsync.summary import SUMMARY_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+def init_worker(verbosity):
+    # gstreamer is initialized once per worker when importing the detector,
+    # each worker then processes files until the pool is closed
+    logging.basicConfig(
+        format="%(asctime)s %(process)d %(name)s %(levelname)s %(message)s",
+        level=logging.DEBUG if verbosity else logging.INFO,
+    )
+
+
+def process_file(media_file, options):
+    result = dict.fromkeys(SUMMARY_FIELDS)
+    result["media_file"] = media_file
+    begin = time.monotonic()
+    try:
+        result_file = get_result_file(media_file, options)
+        result["result_file"] = result_file
+        if options.discover_area:
+            options = discover_options(media_file, options)
+            result["area"] = options.area
+            result["downscale_width"] = options.downscale_width
+        mainloop = GLib.MainLoop()
+        d = QrLipsyncDetector(media_file, result_file, options, mainloop)
+        GLib.idle_add(d.start)
+        mainloop.run()
+        if options.skip_results:
+            result["exit_code"] = 0
+        elif d.analyze_returncode is None:
+            result["exit_code"] = 1
+            result["error"] = "no qrcode named %s found" % options.qrcode_name
+        else:
+            result.update(d.analyzer.get_results_dict())
+            result["exit_code"] = d.analyze_returncode
+    except (Exception, SystemExit) as e:
+        # e.g. media files that cannot be discovered exit
+        logger.error("Failed to process %s: %s" % (media_file, e))
+        result["exit_code"] = 1
+        result["error"] = str(e)
+    result["processing_duration"] = round(time.monotonic() - begin, 3)
+    return result
+
+
+def process_file_args(args):
+    return process_file(*args)
+
+
+def run_batch(media_files, options):
+    """
+        Detect and analyze media_files with a pool of options.workers processes,
+        write the per file reports next to each file as usual and an aggregated
+        summary; return the summary
+    """
+    file_options = copy.copy(options)
+    file_options.incremental = False
+    file_options.preview = False
+    file_options.monitor_interval = 0
+
+    begin = time.monotonic()
+    results = dict()
+    with get_process_pool(options.workers, initializer=init_worker, initargs=(options.verbosity,)) as pool:
+        args = [(media_file, file_options) for media_file in media_files]
+        for result in pool.imap_unordered(process_file_args, args):
+            results[result["media_file"]] = result
+            logger.info(
+                "%s/%s done: %s (exit code %s)"
+                % (len(results), len(media_files), result["media_file"], result["exit_code"])
+            )
+    duration = time.monotonic() - begin
+
+    summary = {
+        "total_files": len(media_files),
+        "failed_files": sum(1 for result in results.values() if result["exit_code"]),
+        "duration": round(duration, 3),
+        "files_per_minute": round(60 * len(media_files) / duration, 2) if duration else 0,
+        "files": [results[media_file] for media_file in media_files],
+    }
+    logger.info(
+        "Processed %s files in %.1fs (%s files/min), %s failed"
+        % (summary["total_files"], duration, summary["files_per_minute"], summary["failed_files"])
+    )
+    return summary
@@ -0,0 +1,154 @@
+import os
+import fractions
+
+import numpy as np
+
+# Compact alternative to the one-json-object-per-line data file: a header
+# followed by fixed-size little endian records that can be loaded with
+# np.fromfile without any per-record parsing
+
+MAGIC = b"QRLIPSYN"
+VERSION = 1
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("version", "<u4"),
+    ("record_size", "<u4"),
+])
+
+KIND_QRCODE = 1
+KIND_BEEP = 2
+KIND_DURATION = 3
+
+RECORD_DTYPE = np.dtype([
+    ("kind", "u1"),
+    # qrcode name, up to 15 bytes
+    ("name", "S15"),
+    # running time in ns (VIDEOTIMESTAMP for qrcodes, TIMESTAMP for beeps,
+    # audio duration for durations)
+    ("timestamp", "<f8"),
+    # timestamp written in the qrcode (video duration for durations)
+    ("qrcode_timestamp", "<i8"),
+    ("frame_number", "<i8"),
+    ("peak", "<f8"),
+    # TICKFREQ for qrcodes (-1 if none), FREQ for beeps
+    ("freq", "<i4"),
+    ("framerate_num", "<i4"),
+    ("framerate_denom", "<i4"),
+])
+
+CUSTOM_DATA_NAME = "TICKFREQ"
+
+
+def get_header():
+    return np.array((MAGIC, VERSION, RECORD_DTYPE.itemsize), dtype=HEADER_DTYPE).tobytes()
+
+
+def is_binary_file(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def pack_record(record):
+    # record is a detector record, as written in the json data file
+    name = record.get("ELEMENTNAME")
+    if name == "qrcode_detector":
+        framerate = fractions.Fraction(record["FRAMERATE"])
+        beep_freq = record.get(CUSTOM_DATA_NAME)
+        qrcode_name = record["NAME"].encode()
+        if len(qrcode_name) > RECORD_DTYPE["name"].itemsize:
+            # numpy would silently truncate it
+            raise ValueError(
+                "qrcode name %s is longer than the %s bytes of binary data files"
+                % (record["NAME"], RECORD_DTYPE["name"].itemsize)
+            )
+        values = (
+            KIND_QRCODE,
+            qrcode_name,
+            record["VIDEOTIMESTAMP"],
+            record["TIMESTAMP"],
+            record["BUFFERCOUNT"],
+            0,
+            int(beep_freq) if beep_freq else -1,
+            framerate.numerator,
+            framerate.denominator,
+        )
+    elif name == "spectrum":
+        values = (KIND_BEEP, b"", record["TIMESTAMP"], 0, 0, record["PEAK"], record["FREQ"], 0, 0)
+    else:
+        values = (
+            KIND_DURATION,
+            b"",
+            record.get("AUDIODURATION", 0),
+            record.get("VIDEODURATION", 0),
+            0,
+            0,
+            0,
+            0,
+            0,
+        )
+    return np.array(values, dtype=RECORD_DTYPE).tobytes()
+
+
+def unpack_record(record):
+    # return the detector record corresponding to a RECORD_DTYPE item
+    kind = int(record["kind"])
+    if kind == KIND_QRCODE:
+        result = {
+            "TIMESTAMP": int(record["qrcode_timestamp"]),
+            "BUFFERCOUNT": int(record["frame_number"]),
+            "FRAMERATE": "%s/%s" % (record["framerate_num"], record["framerate_denom"]),
+            "NAME": record["name"].decode(),
+            "ELEMENTNAME": "qrcode_detector",
+            "VIDEOTIMESTAMP": int(record["timestamp"]),
+        }
+        if record["freq"] >= 0:
+            result[CUSTOM_DATA_NAME] = str(record["freq"])
+        return result
+    elif kind == KIND_BEEP:
+        return {
+            "ELEMENTNAME": "spectrum",
+            "TIMESTAMP": float(record["timestamp"]),
+            "PEAK": float(record["peak"]),
+            "FREQ": int(record["freq"]),
+        }
+    return {
+        "AUDIODURATION": float(record["timestamp"]),
+        "VIDEODURATION": int(record["qrcode_timestamp"]),
+    }
+
+
+def check_header(path):
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if not len(header) or header[0]["magic"] != MAGIC:
+        raise ValueError("%s is not a qr-lipsync binary data file" % path)
+    if header[0]["version"] != VERSION or header[0]["record_size"] != RECORD_DTYPE.itemsize:
+        raise ValueError(
+            "Unsupported binary data file version %s (record size %s)"
+            % (header[0]["version"], header[0]["record_size"])
+        )
+
+
+def get_records_count(path):
+    # ignore a truncated last record (e.g. if the detector was killed)
+    return (os.path.getsize(path) - HEADER_DTYPE.itemsize) // RECORD_DTYPE.itemsize
+
+
+def read_records(path):
+    check_header(path)
+    return np.fromfile(path, dtype=RECORD_DTYPE, count=get_records_count(path), offset=HEADER_DTYPE.itemsize)
+
+
+def iter_records(path, chunk_size=65536):
+    # same as read_records, by arrays of up to chunk_size records so that
+    # memory does not depend on the file size
+    check_header(path)
+    remaining = get_records_count(path)
+    with open(path, "rb") as f:
+        f.seek(HEADER_DTYPE.itemsize)
+        while remaining > 0:
+            records = np.fromfile(f, dtype=RECORD_DTYPE, count=min(chunk_size, remaining))
+            if not len(records):
+                break
+            remaining -= len(records)
+            yield records
@@ -0,0 +1,79 @@
+import numpy as np
+
+CHUNK_SIZE = 65536
+
+
+class ColumnStore:
+    """
+        Append-only table of numeric records stored as one numpy array per column;
+        rows are written into fixed-size chunks so that growing never copies
+        what has already been stored
+    """
+
+    def __init__(self, columns, chunk_size=CHUNK_SIZE):
+        self.dtypes = dict(columns)
+        self.names = list(self.dtypes)
+        self.chunk_size = chunk_size
+        self._chunks = {name: list() for name in self.names}
+        self._current = None
+        self._fill = 0
+        self._length = 0
+        self._cache = dict()
+
+    def __len__(self):
+        return self._length
+
+    def _new_chunk(self):
+        self._current = {
+            name: np.empty(self.chunk_size, dtype=dtype)
+            for name, dtype in self.dtypes.items()
+        }
+        for name in self.names:
+            self._chunks[name].append(self._current[name])
+        self._fill = 0
+
+    def append(self, *values):
+        # values are given in column order
+        if self._current is None or self._fill == self.chunk_size:
+            self._new_chunk()
+        for name, value in zip(self.names, values):
+            self._current[name][self._fill] = value
+        self._fill += 1
+        self._length += 1
+        self._cache.clear()
+
+    def extend(self, **arrays):
+        # append whole columns at once, e.g. when loading from a binary file
+        lengths = {len(arrays[name]) for name in self.names}
+        if len(lengths) != 1:
+            raise ValueError("All columns must have the same length")
+        length = lengths.pop()
+        if not length:
+            return
+        self._seal()
+        for name, dtype in self.dtypes.items():
+            self._chunks[name].append(np.asarray(arrays[name], dtype=dtype))
+        self._length += length
+        self._cache.clear()
+
+    def _seal(self):
+        # trim the partially filled chunk so that the next rows start a new one
+        if self._current is not None:
+            for name in self.names:
+                self._chunks[name][-1] = self._current[name][:self._fill]
+            self._current = None
+            self._fill = 0
+
+    def column(self, name):
+        array = self._cache.get(name)
+        if array is None:
+            self._seal()
+            chunks = self._chunks[name]
+            if chunks:
+                array = np.concatenate(chunks)
+            else:
+                array = np.empty(0, dtype=self.dtypes[name])
+            # keep a single chunk so that the concatenated copy is not duplicated
+            self._chunks[name] = [array]
+            self._cache[name] = array
+        return array
@@ -1,29 +1,66 @@
 import os
+import re
 import sys
 import time
+import argparse
 import subprocess
 import logging
 import json
+import threading
 from fractions import Fraction
 
 import gi
+import numpy as np
 
 gi.require_version("Gst", "1.0")
 gi.require_version("GstPbutils", "1.0")
 # We don't want to use hw accel since it seems to be messing with latency
 os.environ["LIBVA_DRIVER_NAME"] = "fakedriver"
+from gi.repository import GLib  # noqa
 from gi.repository import Gst  # noqa
 from gi.repository import GstPbutils  # noqa
+from qrlipsync import binary  # noqa
+from qrlipsync.analyze import NAN, QrLipsyncAnalyzer, get_peak_rss_mb  # noqa
+from qrlipsync.flush import FlushPolicy  # noqa
+from qrlipsync.incremental import QrLipsyncIncrementalAnalyzer  # noqa
+from qrlipsync.instrumentation import StageStats  # noqa
+from qrlipsync.results import ResultsQueue  # noqa
+from qrlipsync.roi import AdaptiveRoi, FULL_AREA  # noqa
+from qrlipsync.segments import get_stats_file, in_segment  # noqa
+from qrlipsync.ticks import GoertzelTickDetector, TickDetector, TICK_FREQUENCIES  # noqa
 
 Gst.init(None)
 
 logger = logging.getLogger(__name__)
 
 QUEUE_OPTS = "max-size-buffers=10 max-size-bytes=0 max-size-time=0"
+# extra media (in s) decoded around segments so that frames and ticks
+# straddling their boundaries are analyzed entirely
+SEGMENT_MARGIN_S = 1
+# with --adaptive-roi, scans the frames where no qrcode was found in the roi
+FULL_AREA_DETECTOR = "qrcode_detector_full"
+# formats only holding the luma plane, by preference (Y800 is the same
+# layout under its fourcc name)
+LUMA_FORMATS = ("GRAY8", "Y800")
+# stages timed with --stats, by element factory (decoders are found by klass)
+STAGE_ELEMENTS = {
+    "videobox": "crop",
+    "videoscale": "scale_convert",
+    "videoconvert": "scale_convert",
+    "videoconvertscale": "scale_convert",
+    "audioconvert": "audio_convert",
+    "zbar": "zbar",
+    "spectrum": "spectrum",
+}
+# interval (in ms) at which queue fill levels are sampled with --stats
+QUEUE_SAMPLE_INTERVAL_MS = 100
 
 
 def get_media_info(media_file):
-    uri = Gst.filename_to_uri(os.path.realpath(media_file))
+    if '://' in media_file:
+        uri = media_file
+    else:
+        uri = Gst.filename_to_uri(os.path.realpath(media_file))
     try:
         info = GstPbutils.Discoverer.new(10 * Gst.SECOND).discover_uri(uri)
     except gi.repository.GLib.Error as e:
@@ -57,17 +94,87 @@ def get_media_info(media_file):
     return result
 
 
+def get_luma_scale_elements():
+    # only the luma plane is scaled, in a single step if possible
+    if Gst.ElementFactory.find("videoconvertscale"):
+        return ["videoconvertscale"]
+    return ["videoconvert", "videoscale"]
+
+
+def get_luma_format():
+    # zbar only scans the luma plane, use a format that only has this one if
+    # the installed zbar and scaling elements all accept it, as their pads tell
+    elements = [Gst.ElementFactory.make(name) for name in ["zbar"] + get_luma_scale_elements()]
+    if None in elements:
+        return
+    pads_caps = [
+        element.get_static_pad(name).query_caps(None)
+        for element in elements
+        for name in ("sink", "src")
+        if element.get_static_pad(name)
+    ]
+    for video_format in LUMA_FORMATS:
+        caps = Gst.Caps.from_string("video/x-raw, format=(string)%s" % video_format)
+        if all(pad_caps.can_intersect(caps) for pad_caps in pads_caps):
+            return video_format
+
+
+def get_result_file(media_file, options):
+    if '://' in media_file:
+        # e.g. udp://127.0.0.1:5000 gives udp_127_0_0_1_5000_data.txt
+        dirname = ""
+        media_prefix = re.sub(r"\W+", "_", media_file)
+    else:
+        dirname = os.path.dirname(media_file)
+        media_prefix = os.path.splitext(os.path.basename(media_file))[0]
+    extension = "bin" if options.binary else "txt"
+    return os.path.join(dirname, "%s_data.%s" % (media_prefix, extension))
+
+
+def get_analyzer_options(options):
+    return argparse.Namespace(
+        qrcode_name=options.qrcode_name,
+        custom_data_name=options.custom_data_name,
+        desync_threshold_frames=options.desync_threshold_frames,
+        expected_beep_duration=options.expected_beep_duration,
+        no_report_files=False,
+        windows=options.windows,
+        windows_npz=options.windows_npz,
+    )
+
+
+def run_analyzer(result_file, options):
+    # same as running qr-lipsync-analyze on result_file, in this process
+    if options.bounded_memory:
+        analyzer = QrLipsyncIncrementalAnalyzer(result_file, get_analyzer_options(options))
+    else:
+        analyzer = QrLipsyncAnalyzer(result_file, get_analyzer_options(options))
+    if analyzer.start():
+        return analyzer.show_summary_and_exit()
+    return 0
+
+
 class QrLipsyncDetector:
-    def __init__(self, media_file, result_file, options, mainloop):
+    def __init__(self, media_file, result_file, options, mainloop, segment=None):
         self.analyze_returncode = None
         self.options = options
+        # (start, stop) in s of the part of the media to analyze, None meaning
+        # from the beginning or until the end
+        self.segment = segment
+        # running time restarts from 0 when seeking to the segment
+        self._time_offset = 0
         self.media_info = get_media_info(media_file)
         self._samplerate = int(self.media_info.get("sample_rate", 0))
         self._media_duration = float(self.media_info["duration"])
         self.mainloop = mainloop
         self._media_file = media_file
         self._result_filename = result_file
-        self._result_file = open(result_file, "w")
+        self._result_file = self.open_result_file()
+        # time spent writing and flushing the result file
+        self.io_duration = 0
+        # records that do not fit in binary data files
+        self.dropped_records = 0
+        self._flush_policy = FlushPolicy(options.flush_records, options.flush_interval_ms)
         self._bands_count = 1024
         self.last_freq = 0
         self._first_tick_timestamp = -1
@@ -106,14 +213,46 @@ class QrLipsyncDetector:
             if self.media_info.get("a_codec") == "aac"
             else 0
         )
-        # spectrum works on averaging over a 3ms interval, which adds latency
-        self._encoder_latency += self.spectrum_interval_ns
+        if self.options.audio_detector == "spectrum":
+            # spectrum works on averaging over a 3ms interval, which adds latency
+            self._encoder_latency += self.spectrum_interval_ns
 
         self._start_time = 0
         self._end_time = 0
         self._json_length = 70
         self._threshold_db = self.options.audio_threshold
         self._min_freq = 200
+        if self._samplerate:
+            # ignore lowest frequencies
+            self._ignore_n_lowest_bands = int(
+                self._min_freq / (self._samplerate / self._bands_count)
+            )
+            self._ignored_magnitudes = [-60] * self._ignore_n_lowest_bands
+            # self._samplerate / 2 is the nyquist frequency
+            band_width = (self._samplerate / 2) / self._bands_count
+            # frequency is the middle of the band with the maximum magnitude
+            self._band_freqs = [
+                int(((i + 1) * band_width - i * band_width) / 2 + i * band_width)
+                for i in range(self._bands_count)
+            ]
+
+        self.tick_detector = None
+        # numpy based detectors report ticks lasting at least half a frame
+        if self._samplerate and self.options.audio_detector == "fft":
+            self.tick_detector = TickDetector(
+                self._samplerate,
+                self._threshold_db,
+                self._min_freq,
+                frame_dur_ms / 2,
+            )
+        elif self._samplerate and self.options.audio_detector == "goertzel":
+            self.tick_detector = GoertzelTickDetector(
+                self._samplerate,
+                TICK_FREQUENCIES,
+                self._threshold_db,
+                self._min_freq,
+                frame_dur_ms / 2,
+            )
         self._audio_duration = 0
         self._video_duration = 0
 
@@ -123,79 +262,326 @@ class QrLipsyncDetector:
         self._id_prob_video_sink = None
 
         self.size = 0
+        # records may be added from streaming threads (--sync-spectrum, fft and
+        # goertzel detectors) and from the --sync-results thread; the result
+        # file and the monitor are only swapped or closed with it held
+        self._records_lock = threading.Lock()
+
+        self._video_format = "I420"
+        if self.options.luma:
+            self._video_format = get_luma_format() or "I420"
+            if self._video_format == "I420":
+                logger.warning("This zbar element does not accept %s, scanning I420 frames" % " or ".join(LUMA_FORMATS))
+            else:
+                logger.info("Scanning %s frames" % self._video_format)
+
+        self.roi = None
+        if self.options.adaptive_roi:
+            self.roi = AdaptiveRoi(self.get_area())
+            if self.options.preview:
+                logger.warning("Preview is not available with --adaptive-roi")
+        # whether the roi detector found a qrcode in the frame it is scanning
+        self._roi_hit = False
+        self.roi_frames_count = 0
+        self.full_area_frames_count = 0
+
+        # messages posted on the bus and not handled by the main loop yet
+        self._bus_depth_lock = threading.Lock()
+        self._bus_depth = 0
+        self.peak_bus_depth = 0
+        # results about the preroll frame of a segment are dropped, it is
+        # decoded again once seeked
+        self._seeked = segment is None
+        self._results = None
+        if self.options.sync_results or self.options.bounded_memory:
+            # detection results are taken from the streaming threads into a
+            # bounded queue, which blocks them when full instead of letting
+            # the bus queue grow
+            self._results = ResultsQueue(self._handle_result, self.options.results_queue_size)
+
+        self.stats = None
+        if self.options.stats or self.options.stats_interval:
+            self.stats = StageStats()
+            # segments of a parallel run each have their own stats
+            if segment:
+                self._stats_file = get_stats_file(result_file)
+            else:
+                self._stats_file = "%s.stats.json" % os.path.splitext(result_file)[0]
+            self._instrumented_elements = set()
+            self._stats_queues = list()
 
         self._uri_media_file = self._media_file
         if '://' not in self._uri_media_file:
             self._uri_media_file = Gst.filename_to_uri(self._media_file)
         self.pipeline_str = self.get_pipeline(self._uri_media_file)
         self.pipeline = Gst.parse_launch(self.pipeline_str)
+        self.pipeline.connect("deep-element-added", self._on_element_added)
+        self.pipeline.get_bus().set_sync_handler(self._on_sync_message)
+
+        self.analyzer = None
+        self.monitor = None
+        self._monitor_start = 0
+        if self.options.monitor_interval:
+            # the whole run is analyzed on the fly, and each window separately;
+            # totals are only reported into the monitor report, report files
+            # would grow for as long as the source runs
+            options = self.get_analyzer_options()
+            options.no_report_files = True
+            self.analyzer = QrLipsyncIncrementalAnalyzer(result_file, options)
+            self.analyzer.open_files()
+            self.monitor = self.analyzer.new_window()
+            self._monitor_report_file = "%s.monitor.json" % os.path.splitext(result_file)[0]
+        elif (self.options.incremental or self.options.bounded_memory) and not self.options.skip_results:
+            self.analyzer = QrLipsyncIncrementalAnalyzer(result_file, self.get_analyzer_options())
+            self.analyzer.open_files()
+        elif not self.options.skip_results:
+            # records are kept in memory by the analyzer as they are written,
+            # instead of reading the data file back at the end
+            self.analyzer = QrLipsyncAnalyzer(result_file, self.get_analyzer_options())
+            self.analyzer.open_files()
+
+    def get_analyzer_options(self):
+        return get_analyzer_options(self.options)
 
     def exit(self):
         self.pipeline.set_state(Gst.State.NULL)
+        self.stop_handling_results()
+        # make sure that buffered records are written, e.g. on Ctrl+C
+        self.close_result_file()
         self.mainloop.quit()
 
+    def stop(self):
+        logger.info("Stopping after %ss of monitoring" % self.options.monitor_duration)
+        self.pipeline.send_event(Gst.Event.new_eos())
+        return False
+
+    def _on_monitor_interval(self):
+        monitor_end = self._video_duration / Gst.SECOND
+        # records may be added by streaming threads meanwhile
+        with self._records_lock:
+            window = self.monitor.snapshot()
+            report = {
+                "window_start": round(self._monitor_start, 3),
+                "window_end": round(monitor_end, 3),
+                "window": window,
+                "total": self.analyzer.snapshot(),
+            }
+            self.monitor = self.monitor.new_window()
+            self.rotate_result_file()
+        self._monitor_start = monitor_end
+        # drift since the last change detected
+        segments = report["total"]["drift_segments"]
+        drift = segments[-1] if segments else {"drift_ms_per_s": NAN, "drift_ci95": None}
+        logger.info(
+            "Monitoring %s-%ss: median delay %s ms, %s dropped and %s duplicated frames, %s missed beeps, drift %s ms/s (95%% confidence interval: %s)"
+            % (
+                report["window_start"],
+                report["window_end"],
+                window["median_av_delay_ms"],
+                window["dropped_frames"],
+                window["duplicated_frames"],
+                window["matching_missing"],
+                drift["drift_ms_per_s"],
+                drift["drift_ci95"],
+            )
+        )
+        low, high = drift["drift_ci95"] or (0, 0)
+        # significant, and as large as what the final report considers a drift
+        if (low > 0 or high < 0) and abs(drift["drift_ms_per_s"]) >= 1:
+            logger.warning("Audio and video are drifting by %s ms/s" % drift["drift_ms_per_s"])
+        with open(self._monitor_report_file, "w") as f:
+            json.dump(report, f)
+        return True
+
+    def rotate_result_file(self):
+        # only keep the current and previous windows on disk; called with
+        # _records_lock held
+        self._result_file.close()
+        os.replace(self._result_filename, "%s.1" % self._result_filename)
+        self._result_file = self.open_result_file()
+
+    def close_result_file(self):
+        # records added afterwards (e.g. by streaming threads still running
+        # on errors) are dropped instead of written into a closed file
+        with self._records_lock:
+            self._result_file.close()
+
+    def open_result_file(self):
+        if self.options.binary:
+            result_file = open(self._result_filename, "wb")
+            result_file.write(binary.get_header())
+            return result_file
+        return open(self._result_filename, "w")
+
+    def get_area(self):
+        # --area as (x1, y1, x2, y2) percents
+        if not self.options.area:
+            return FULL_AREA
+        coords = [x1, y1, x2, y2] = [int(i) for i in self.options.area.split(":")]
+        if not x1 < x2 or not y1 < y2:
+            raise ValueError(
+                "Invalid coordinates in %s, values are x1:y1:x2:y2 from the top left corner, x1 must be smaller than x2, y1 must be smaller than y2"
+            )
+        for c in coords:
+            if not 0 <= c <= 100:
+                raise ValueError(
+                    "Invalid coordinates in %s, values have to be percents between 0 and 100"
+                    % self.options.area
+                )
+        return tuple(coords)
+
+    def get_decoded_size(self):
+        # software decoders downscale by 2 ** lowres while decoding
+        lowres = self.options.decoder_lowres
+        return (
+            -(-self.media_info["width"] >> lowres),
+            -(-self.media_info["height"] >> lowres),
+        )
+
+    def get_videobox_borders(self, area):
+        # pixels to crop on each side of decoded frames to keep area
+        x1, y1, x2, y2 = area
+        video_width, video_height = self.get_decoded_size()
+        return {
+            "left": int(video_width * x1 / 100),
+            "right": int(video_width * (100 - x2) / 100),
+            "top": int(video_height * y1 / 100),
+            "bottom": int(video_height * (100 - y2) / 100),
+        }
+
+    def get_cropped_size(self, area):
+        borders = self.get_videobox_borders(area)
+        video_width, video_height = self.get_decoded_size()
+        return (
+            video_width - borders["left"] - borders["right"],
+            video_height - borders["top"] - borders["bottom"],
+        )
+
+    def get_downscale_caps(self, video_width, video_height):
+        ratio = float(video_width) / float(video_height)
+        downscale_width = self.options.downscale_width
+        downscale_height = int(float(downscale_width) / float(ratio))
+        return (
+            "video/x-raw, format=(string)%s, width=(int)%s, height=(int)%s"
+            % (self._video_format, downscale_width, downscale_height)
+        )
+
+    def get_roi_caps(self, roi):
+        # the region of interest is scaled as much as the whole area would be
+        # with --downscale-width, so that zbar has fewer pixels to scan
+        width, height = self.get_cropped_size(roi)
+        if self.options.downscale_width > 0:
+            scale = self.options.downscale_width / self.get_cropped_size(self.get_area())[0]
+            width = max(16, 2 * round(width * scale / 2))
+            height = max(16, 2 * round(height * scale / 2))
+        return (
+            "video/x-raw, format=(string)%s, width=(int)%s, height=(int)%s"
+            % (self._video_format, width, height)
+        )
+
+    def get_scale_elements(self):
+        if self._video_format == "I420":
+            return "videoscale ! videoconvert"
+        return " ! ".join(get_luma_scale_elements())
+
+    def set_roi(self, roi):
+        for side, value in self.get_videobox_borders(roi).items():
+            self._roi_box.set_property(side, value)
+        self._roi_caps.set_property("caps", Gst.Caps.from_string(self.get_roi_caps(roi)))
+
     def get_pipeline(self, media_file):
         pipeline = f'uridecodebin uri={media_file} name=dec buffer-duration=5000000000'
+        if self.roi:
+            pipeline += self.get_adaptive_video_pipeline()
+        else:
+            pipeline += self.get_video_pipeline()
+        if self._samplerate and self.tick_detector:
+            # raw mono samples are analyzed by batches in the appsink streaming thread
+            pipeline += (
+                " dec. ! queue %s name=audioconvq ! audioconvert ! audio/x-raw, format=(string)F32LE, channels=(int)1, layout=(string)interleaved ! appsink name=asink sync=false emit-signals=true"
+                % QUEUE_OPTS
+            )
+        elif self._samplerate:
+            pipeline += (
+                " dec. ! queue %s name=audioconvq ! audioconvert ! queue %s name=spectrumq ! spectrum bands=%s name=spectrum interval=%s ! fakesink silent=false name=asink"
+                % (QUEUE_OPTS, QUEUE_OPTS, self._bands_count, self.spectrum_interval_ns)
+            )
+        return pipeline
+
+    def get_video_pipeline(self):
+        pipeline = ""
         video_width, video_height = self.media_info["width"], self.media_info["height"]
         if self.options.area:
-            coords = [x1, y1, x2, y2] = [int(i) for i in self.options.area.split(":")]
-            if not x1 < x2 or not y1 < y2:
-                raise ValueError(
-                    "Invalid coordinates in %s, values are x1:y1:x2:y2 from the top left corner, x1 must be smaller than x2, y1 must be smaller than y2"
-                )
-            for c in coords:
-                if not 0 <= c <= 100:
-                    raise ValueError(
-                        "Invalid coordinates in %s, values have to be percents between 0 and 100"
-                        % self.options.area
-                    )
-            left = int(video_width * x1 / 100)
-            right = int(video_width * (100 - x2) / 100)
-            top = int(video_height * y1 / 100)
-            bottom = int(video_height * (100 - y2) / 100)
+            borders = self.get_videobox_borders(self.get_area())
             pipeline += (
                 " ! queue %s name=vbox ! videobox left=%s right=%s top=%s bottom=%s"
-                % (QUEUE_OPTS, left, right, top, bottom)
+                % (QUEUE_OPTS, borders["left"], borders["right"], borders["top"], borders["bottom"])
             )
+            video_width, video_height = self.get_cropped_size(self.get_area())
 
-            video_width = video_width - left - right
-            video_height = video_height - top - bottom
-
-        if self.options.downscale_width > 0:
-            ratio = float(video_width) / float(video_height)
-            downscale_width = self.options.downscale_width
-            downscale_height = int(float(downscale_width) / float(ratio))
-            video_downscale_caps = (
-                "video/x-raw, format=(string)I420, width=(int)%s, height=(int)%s"
-                % (downscale_width, downscale_height)
+        if self.options.downscale_width > 0 and self._video_format != "I420":
+            pipeline += (
+                " ! queue %s name=scaleq ! %s ! %s"
+                % (QUEUE_OPTS, self.get_scale_elements(), self.get_downscale_caps(video_width, video_height))
             )
+        elif self.options.downscale_width > 0:
             pipeline += (
                 " ! queue %s name=scaleq ! videoscale ! queue %s name=vconvq ! videoconvert ! %s"
-                % (QUEUE_OPTS, QUEUE_OPTS, video_downscale_caps)
+                % (QUEUE_OPTS, QUEUE_OPTS, self.get_downscale_caps(video_width, video_height))
             )
 
         if self.options.preview:
             pipeline += (
                 " ! tee name=tee ! queue ! fpsdisplaysink sync=false tee. ! queue"
             )
-        pipeline += " ! zbar name=qrcode_detector ! progressreport update-freq=1 ! fakesink silent=false name=vfakesink"
-        if self._samplerate:
+        pipeline += " ! zbar name=qrcode_detector"
+        if not self.options.monitor_interval:
+            # monitoring reports progress by itself
+            pipeline += " ! progressreport update-freq=1"
+        pipeline += " ! fakesink silent=false name=vfakesink"
+        return pipeline
+
+    def get_adaptive_video_pipeline(self):
+        # frames are scanned within the region of interest first, without any
+        # queue so that the tee then pushes the same frame to the whole area
+        # detector, whose valve only lets it through if no qrcode was found
+        area = self.get_area()
+        borders = self.get_videobox_borders(area)
+        pipeline = " ! queue %s name=vteeq ! tee name=vtee" % QUEUE_OPTS
+        pipeline += (
+            " vtee. ! videobox name=roibox left=%s right=%s top=%s bottom=%s ! %s ! capsfilter name=roicaps caps=\"%s\" ! zbar name=qrcode_detector"
+            % (borders["left"], borders["right"], borders["top"], borders["bottom"], self.get_scale_elements(), self.get_roi_caps(area))
+        )
+        if not self.options.monitor_interval:
+            pipeline += " ! progressreport update-freq=1"
+        pipeline += " ! fakesink silent=false name=vfakesink"
+
+        pipeline += " vtee. ! valve name=fullvalve drop=true"
+        if self.options.area:
             pipeline += (
-                " dec. ! queue %s name=audioconvq ! audioconvert ! queue %s name=spectrumq ! spectrum bands=%s name=spectrum interval=%s ! fakesink silent=false name=afakesink"
-                % (QUEUE_OPTS, QUEUE_OPTS, self._bands_count, self.spectrum_interval_ns)
+                " ! videobox left=%s right=%s top=%s bottom=%s"
+                % (borders["left"], borders["right"], borders["top"], borders["bottom"])
             )
+        if self.options.downscale_width > 0:
+            pipeline += " ! %s ! %s" % (self.get_scale_elements(), self.get_downscale_caps(*self.get_cropped_size(area)))
+        # never gets buffers as long as qrcodes are found in the region of interest
+        pipeline += " ! zbar name=%s ! fakesink async=false sync=false" % FULL_AREA_DETECTOR
         return pipeline
 
     def start(self):
         if not hasattr(self, "pipeline"):
             logger.error("Pipeline could not be parsed, exiting")
             self.exit()
+        if self.segment:
+            self.seek_segment()
         if self._samplerate:
-            audio_fakesink = self.pipeline.get_by_name("afakesink")
+            audio_fakesink = self.pipeline.get_by_name("asink")
             self._audio_fakesink_pad = audio_fakesink.get_static_pad("sink")
             self._id_prob_audio_sink = self._audio_fakesink_pad.add_probe(
                 Gst.PadProbeType.BUFFER, self.on_audio_fakesink_buffer, None
             )
+            if self.tick_detector:
+                audio_fakesink.connect("new-sample", self._on_audio_sample)
         video_fakesink = self.pipeline.get_by_name("vfakesink")
         self._video_src_pad = video_fakesink.get_static_pad("sink")
         self._id_prob_video_sink = self._video_src_pad.add_probe(
@@ -206,10 +592,150 @@ class QrLipsyncDetector:
         bus.add_signal_watch()
         bus.connect("message::eos", self._on_eos)
         bus.connect("message", self._on_message)
+        if self.roi:
+            self._roi_box = self.pipeline.get_by_name("roibox")
+            self._roi_caps = self.pipeline.get_by_name("roicaps")
+            self._full_area_valve = self.pipeline.get_by_name("fullvalve")
+            roi_detector_pad = self.pipeline.get_by_name("qrcode_detector").get_static_pad("src")
+            roi_detector_pad.add_probe(Gst.PadProbeType.BUFFER, self._on_roi_scanned, None)
+        if self._results is not None:
+            self._results.start()
+        if self.stats:
+            for element in self.pipeline.iterate_recurse():
+                self.instrument_element(element)
+                factory = element.get_factory()
+                if factory and factory.get_name() == "queue":
+                    self._stats_queues.append(element)
+            GLib.timeout_add(QUEUE_SAMPLE_INTERVAL_MS, self._on_stats_sample)
+            if self.options.stats_interval:
+                GLib.timeout_add_seconds(self.options.stats_interval, self._on_stats_interval)
+        if self.options.monitor_interval:
+            GLib.timeout_add_seconds(self.options.monitor_interval, self._on_monitor_interval)
+            if self.options.monitor_duration:
+                GLib.timeout_add_seconds(self.options.monitor_duration, self.stop)
         self._start_time = time.time()
         logger.info("starting pipeline")
         self.pipeline.set_state(Gst.State.PLAYING)
 
+    def seek_segment(self):
+        start, stop = self.segment
+        self.pipeline.set_state(Gst.State.PAUSED)
+        self.pipeline.get_state(Gst.CLOCK_TIME_NONE)
+        # drop other messages about the preroll, detection results are not
+        # even queued until seeked
+        bus = self.pipeline.get_bus()
+        bus.set_flushing(True)
+        bus.set_flushing(False)
+        self._bus_depth = 0
+        seek_start = max(0, (start or 0) - SEGMENT_MARGIN_S)
+        self._time_offset = int(seek_start * Gst.SECOND)
+        if stop is None:
+            stop_type, seek_stop = Gst.SeekType.NONE, -1
+        else:
+            stop_type, seek_stop = Gst.SeekType.SET, int((stop + SEGMENT_MARGIN_S) * Gst.SECOND)
+        logger.info("Analyzing segment %s-%ss" % (start or 0, stop if stop is not None else self._media_duration))
+        if not self.pipeline.seek(
+            1.0,
+            Gst.Format.TIME,
+            Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE,
+            Gst.SeekType.SET,
+            self._time_offset,
+            stop_type,
+            seek_stop,
+        ):
+            logger.error("Could not seek to segment %s-%ss" % (start, stop))
+        if self._results is not None:
+            self._results.clear()
+        self._seeked = True
+
+    def get_decoder_properties(self):
+        properties = dict()
+        if self.options.decoder_threads is not None:
+            properties["max-threads"] = self.options.decoder_threads
+        if self.options.decoder_lowres:
+            properties["lowres"] = self.options.decoder_lowres
+        for option in self.options.decoder_option:
+            name, value = option.split("=", 1)
+            properties[name] = value
+        return properties
+
+    def _on_element_added(self, pipeline, sub_bin, element):
+        if self.stats:
+            self.instrument_element(element)
+        # set options of the software video decoder plugged by uridecodebin
+        factory = element.get_factory()
+        if not factory or not factory.get_name().startswith("avdec_") or "Video" not in factory.get_metadata("klass"):
+            return
+        for name, value in self.get_decoder_properties().items():
+            if element.find_property(name) is None:
+                logger.warning("%s has no %s property, ignoring it" % (factory.get_name(), name))
+            else:
+                logger.info("Setting %s=%s on %s" % (name, value, factory.get_name()))
+                Gst.util_set_object_arg(element, name, str(value))
+
+    def get_stage(self, element):
+        factory = element.get_factory()
+        if not factory:
+            return
+        klass = factory.get_metadata("klass") or ""
+        if "Decoder" in klass:
+            return "video_decode" if "Video" in klass else "audio_decode"
+        if element.get_name() == FULL_AREA_DETECTOR:
+            return "zbar_full_area"
+        return STAGE_ELEMENTS.get(factory.get_name())
+
+    def instrument_element(self, element):
+        # these elements push buffers downstream from the thread that pushed
+        # them in, so the time between a buffer entering the element and the
+        # next one leaving it is spent processing it
+        stage = self.get_stage(element)
+        path = element.get_path_string()
+        if stage is None or path in self._instrumented_elements:
+            return
+        self._instrumented_elements.add(path)
+        entered = [stage, 0]
+        for pad in element.sinkpads:
+            pad.add_probe(Gst.PadProbeType.BUFFER, self._on_stage_enter, entered)
+        for pad in element.srcpads:
+            pad.add_probe(Gst.PadProbeType.BUFFER, self._on_stage_leave, entered)
+
+    def _on_stage_enter(self, pad, info, entered):
+        entered[1] = time.monotonic()
+        return Gst.PadProbeReturn.OK
+
+    def _on_stage_leave(self, pad, info, entered):
+        if entered[1]:
+            self.stats.add_time(entered[0], time.monotonic() - entered[1])
+            entered[1] = 0
+        return Gst.PadProbeReturn.OK
+
+    def _on_stats_sample(self):
+        for element in self._stats_queues:
+            self.stats.add_queue_level(
+                element.get_name(),
+                element.get_property("current-level-buffers"),
+                element.get_property("max-size-buffers"),
+            )
+        return True
+
+    def _on_stats_interval(self):
+        logger.info("Stats: %s" % self.stats.get_summary())
+        return True
+
+    def write_stats(self, processing_duration, fps):
+        report = self.stats.get_report()
+        report.update({
+            "processing_duration_s": round(processing_duration, 3),
+            "fps": round(float(fps), 1),
+            "peak_bus_depth": self.peak_bus_depth,
+            "peak_rss_mb": get_peak_rss_mb(),
+        })
+        if self._results is not None:
+            report["peak_results_depth"] = self._results.peak_depth
+        with open(self._stats_file, "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info("Wrote stats into %s: %s" % (self._stats_file, self.stats.get_summary()))
+
     def on_audio_fakesink_buffer(self, pad, info, data):
         buf = info.get_buffer()
         self._audio_duration = buf.pts + buf.duration
@@ -224,10 +750,15 @@ class QrLipsyncDetector:
             else:
                 duration = 0
         segment = pad.get_sticky_event(Gst.EventType.SEGMENT, 0).parse_segment()
-        self._video_duration = segment.to_running_time(Gst.Format.TIME, buf.pts) + duration
+        self._video_duration = segment.to_running_time(Gst.Format.TIME, buf.pts) + duration + self._time_offset
         return True
 
     def _on_eos(self, bus, message):
+        # results queued before eos
+        self.stop_handling_results()
+        if self.tick_detector:
+            # analyze the last samples
+            self.add_ticks(self.tick_detector.flush())
         string = "found %s qrcodes (%s containing beep information)" % (
             self.qrcode_count,
             self.qrcode_with_beep_count,
@@ -235,41 +766,58 @@ class QrLipsyncDetector:
         if self._samplerate:
             string += " and %s beeps in audio" % self._tick_count
         logger.info(string)
+        if self.roi:
+            logger.info(
+                "Scanned %s frames in the region of interest, %s of them again in the whole area"
+                % (self.roi_frames_count, self.full_area_frames_count)
+            )
         # FIXME disconnect it before eos is applied in pipeline
         # self._disconnect_probes()
         self._end_time = time.time()
         processing_duration = self._end_time - self._start_time
-        fps = self.framerate * self._media_duration / processing_duration
+        if self.options.monitor_interval:
+            # live sources have no known duration
+            media_duration = self._video_duration / Gst.SECOND
+        else:
+            media_duration = self._media_duration
+        fps = self.framerate * media_duration / processing_duration
         logger.info("Processing took %.2fs (%i fps)" % (processing_duration, fps))
-        duration_string = '{"AUDIODURATION":%s,"VIDEODURATION":%s}' % (
-            self._audio_duration,
-            self._video_duration,
-        )
-        self.write_line(duration_string)
-        self._result_file.close()
+        logger.info("Writing results took %.3fs" % self.io_duration)
+        if self.dropped_records:
+            logger.error("Dropped %s records that do not fit in binary data files" % self.dropped_records)
+        logger.info("Peak bus queue depth: %s messages" % self.peak_bus_depth)
+        if self._results is not None:
+            logger.info("Peak results queue depth: %s/%s" % (self._results.peak_depth, self._results.maxsize))
+            if self._results.errors:
+                logger.error("Failed to handle %s detection results" % self._results.errors)
+        if self.stats:
+            self.write_stats(processing_duration, fps)
+        if self.segment:
+            # durations are written once segments are merged
+            self.close_result_file()
+            self.exit()
+            return
+        self.add_record({
+            "AUDIODURATION": self._audio_duration,
+            "VIDEODURATION": self._video_duration,
+        })
+        self.close_result_file()
         logger.info("Wrote file %s" % self._result_filename)
-        if not self.options.skip_results:
-            proc = subprocess.run([
-                "qr-lipsync-analyze",
-                str(self._result_filename),
-                "-q",
-                str(self.options.qrcode_name),
-                "--desync-threshold-frames",
-                str(self.options.desync_threshold_frames),
-            ])
-            self.analyze_returncode = proc.returncode
+        if self.analyzer:
+            if self.analyzer.finish():
+                self.analyze_returncode = self.analyzer.show_summary_and_exit()
         self.exit()
 
     def _on_message(self, bus, message):
+        with self._bus_depth_lock:
+            self._bus_depth -= 1
         t = message.type
         if t == Gst.MessageType.ELEMENT:
             struct = message.get_structure()
             sname = struct.get_name()
             source = message.src.get_name()
-            if sname == "barcode":
-                self._on_barcode(source, struct)
-            elif sname == "spectrum":
-                self._on_spectrum(source, struct)
+            if sname in ("barcode", "spectrum"):
+                self._handle_result(sname, source, struct)
         elif t == Gst.MessageType.WARNING:
             warning = message.parse_warning()
             if warning and warning.gerror and warning.gerror.matches(Gst.ParseError.quark(), Gst.ParseError.DELAYED_LINK):
@@ -282,11 +830,65 @@ class QrLipsyncDetector:
             logger.error(f'{error.gerror.message} from {message.src.name} ({type(message.src).__name__})')
             self._on_eos(bus, message)
 
+    def _on_sync_message(self, bus, message):
+        # called from the streaming thread that posted the message; spectrum
+        # messages are handled right away instead of piling up in the bus queue
+        if message.type == Gst.MessageType.ELEMENT:
+            struct = message.get_structure()
+            name = struct.get_name()
+            if name in ("barcode", "spectrum") and not self._seeked:
+                return Gst.BusSyncReply.DROP
+            if self.stats and name in ("barcode", "spectrum"):
+                self.stats.count("%s_messages" % name)
+            if name == "barcode" and message.src.get_name() == "qrcode_detector":
+                self._roi_hit = True
+            if name in ("barcode", "spectrum") and self._results is not None:
+                # the structure belongs to the message, which is dropped
+                self._results.put((name, message.src.get_name(), struct.copy()))
+                return Gst.BusSyncReply.DROP
+            if name == "spectrum" and self.options.sync_spectrum:
+                self._handle_result(name, message.src.get_name(), struct)
+                return Gst.BusSyncReply.DROP
+        with self._bus_depth_lock:
+            self._bus_depth += 1
+            self.peak_bus_depth = max(self.peak_bus_depth, self._bus_depth)
+        return Gst.BusSyncReply.PASS
+
+    def _handle_result(self, name, source, struct):
+        begin = time.monotonic()
+        if name == "barcode":
+            self._on_barcode(source, struct)
+        else:
+            self._on_spectrum(source, struct)
+        if self.stats:
+            self.stats.add_time("handle_%s" % name, time.monotonic() - begin)
+
+    def stop_handling_results(self):
+        if self._results is not None:
+            self._results.stop()
+
+    def _on_roi_scanned(self, pad, info, data):
+        # zbar posted its messages (if any) before pushing the frame, and the
+        # tee pushes the same frame to the whole area detector right after
+        hit = self._roi_hit
+        self._roi_hit = False
+        self.roi_frames_count += 1
+        if not hit:
+            self.full_area_frames_count += 1
+        self._full_area_valve.set_property("drop", hit)
+        if self.roi.update(hit):
+            self.set_roi(self.roi.bounds)
+        return Gst.PadProbeReturn.OK
+
     def _on_barcode(self, elt_name, struct):
+        if elt_name == FULL_AREA_DETECTOR:
+            # it only scans frames missed by the main detector
+            elt_name = "qrcode_detector"
         timestamp = struct.get_value("running-time")
         if timestamp is None:
             logger.warning('It seems that you are running a gstreamer version below 1.6.1, results might be unreliable')
             timestamp = struct.get_value('timestamp')
+        timestamp += self._time_offset
         json_data = struct.get_value("symbol")
         if json_data:
             # FIXME: qroverlay appends a trailing comma which makes the json invalid {"TIMESTAMP":33333333,"BUFFERCOUNT":2,"FRAMERATE":"30/1","NAME":"CAM1",}
@@ -302,43 +904,36 @@ class QrLipsyncDetector:
                         frame_dur_ms = 1000 / real_framerate
                         spectrum_interval_ms = self.spectrum_interval_ns * 1000
                         self.ticks_count_threshold = int(frame_dur_ms / spectrum_interval_ms)
+                        if self.tick_detector:
+                            self.tick_detector.set_min_tick_duration(frame_dur_ms / 2)
                 qrcode["ELEMENTNAME"] = elt_name
                 qrcode["VIDEOTIMESTAMP"] = timestamp
-                if qrcode.get("TICKFREQ"):
+                if qrcode.get(self.options.custom_data_name):
                     logger.debug(
                         "qrcode labeled %s found at timestamp %s, freq: %s Hz"
-                        % (qrcode["NAME"], timestamp, qrcode["TICKFREQ"])
+                        % (qrcode["NAME"], timestamp, qrcode[self.options.custom_data_name])
                     )
                     self.qrcode_with_beep_count += 1
-                d = json.dumps(qrcode)
-                self.write_line(d)
+                self.add_record(qrcode)
             else:
                 logger.warning("Got unexpected qrcode data: %s" % json_data)
         else:
             logger.warning("Could not get content of qrcode %s" % json_data)
 
     def _on_spectrum(self, elt_name, struct):
-        timestamp = struct.get_value("running-time") - self._encoder_latency
+        timestamp = struct.get_value("running-time") + self._time_offset - self._encoder_latency
         # there is a memory leak in gst.ValueList
         # https://bugzilla.gnome.org/show_bug.cgi?id=795305
         # tapping into the array attribute does not leak memory
+        # magnitudes are a list, on which max() and index() are cheaper than
+        # converting to a numpy array for every message
         magnitude = struct.get_value("magnitude").array
-        # ignore lowest frequencies
-        ignore_n_lowest_bands = int(
-            self._min_freq / (self._samplerate / self._bands_count)
-        )
-        for i in range(ignore_n_lowest_bands):
-            magnitude[i] = -60
+        magnitude[:self._ignore_n_lowest_bands] = self._ignored_magnitudes
 
         max_value = max(magnitude)
         if max_value > self._threshold_db:
             band_index = magnitude.index(max_value)
-            # self._samplerate / 2 is the nyquist frequency
-            band_width = (self._samplerate / 2) / self._bands_count
-            band_start = band_index * band_width
-            band_end = (band_index + 1) * band_width
-            # frequency is the middle of the band with the maximum magnitude
-            freq = int((band_end - band_start) / 2 + band_start)
+            freq = self._band_freqs[band_index]
 
             if freq > self._min_freq:
                 if freq == self.last_freq:
@@ -367,7 +962,37 @@ class QrLipsyncDetector:
                         )
                     )
                     self._tick_count += 1
-                    self.write_line(json.dumps(result))
+                    self.add_record(result)
+
+    def _on_audio_sample(self, appsink):
+        sample = appsink.emit("pull-sample")
+        buf = sample.get_buffer()
+        timestamp = sample.get_segment().to_running_time(Gst.Format.TIME, buf.pts) + self._time_offset
+        success, map_info = buf.map(Gst.MapFlags.READ)
+        if success:
+            samples = np.frombuffer(map_info.data, dtype=np.float32).copy()
+            buf.unmap(map_info)
+            begin = time.monotonic()
+            ticks = self.tick_detector.process(samples, timestamp)
+            if self.stats:
+                self.stats.add_time("tick_detector", time.monotonic() - begin)
+            self.add_ticks(ticks)
+        return Gst.FlowReturn.OK
+
+    def add_ticks(self, ticks):
+        for timestamp, freq, peak in ticks:
+            timestamp -= self._encoder_latency
+            logger.debug(
+                "tick found at timestamp : %s, freq : %d, peak  :%.1f"
+                % (timestamp, freq, peak)
+            )
+            self._tick_count += 1
+            self.add_record({
+                "ELEMENTNAME": "spectrum",
+                "TIMESTAMP": timestamp,
+                "PEAK": peak,
+                "FREQ": freq,
+            })
 
     def run_subprocess(self, cmd, filename):
         fields = cmd.split(" ")
@@ -382,8 +1007,40 @@ class QrLipsyncDetector:
         if self._video_fakesink_pad:
             self._video_fakesink_pad.remove_probe(self._id_prob_video_sink)
 
+    def add_record(self, record):
+        if self.segment and not in_segment(record, self.segment):
+            return
+        with self._records_lock:
+            if self._result_file.closed:
+                return
+            if self.options.binary:
+                try:
+                    data = binary.pack_record(record)
+                except ValueError as e:
+                    if not self.dropped_records:
+                        logger.error("Dropping records: %s, use json data files instead of --binary" % e)
+                    self.dropped_records += 1
+                    return
+                self.write_data(data)
+            else:
+                self.write_line(json.dumps(record))
+            if self.analyzer:
+                self.analyzer.feed(record)
+            if self.monitor:
+                self.monitor.feed(record)
+
     def write_line(self, line):
         if line is not None:
             line += "\n"
-            self._result_file.write(line)
+            self.write_data(line)
+
+    def write_data(self, data):
+        # records are flushed in batches since this runs on the main loop
+        begin = time.monotonic()
+        self._result_file.write(data)
+        if self._flush_policy.add_record():
             self._result_file.flush()
+        duration = time.monotonic() - begin
+        self.io_duration += duration
+        if self.stats:
+            self.stats.add_time("write", duration)
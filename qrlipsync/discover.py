@@ -0,0 +1,92 @@
+import copy
+import math
+import os
+import logging
+import tempfile
+
+from gi.repository import GLib
+from qrlipsync.detect import QrLipsyncDetector
+
+logger = logging.getLogger(__name__)
+
+# duration (in s) of the beginning of the media analyzed by each discovery pass
+DISCOVERY_DURATION_S = 3
+# the qrcode is looked for at these widths until found
+DISCOVERY_WIDTHS = (160, 320, 640, 1280)
+# candidates for --downscale-width once the area is known
+DOWNSCALE_WIDTHS = (120, 160, 240, 320, 480, 640)
+
+
+def run_discovery_pass(media_file, options, **overrides):
+    # detect qrcodes at the beginning of the media with some options changed
+    options = copy.copy(options)
+    options.skip_results = True
+    options.incremental = False
+    options.monitor_interval = 0
+    options.preview = False
+    options.binary = False
+    options.stats = False
+    options.stats_interval = 0
+    for name, value in overrides.items():
+        setattr(options, name, value)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        mainloop = GLib.MainLoop()
+        d = QrLipsyncDetector(
+            media_file,
+            os.path.join(tmp_dir, "discovery_data.txt"),
+            options,
+            mainloop,
+            segment=(None, DISCOVERY_DURATION_S),
+        )
+        GLib.idle_add(d.start)
+        mainloop.run()
+    return d
+
+
+def discover_area(media_file, options):
+    # region where qrcodes are found, as an --area value
+    for width in DISCOVERY_WIDTHS:
+        d = run_discovery_pass(media_file, options, adaptive_roi=True, downscale_width=width)
+        if d.roi.settled:
+            x1, y1, x2, y2 = d.roi.bounds
+            return "%s:%s:%s:%s" % (
+                max(0, math.floor(x1)),
+                max(0, math.floor(y1)),
+                min(100, math.ceil(x2)),
+                min(100, math.ceil(y2)),
+            )
+        logger.info("Could not locate qrcodes at width %s" % width)
+
+
+def discover_downscale_width(media_file, options, area):
+    # smallest width at which as many qrcodes are found as at full resolution
+    area_options = copy.copy(options)
+    area_options.area = area
+    area_options.adaptive_roi = False
+    d = run_discovery_pass(media_file, area_options, downscale_width=0)
+    area_width = d.get_cropped_size(d.get_area())[0]
+    widths = [width for width in DOWNSCALE_WIDTHS if width < area_width]
+    reference = d.qrcode_count
+    if not reference:
+        return options.downscale_width
+    for width in widths:
+        if run_discovery_pass(media_file, area_options, downscale_width=width).qrcode_count >= reference:
+            return width
+    # no downscaling
+    return 0
+
+
+def discover_options(media_file, options):
+    """
+        Return a copy of options with --area and --downscale-width computed from
+        a few quick detection passes over the beginning of the media
+    """
+    options = copy.copy(options)
+    area = discover_area(media_file, options)
+    if area is None:
+        logger.warning("Could not discover where qrcodes are, keeping --area %s" % options.area)
+        return options
+    options.area = area
+    options.downscale_width = discover_downscale_width(media_file, options, area)
+    logger.info("Using --area %s --downscale-width %s" % (options.area, options.downscale_width))
+    return options
@@ -0,0 +1,29 @@
+import time
+
+
+class FlushPolicy:
+    """
+        When to flush the file records are written into: once flush_records
+        records are buffered, or on the first record written flush_interval_ms
+        after the last flush
+    """
+
+    def __init__(self, flush_records, flush_interval_ms, clock=time.monotonic):
+        self.flush_records = flush_records
+        self.flush_interval_ms = flush_interval_ms
+        self._clock = clock
+        self.unflushed_records = 0
+        self._last_flush_time = clock()
+
+    def add_record(self):
+        # count a written record, return whether the file must be flushed now
+        self.unflushed_records += 1
+        now = self._clock()
+        if (
+            self.unflushed_records >= self.flush_records
+            or (now - self._last_flush_time) * 1000 >= self.flush_interval_ms
+        ):
+            self.unflushed_records = 0
+            self._last_flush_time = now
+            return True
+        return False
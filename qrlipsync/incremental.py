@@ -0,0 +1,266 @@
+import copy
+import logging
+import collections
+
+from qrlipsync import binary
+from qrlipsync.analyze import QrLipsyncAnalyzer, SECOND
+
+logger = logging.getLogger(__name__)
+
+# beeps are looked for within +/- half this window (in s) around each qrcode
+BEEP_WINDOW_S = 5
+# how late (in s) audio records may arrive compared to video records
+MAX_AUDIO_LAG_S = 10
+# time series windows ending this long (in s) before the last qrcode cannot
+# get new events, they are written and forgotten
+SERIES_LAG_S = BEEP_WINDOW_S + MAX_AUDIO_LAG_S
+# hard limits so that a stalled audio or video branch cannot grow memory
+MAX_PENDING_QRCODES = 1024
+MAX_RECENT_BEEPS = 4096
+
+# state that must survive from one monitoring window to the next so that frames,
+# beeps and qrcodes straddling the boundary are accounted for
+WINDOW_CARRIED_OVER = (
+    "frame_duration_ms",
+    "qrcode_names",
+    "_frame_duration",
+    "_last_frame_nb",
+    "_qrcode_framerate",
+    "_start_timestamp",
+    "_end_timestamp",
+    "_last_qrcode_with_freq",
+    "_audio_timestamp",
+    "_video_timestamp",
+    "_pending_qrcodes",
+    "_recent_beeps",
+)
+
+
+class QrLipsyncIncrementalAnalyzer(QrLipsyncAnalyzer):
+    """
+        Analyze detector records one at a time (as produced by qr-lipsync-detect)
+        keeping running statistics instead of every record, so that results are
+        available at any time with memory that does not depend on the duration
+
+        Beeps are expected in increasing timestamp order, which is how the
+        detector produces them; qrcodes waiting for a beep are kept until audio
+        went past their search window
+    """
+
+    def __init__(self, input_file, options, source=None):
+        super().__init__(input_file, options, source)
+        self._frame_duration = None
+        self._last_frame_nb = None
+        self._qrcode_framerate = 0
+        self._start_timestamp = self._end_timestamp = None
+        self._framerates_sum = 0
+        self._framerates_count = 0
+        self._last_qrcode_with_freq = None
+        self._beeps_count = 0
+        self._audio_timestamp = None
+        self._video_timestamp = None
+        # (timestamp, frequency) of qrcodes not matched with a beep yet
+        self._pending_qrcodes = collections.deque(maxlen=MAX_PENDING_QRCODES)
+        # (timestamp, frequency) of beeps that future qrcodes may match
+        self._recent_beeps = collections.deque(maxlen=MAX_RECENT_BEEPS)
+
+    def snapshot(self):
+        return self.get_results_dict()
+
+    def new_window(self):
+        # return an analyzer (without report files) that starts counting from
+        # scratch but carries over the matching state of this one
+        options = copy.copy(self.options)
+        options.no_report_files = True
+        window = type(self)(self._input_file, options)
+        for name in WINDOW_CARRIED_OVER:
+            setattr(window, name, copy.copy(getattr(self, name)))
+        return window
+
+    def parse_records(self, records):
+        for record in records:
+            self.parse_line(binary.unpack_record(record))
+
+    def parse_line(self, line):
+        name = line.get("ELEMENTNAME")
+        if name == "qrcode_detector":
+            self.qrcode_frames_count += 1
+            qrcode = self.get_qrcode_data(line)
+            if qrcode:
+                self.on_qrcode(qrcode)
+        elif name == "spectrum":
+            self.on_beep(float(line["TIMESTAMP"]) / SECOND, line["FREQ"])
+        else:
+            super().parse_line(line)
+
+    def on_qrcode(self, qrcode):
+        timestamp = qrcode["decoded_timestamp"]
+        if self._video_timestamp is None or timestamp > self._video_timestamp:
+            self._video_timestamp = timestamp
+        self.update_video_stats(timestamp, qrcode["qrcode_frame_number"], qrcode["qrcode_framerate"])
+
+        beep_freq = qrcode.get("beep_freq")
+        if beep_freq is not None:
+            # identical records are only counted once
+            if qrcode != self._last_qrcode_with_freq:
+                self._last_qrcode_with_freq = qrcode
+                self.qrcodes_with_freq_count += 1
+                beep_ts = self.find_recent_beep(timestamp, beep_freq)
+                if beep_ts is not None:
+                    self.on_match(timestamp, beep_freq, beep_ts)
+                else:
+                    if len(self._pending_qrcodes) == self._pending_qrcodes.maxlen:
+                        # the deque would drop it without counting a missing beep
+                        self.on_missing_beep(*self._pending_qrcodes.popleft())
+                    self._pending_qrcodes.append((timestamp, beep_freq))
+        self.expire_pending_qrcodes()
+        for series in self.series:
+            series.flush(self._video_timestamp - SERIES_LAG_S)
+
+    def on_beep(self, timestamp, beep_freq):
+        self._beeps_count += 1
+        self._audio_timestamp = timestamp
+        self._recent_beeps.append((timestamp, beep_freq))
+        matched = [
+            qrcode for qrcode in self._pending_qrcodes
+            if self.beep_matches(qrcode[0], qrcode[1], timestamp, beep_freq)
+        ]
+        for qrcode_ts, qrcode_freq in matched:
+            self._pending_qrcodes.remove((qrcode_ts, qrcode_freq))
+            self.on_match(qrcode_ts, qrcode_freq, timestamp)
+        self.expire_pending_qrcodes()
+        self.expire_recent_beeps()
+
+    def beep_matches(self, qrcode_ts, qrcode_freq, beep_ts, beep_freq):
+        threshold_hz = 50
+        return (
+            abs(beep_freq - qrcode_freq) < threshold_hz
+            and qrcode_ts - BEEP_WINDOW_S / 2 < beep_ts < qrcode_ts + BEEP_WINDOW_S / 2
+        )
+
+    def find_recent_beep(self, qrcode_ts, qrcode_freq):
+        for beep_ts, beep_freq in self._recent_beeps:
+            if self.beep_matches(qrcode_ts, qrcode_freq, beep_ts, beep_freq):
+                return beep_ts
+
+    def on_match(self, qrcode_ts, qrcode_freq, ts):
+        if not ts:
+            # a beep at timestamp 0 is considered as not found
+            self.on_missing_beep(qrcode_ts, qrcode_freq)
+            return
+        # timestamps are in s
+        diff_ms = round((ts - qrcode_ts) * 1000)
+        logger.debug("Found beep at %ss, diff: %sms" % (ts, diff_ms))
+        self.write_graphfile("%s\t%s" % (ts, diff_ms))
+        self.add_av_delay(ts, diff_ms)
+        if abs(diff_ms) > abs(self.max_delay_ms):
+            self.max_delay_ms = diff_ms
+            self.max_delay_ts = ts
+
+    def on_missing_beep(self, qrcode_ts, qrcode_freq):
+        logger.warning(
+            "Did not find %s Hz beep at %s"
+            % (qrcode_freq, self.get_timecode_from_seconds(qrcode_ts))
+        )
+        self.missing_beeps_count += 1
+        for series in self.series:
+            series.count("missing_beeps", qrcode_ts)
+
+    def expire_pending_qrcodes(self, all_qrcodes=False):
+        # no beep can match anymore once audio went past the end of the window,
+        # or once video is so far ahead that audio would be unreasonably late
+        while self._pending_qrcodes:
+            qrcode_ts, qrcode_freq = self._pending_qrcodes[0]
+            window_end = qrcode_ts + BEEP_WINDOW_S / 2
+            if (
+                all_qrcodes
+                or (self._audio_timestamp is not None and self._audio_timestamp >= window_end)
+                or self._video_timestamp >= window_end + MAX_AUDIO_LAG_S
+            ):
+                self._pending_qrcodes.popleft()
+                self.on_missing_beep(qrcode_ts, qrcode_freq)
+            else:
+                break
+
+    def expire_recent_beeps(self):
+        # upcoming qrcodes are not older than the last one, keep some margin anyway
+        if self._video_timestamp is None:
+            return
+        oldest = self._video_timestamp - BEEP_WINDOW_S
+        while self._recent_beeps and self._recent_beeps[0][0] < oldest:
+            self._recent_beeps.popleft()
+
+    def update_video_stats(self, timestamp, qrcode_frame_number, framerate):
+        # same accounting as check_video_stats, one qrcode at a time
+        max_backwards_diff = -30 * 10
+        if not self.frame_duration_ms:
+            self._frame_duration = 1 / framerate
+            self.frame_duration_ms = self._frame_duration * 1000
+            logger.info(
+                "Detected original sample frame duration of %.1fms" % (self.frame_duration_ms)
+            )
+
+        last_frame_nb = self._last_frame_nb
+        if last_frame_nb != qrcode_frame_number:
+            for series in self.series:
+                series.count("frames", timestamp)
+        if last_frame_nb is not None:
+            qrcode_frame_number_diff = qrcode_frame_number - last_frame_nb
+            if qrcode_frame_number_diff == 1:
+                # normal behaviour
+                self._qrcode_framerate += 1
+            elif qrcode_frame_number_diff > 1:
+                self._qrcode_framerate += 1
+                dropped_frames = qrcode_frame_number_diff - 1
+                self.dropped_frames_count += dropped_frames
+                for series in self.series:
+                    series.count("dropped_frames", timestamp, dropped_frames)
+                logger.debug(
+                    "%s dropped frame(s): %s > %s at %s"
+                    % (
+                        dropped_frames,
+                        last_frame_nb,
+                        qrcode_frame_number,
+                        self.get_timecode_from_seconds(timestamp),
+                    )
+                )
+            elif qrcode_frame_number == last_frame_nb:
+                logger.debug(
+                    "1 duplicated frame at  %s"
+                    % self.get_timecode_from_seconds(timestamp)
+                )
+                self.duplicated_frames_count += 1
+                for series in self.series:
+                    series.count("duplicated_frames", timestamp)
+            elif qrcode_frame_number_diff < 0:
+                self._qrcode_framerate += 1
+                if qrcode_frame_number_diff > max_backwards_diff:
+                    logger.warning(
+                        "Backwards frame: %s > %s"
+                        % (qrcode_frame_number, last_frame_nb)
+                    )
+        if self._frame_duration is not None:
+            if self._start_timestamp is None:
+                self._start_timestamp = int(timestamp)
+                self._end_timestamp = self._start_timestamp + 1 - self._frame_duration
+            elif timestamp >= self._end_timestamp:
+                self._framerates_sum += self._qrcode_framerate
+                self._framerates_count += 1
+                self._start_timestamp = self._end_timestamp = None
+                self._qrcode_framerate = 0
+        self._last_frame_nb = qrcode_frame_number
+
+    def check_av_sync(self):
+        # nothing else will come, remaining qrcodes did not get their beep
+        self.expire_pending_qrcodes(all_qrcodes=True)
+
+    def check_video_stats(self):
+        logger.info(f"Detected {self.qrcode_frames_count} qrcodes and {self._beeps_count} beeps")
+
+    def get_avg_real_framerate(self):
+        if self._framerates_count:
+            return round(self._framerates_sum / self._framerates_count, 2)
+        return 0
+
+    def get_total_beeps(self):
+        return self._beeps_count
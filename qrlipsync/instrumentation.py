@@ -0,0 +1,81 @@
+import threading
+import time
+
+
+class StageStats:
+    """
+        Per stage timing, counters and queue fill levels of a detection run,
+        which may be updated from any streaming thread
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._begin = time.monotonic()
+        # stage -> [count, total duration, max duration] in s
+        self.stages = dict()
+        self.counters = dict()
+        # queue -> [samples, total level, max level, full samples, max size]
+        self.queues = dict()
+
+    def add_time(self, stage, duration):
+        with self._lock:
+            stats = self.stages.setdefault(stage, [0, 0, 0])
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] = max(stats[2], duration)
+
+    def count(self, counter, count=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + count
+
+    def add_queue_level(self, queue, level, max_size):
+        with self._lock:
+            stats = self.queues.setdefault(queue, [0, 0, 0, 0, max_size])
+            stats[0] += 1
+            stats[1] += level
+            stats[2] = max(stats[2], level)
+            stats[3] += max_size > 0 and level >= max_size
+
+    def get_report(self):
+        elapsed = time.monotonic() - self._begin
+        with self._lock:
+            return {
+                "elapsed_s": round(elapsed, 3),
+                "stages": {
+                    stage: {
+                        "count": count,
+                        "total_s": round(total, 3),
+                        "mean_ms": round(1000 * total / count, 3),
+                        "max_ms": round(1000 * max_duration, 3),
+                        # share of the run spent in this stage, across threads
+                        "percent": round(100 * total / elapsed, 1),
+                    }
+                    for stage, (count, total, max_duration) in sorted(self.stages.items())
+                },
+                "counters": {
+                    counter: {"count": count, "per_s": round(count / elapsed, 1)}
+                    for counter, count in sorted(self.counters.items())
+                },
+                "queues": {
+                    queue: {
+                        "max_size": max_size,
+                        "mean_level": round(total / samples, 2),
+                        "max_level": max_level,
+                        "full_percent": round(100 * full / samples, 1),
+                    }
+                    for queue, (samples, total, max_level, full, max_size) in sorted(self.queues.items())
+                },
+            }
+
+    def get_summary(self):
+        # one line version of the report, for periodic logging
+        report = self.get_report()
+        stages = ", ".join(
+            "%s %.2fms (%s%%)" % (stage, stats["mean_ms"], stats["percent"])
+            for stage, stats in report["stages"].items()
+        )
+        counters = ", ".join("%s %s/s" % (counter, stats["per_s"]) for counter, stats in report["counters"].items())
+        queues = ", ".join(
+            "%s %s/%s" % (queue, stats["mean_level"], stats["max_size"]) for queue, stats in report["queues"].items()
+        )
+        return "stages: %s; messages: %s; queues: %s" % (stages, counters, queues)
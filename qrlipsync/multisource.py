@@ -0,0 +1,169 @@
+import collections
+import copy
+import json
+import logging
+
+import numpy as np
+
+from qrlipsync import binary
+from qrlipsync.analyze import QrLipsyncAnalyzer, get_report_prefix
+from qrlipsync.incremental import MAX_RECENT_BEEPS, QrLipsyncIncrementalAnalyzer
+
+logger = logging.getLogger(__name__)
+
+ALL_SOURCES = "all"
+
+
+def parse_sources(qrcode_names):
+    # "CAM1,CAM2" -> ["CAM1", "CAM2"], "all" -> None (every name found)
+    if qrcode_names == ALL_SOURCES:
+        return None
+    return [name.strip() for name in qrcode_names.split(",") if name.strip()]
+
+
+class QrLipsyncMultiSourceAnalyzer(QrLipsyncAnalyzer):
+    """
+        Analyze several sources (qrcode names) of a data file in a single pass:
+        qrcodes are dispatched to one analyzer_class instance per source, which
+        writes its own report files (e.g. cam_data.CAM2.report.json), and all
+        sources share the beeps
+
+        options.qrcode_names is a comma-separated list of names, or "all" to
+        analyze every name found
+    """
+
+    def __init__(self, input_file, options, analyzer_class=QrLipsyncAnalyzer):
+        # this analyzer only dispatches records, sources write the reports
+        own_options = copy.copy(options)
+        own_options.no_report_files = True
+        super().__init__(input_file, own_options)
+        self.source_options = options
+        self.analyzer_class = analyzer_class
+        self.incremental = issubclass(analyzer_class, QrLipsyncIncrementalAnalyzer)
+        self.expected_names = parse_sources(options.qrcode_names)
+        self.sources = dict()
+        self.missing_sources = list()
+        self._files_open = False
+        # beeps a source found later needs to catch up with, when incremental
+        self._recent_beeps = collections.deque(maxlen=MAX_RECENT_BEEPS)
+        self._beeps_count = 0
+        for name in self.expected_names or []:
+            self.add_source(name)
+
+    def add_source(self, name):
+        options = copy.copy(self.source_options)
+        options.qrcode_name = name
+        source = self.analyzer_class(self._input_file, options, name)
+        if self._files_open:
+            source.open_files()
+        if self.incremental:
+            for line in self._recent_beeps:
+                source.parse_line(line)
+            source._beeps_count = self._beeps_count
+        else:
+            # beeps are stored once for all sources
+            source.all_audio_beeps = self.all_audio_beeps
+        self.sources[name] = source
+        return source
+
+    def get_source(self, name):
+        if name not in self.qrcode_names:
+            self.qrcode_names.append(name)
+        source = self.sources.get(name)
+        if source is None and self.expected_names is None:
+            logger.info("Found qrcode source %s" % name)
+            source = self.add_source(name)
+        return source
+
+    def open_files(self):
+        self._files_open = True
+        for source in self.sources.values():
+            source.open_files()
+
+    def close_files(self):
+        # sources close their files when showing their summary
+        pass
+
+    def parse_line(self, line):
+        name = line.get("ELEMENTNAME")
+        if name == "qrcode_detector":
+            self.qrcode_frames_count += 1
+            source = self.get_source(line["NAME"])
+            if source is not None:
+                source.parse_line(line)
+        elif name == "spectrum" and self.incremental:
+            self._recent_beeps.append(line)
+            self._beeps_count += 1
+            for source in self.sources.values():
+                source.parse_line(line)
+        else:
+            # beeps go into the store shared by sources, durations are set at the end
+            super().parse_line(line)
+
+    def parse_records(self, records):
+        if self.incremental:
+            for record in records:
+                self.parse_line(binary.unpack_record(record))
+            return
+        is_qrcode = records["kind"] == binary.KIND_QRCODE
+        qrcodes = records[is_qrcode]
+        self.qrcode_frames_count += len(qrcodes)
+        names, first_indexes, inverse = np.unique(qrcodes["name"], return_index=True, return_inverse=True)
+        for index in np.argsort(first_indexes):
+            source = self.get_source(names[index].decode())
+            if source is not None:
+                source.parse_records(qrcodes[inverse == index])
+        # beeps and durations
+        super().parse_records(records[~is_qrcode])
+
+    def finish(self):
+        if not self.sources:
+            return self.check_qrcode_names() == 0
+        found = False
+        for name, source in self.sources.items():
+            source.audio_duration_s = self.audio_duration_s
+            source.video_duration_s = self.video_duration_s
+            if source.finish():
+                found = True
+            else:
+                self.missing_sources.append(name)
+        return found
+
+    def check_qrcode_names(self):
+        logger.error("No qrcode detected, exiting with error")
+        return 1
+
+    def get_results_dict(self):
+        return {
+            name: source.get_results_dict()
+            for name, source in self.sources.items()
+            if name not in self.missing_sources
+        }
+
+    def show_summary_and_exit(self):
+        exit_code = 1 if self.missing_sources else 0
+        for name, source in self.sources.items():
+            if name in self.missing_sources:
+                source.close_files()
+                continue
+            logger.info("Source %s:" % name)
+            exit_code = max(exit_code, source.show_summary_and_exit())
+        results = self.get_results_dict()
+        for name, source_results in results.items():
+            logger.info(
+                "%s: median delay %s ms, %s dropped and %s duplicated frames out of %s, %s missed beeps"
+                % (
+                    name,
+                    source_results["median_av_delay_ms"],
+                    source_results["dropped_frames"],
+                    source_results["duplicated_frames"],
+                    source_results["total_frames"],
+                    source_results["matching_missing"],
+                )
+            )
+        if not self.source_options.no_report_files:
+            sources_file = "%s.sources.json" % get_report_prefix(self._input_file)
+            with open(sources_file, "w") as f:
+                json.dump(results, f)
+            logger.info("Wrote results of %s sources as JSON into %s" % (len(results), sources_file))
+        return exit_code
@@ -0,0 +1,57 @@
+import copy
+import os
+import logging
+
+from gi.repository import GLib
+from qrlipsync.detect import QrLipsyncDetector, get_media_info, run_analyzer
+from qrlipsync.processes import get_process_pool
+from qrlipsync.segments import get_segments, merge_segments, merge_stats
+
+logger = logging.getLogger(__name__)
+
+
+def detect_segment(media_file, result_file, options, segment):
+    # runs in a worker process, with its own main loop
+    logging.basicConfig(
+        format="%(asctime)s %(name)s %(levelname)s %(message)s",
+        level=logging.DEBUG if options.verbosity else logging.INFO,
+    )
+    mainloop = GLib.MainLoop()
+    d = QrLipsyncDetector(media_file, result_file, options, mainloop, segment=segment)
+    GLib.idle_add(d.start)
+    mainloop.run()
+    return {
+        "result_file": result_file,
+        "audio_duration": d._audio_duration,
+        "video_duration": d._video_duration,
+    }
+
+
+def detect_parallel(media_file, result_file, options):
+    """
+        Analyze a media file with options.jobs processes, each one seeking to and
+        decoding its own part of the media, then merge their data files into
+        result_file and analyze it like a single detector would
+    """
+    duration = float(get_media_info(media_file)["duration"])
+    segments = get_segments(duration, options.jobs)
+    segment_options = copy.copy(options)
+    segment_options.skip_results = True
+    segment_options.incremental = False
+    segment_options.preview = False
+    args = [
+        (media_file, "%s.part%s" % (result_file, i), segment_options, segment)
+        for i, segment in enumerate(segments)
+    ]
+    logger.info("Analyzing %s in %s segments of %.1fs" % (media_file, len(segments), duration / len(segments)))
+    with get_process_pool(options.jobs) as pool:
+        segments_results = pool.starmap(detect_segment, args)
+    merge_segments(result_file, segments_results, options.binary)
+    logger.info("Wrote file %s" % result_file)
+    if options.stats or options.stats_interval:
+        stats_file = "%s.stats.json" % os.path.splitext(result_file)[0]
+        merge_stats(stats_file, segments_results)
+        logger.info("Wrote stats of %s segments into %s" % (len(segments_results), stats_file))
+    if options.skip_results:
+        return 0
+    return run_analyzer(result_file, options)
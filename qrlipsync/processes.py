@@ -0,0 +1,7 @@
+import multiprocessing
+
+
+def get_process_pool(processes, **kwargs):
+    # gstreamer does not survive forking once initialized, so workers are
+    # spawned and import (and initialize) it themselves
+    return multiprocessing.get_context("spawn").Pool(processes, **kwargs)
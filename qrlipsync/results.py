@@ -0,0 +1,67 @@
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ResultsQueue:
+    """
+        Bounded queue of detection results put by the streaming threads and
+        passed in order to handler(*result) by a thread of its own
+
+        Putting blocks while the queue is full, so that the bus queue cannot
+        grow instead, until results stop being handled: results are then
+        dropped, also if the thread died
+    """
+
+    def __init__(self, handler, maxsize):
+        self.maxsize = maxsize
+        self.peak_depth = 0
+        # results the handler raised on
+        self.errors = 0
+        self._handler = handler
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._stopping = threading.Event()
+
+    def start(self):
+        self._thread.start()
+
+    def put(self, result):
+        while not self._stopping.is_set():
+            try:
+                self._queue.put(result, timeout=0.1)
+            except queue.Full:
+                continue
+            self.peak_depth = max(self.peak_depth, self._queue.qsize())
+            return
+
+    def clear(self):
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    def _run(self):
+        try:
+            while True:
+                result = self._queue.get()
+                if result is None:
+                    break
+                try:
+                    self._handler(*result)
+                except Exception:
+                    # e.g. a malformed message, later ones may be fine
+                    self.errors += 1
+                    logger.exception("Failed to handle %s result" % result[0])
+        finally:
+            self._stopping.set()
+
+    def stop(self):
+        # results queued so far are handled, later ones are dropped
+        self._stopping.set()
+        while self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=0.1)
+            except queue.Full:
+                continue
+            self._thread.join()
@@ -0,0 +1,86 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (x1, y1, x2, y2) in percents of the frame, from the top left corner
+FULL_AREA = (0, 0, 100, 100)
+# index in the area of each side, and the direction that moves it inwards
+SIDES = ((0, 1), (1, 1), (2, -1), (3, -1))
+
+
+class AdaptiveRoi:
+    """
+        Find the smallest region of interest where qrcodes can still be decoded,
+        one frame at a time: once a qrcode was found in the whole area, each side
+        is moved inwards as long as qrcodes keep being found, and moved back with
+        a smaller step when they are not; the result is then widened by a margin
+
+        Once settled, too many consecutive frames without a qrcode (e.g. the
+        qrcode moved) restart the search from the whole area
+    """
+
+    def __init__(self, area=FULL_AREA, initial_step=25, min_step=1, margin=5, min_size=5, max_misses=15):
+        self.area = tuple(area)
+        self.initial_step = initial_step
+        self.min_step = min_step
+        self.margin = margin
+        self.min_size = min_size
+        self.max_misses = max_misses
+        self.reset()
+
+    def reset(self):
+        self.bounds = list(self.area)
+        self.settled = False
+        self.misses = 0
+        self._steps = [self.initial_step] * len(SIDES)
+        # side moved for the frame being scanned, and bounds before moving it
+        self._side = None
+        self._previous = None
+        self._last_side = -1
+
+    def update(self, hit):
+        # called once a frame was scanned within bounds, with whether a qrcode
+        # was found; return whether bounds changed for the next frame
+        bounds = self.bounds
+        if self.settled:
+            if hit:
+                self.misses = 0
+            else:
+                self.misses += 1
+                if self.misses >= self.max_misses:
+                    logger.info("Lost qrcode in %s, looking in the whole area again" % self.bounds)
+                    self.reset()
+        else:
+            if self._side is not None and not hit:
+                # the qrcode got cut, move this side back and by smaller steps
+                self.bounds = self._previous
+                self._steps[self._side] /= 2
+            if hit or self._side is not None:
+                self.move_next_side()
+        return self.bounds != bounds
+
+    def move_next_side(self):
+        while any(step >= self.min_step for step in self._steps):
+            self._last_side = side = (self._last_side + 1) % len(SIDES)
+            if self._steps[side] < self.min_step:
+                continue
+            index, direction = SIDES[side]
+            bounds = list(self.bounds)
+            bounds[index] += direction * self._steps[side]
+            if bounds[2] - bounds[0] >= self.min_size and bounds[3] - bounds[1] >= self.min_size:
+                self._previous = self.bounds
+                self.bounds = bounds
+                self._side = side
+                return
+            self._steps[side] /= 2
+        # as tight as it gets, keep some room for slight moves
+        self._side = None
+        self.settled = True
+        x1, y1, x2, y2 = self.bounds
+        self.bounds = [
+            max(self.area[0], x1 - self.margin),
+            max(self.area[1], y1 - self.margin),
+            min(self.area[2], x2 + self.margin),
+            min(self.area[3], y2 + self.margin),
+        ]
+        logger.info("Found qrcode region of interest: %s" % ":".join("%.1f" % c for c in self.bounds))
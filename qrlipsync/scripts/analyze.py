@@ -5,6 +5,8 @@ import os
 import signal
 import sys
 from qrlipsync.analyze import QrLipsyncAnalyzer
+from qrlipsync.incremental import QrLipsyncIncrementalAnalyzer
+from qrlipsync.multisource import QrLipsyncMultiSourceAnalyzer
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +25,11 @@ def main():
         default="CAM1",
     )
 
+    parser.add_argument(
+        "--qrcode-names",
+        help="comma-separated names of qrcode patterns to analyze in a single pass (e.g. CAM1,CAM2), or 'all' for every name found; each one gets its own report files, overrides --qrcode-name",
+    )
+
     parser.add_argument(
         "-c",
         "--custom-data-name",
@@ -37,6 +44,18 @@ def main():
         action="store_true"
     )
 
+    parser.add_argument(
+        "--windows",
+        help="comma-separated durations (in s) of the windows of time series to write next to the report as .windows_<N>s.csv files, e.g. 1,10,60 (none by default)",
+        default="",
+    )
+
+    parser.add_argument(
+        "--windows-npz",
+        help="also write the time series as compressed numpy .npz files",
+        action="store_true",
+    )
+
     parser.add_argument(
         "--desync-threshold-frames",
         help="tolerated desync (in frames); beyond this, qr-lipsync will exit with a non 0 exit status",
@@ -58,6 +77,12 @@ def main():
         action="store_true"
     )
 
+    parser.add_argument(
+        "--bounded-memory",
+        help="keep running statistics instead of every record, so that memory does not grow with the capture duration (beeps must be in increasing timestamp order, as written by qr-lipsync-detect)",
+        action="store_true"
+    )
+
     options = parser.parse_args(sys.argv[1:])
 
     logging.basicConfig(
@@ -71,7 +96,11 @@ def main():
     input_file = options.input_file
     exit_code = 0
     if os.path.isfile(input_file):
-        a = QrLipsyncAnalyzer(input_file, options)
+        analyzer_class = QrLipsyncIncrementalAnalyzer if options.bounded_memory else QrLipsyncAnalyzer
+        if options.qrcode_names:
+            a = QrLipsyncMultiSourceAnalyzer(input_file, options, analyzer_class)
+        else:
+            a = analyzer_class(input_file, options)
         if a.start():
             exit_code = a.show_summary_and_exit()
     else:
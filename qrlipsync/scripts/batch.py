@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+import argparse
+import os
+import sys
+import logging
+from qrlipsync.batch import run_batch
+from qrlipsync.summary import find_media_files, write_summary
+from qrlipsync.scripts.detect import add_detect_arguments
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Detect and analyze lipsync in many captured files with a pool of processes",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "inputs",
+        help="media files, directories or glob patterns (e.g. 'captures/*.mp4') to analyze",
+        nargs="+",
+    )
+
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="number of files processed in parallel",
+        type=int,
+        default=os.cpu_count(),
+    )
+
+    parser.add_argument(
+        "-o",
+        "--summary-prefix",
+        help="path prefix of the aggregated .json and .csv summaries",
+        default="qr-lipsync-batch",
+    )
+
+    add_detect_arguments(parser)
+
+    options = parser.parse_args()
+
+    logging.basicConfig(
+        format="%(asctime)s %(name)s %(levelname)s %(message)s",
+        level=logging.DEBUG if options.verbosity else logging.INFO,
+        stream=sys.stderr,
+    )
+
+    media_files = find_media_files(options.inputs)
+    if not media_files:
+        logger.error("No media file found in %s" % " ".join(options.inputs))
+        return 1
+    # each file is analyzed by a single process
+    options.jobs = 1
+    summary = run_batch(media_files, options)
+    write_summary(summary, options.summary_prefix)
+    return 1 if summary["failed_files"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,26 +4,30 @@ import os
 import sys
 import logging
 from gi.repository import GLib
-from qrlipsync.detect import QrLipsyncDetector
+from qrlipsync.detect import QrLipsyncDetector, get_result_file
+from qrlipsync.discover import discover_options
+from qrlipsync.parallel import detect_parallel
 
 logger = logging.getLogger(__name__)
 
 
-def main():
-    parser = argparse.ArgumentParser(
-        description="Generate videos suitable for measuring lipsync with qrcodes",
-        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+def add_detect_arguments(parser):
+    parser.add_argument(
+        "-a",
+        "--area",
+        help="area in x1:y1:x2:y2 format (in percent) to look qrcodes for; example: 0:30:30:80; reference is top left corner",
     )
 
     parser.add_argument(
-        "input_file",
-        help="filename of video to analyze"
+        "--discover-area",
+        help="set --area and --downscale-width from a quick detection pass over the first seconds of the media (files only)",
+        action="store_true",
     )
 
     parser.add_argument(
-        "-a",
-        "--area",
-        help="area in x1:y1:x2:y2 format (in percent) to look qrcodes for; example: 0:30:30:80; reference is top left corner",
+        "--adaptive-roi",
+        help="look for qrcodes in a region of interest found automatically within the area, and in the whole area only in frames where none was found there",
+        action="store_true",
     )
 
     parser.add_argument(
@@ -33,6 +37,49 @@ def main():
         action="store_true",
     )
 
+    parser.add_argument(
+        "-b",
+        "--binary",
+        help="write detected data as fixed-size binary records (_data.bin) instead of json lines (_data.txt), faster to analyze",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--flush-records",
+        help="flush the data file every N records (1 to flush after each record)",
+        default=100,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--flush-interval-ms",
+        help="flush the data file when the last flush is older than this (in ms)",
+        default=1000,
+        type=int,
+    )
+
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        help="analyze records while they are detected instead of running qr-lipsync-analyze on the data file at the end",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-m",
+        "--monitor-interval",
+        help="monitor a live source (e.g. rtsp://, srt://, udp://): every N seconds, report lipsync, drops and drift over the last N seconds into the .monitor.json file along with the totals since the start, and rotate the data file; no other report files are written, so that disk usage stays bounded; 0 to disable",
+        default=0,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--monitor-duration",
+        help="stop monitoring after N seconds, 0 to monitor until the end of the stream",
+        default=0,
+        type=int,
+    )
+
     parser.add_argument(
         "-d",
         "--downscale-width",
@@ -41,6 +88,33 @@ def main():
         type=int,
     )
 
+    parser.add_argument(
+        "--luma",
+        help="only convert and scale the luma plane (GRAY8) of frames, which is all zbar needs, in a single step with videoconvertscale if available",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--decoder-threads",
+        help="number of threads of software video decoders (avdec_*), 0 for automatic",
+        type=int,
+    )
+
+    parser.add_argument(
+        "--decoder-lowres",
+        help="decode at 1/2 (1) or 1/4 (2) of the resolution with software video decoders (avdec_*) that support it",
+        type=int,
+        choices=[0, 1, 2],
+        default=0,
+    )
+
+    parser.add_argument(
+        "--decoder-option",
+        help="name=value property to set on software video decoders (avdec_*), e.g. skip-frame=0; can be repeated",
+        action="append",
+        default=[],
+    )
+
     parser.add_argument(
         "-p",
         "--preview",
@@ -55,6 +129,13 @@ def main():
         default="CAM1",
     )
 
+    parser.add_argument(
+        "-c",
+        "--custom-data-name",
+        help="name of custom data embedded in qrcode to extract",
+        default="TICKFREQ",
+    )
+
     parser.add_argument(
         "-t",
         "--audio-threshold",
@@ -63,6 +144,71 @@ def main():
         default=-48,
     )
 
+    parser.add_argument(
+        "--audio-detector",
+        help="how to detect audio ticks: spectrum element messages, numpy short-time fourier transforms over raw samples (finer time resolution), or a bank of Goertzel filters at the frequencies used by qr-lipsync-generate only (cheapest, sub-ms onsets)",
+        choices=["spectrum", "fft", "goertzel"],
+        default="spectrum",
+    )
+
+    parser.add_argument(
+        "--sync-spectrum",
+        help="process spectrum data in the audio streaming thread instead of the main loop, so that it does not pile up in the bus",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="split the media in this many segments analyzed in parallel processes (files only)",
+        type=int,
+        default=1,
+    )
+
+    parser.add_argument(
+        "--sync-results",
+        help="take qrcode and spectrum results from the streaming threads into a bounded queue handled by a separate thread, instead of the main loop through the bus; streaming threads wait when the queue is full",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--results-queue-size",
+        help="size of the --sync-results queue",
+        type=int,
+        default=1000,
+    )
+
+    parser.add_argument(
+        "--bounded-memory",
+        help="run in constant memory on long captures: analyze records incrementally (as --incremental) and take results from the streaming threads into a bounded queue (as --sync-results)",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--stats",
+        help="time each pipeline stage, count detection messages and sample queue fill levels, and write them into the .stats.json file next to the data file",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--stats-interval",
+        help="also log --stats every N seconds (implies --stats), 0 to disable",
+        type=int,
+        default=0,
+    )
+
+    parser.add_argument(
+        "--windows",
+        help="comma-separated durations (in s) of the windows of time series to write next to the report as .windows_<N>s.csv files, e.g. 1,10,60 (none by default)",
+        default="",
+    )
+
+    parser.add_argument(
+        "--windows-npz",
+        help="also write the time series as compressed numpy .npz files",
+        action="store_true",
+    )
+
     parser.add_argument(
         "--desync-threshold-frames",
         help="tolerated desync (in frames); beyond this, qr-lipsync will exit with a non 0 exit status",
@@ -84,6 +230,20 @@ def main():
         action="store_true"
     )
 
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate videos suitable for measuring lipsync with qrcodes",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "input_file",
+        help="filename of video to analyze"
+    )
+
+    add_detect_arguments(parser)
+
     options = parser.parse_args()
 
     logging.basicConfig(
@@ -95,10 +255,15 @@ def main():
     media_file = options.input_file
     exit_code = 0
     mainloop = GLib.MainLoop()
-    if os.path.isfile(media_file):
-        dirname = os.path.dirname(media_file)
-        media_prefix = os.path.splitext(os.path.basename(media_file))[0]
-        result_file = os.path.join(dirname, "%s_data.txt" % (media_prefix))
+    if os.path.isfile(media_file) or '://' in media_file:
+        result_file = get_result_file(media_file, options)
+        if options.discover_area and '://' not in media_file:
+            options = discover_options(media_file, options)
+        if options.jobs > 1:
+            if options.monitor_interval or '://' in media_file:
+                logger.error("--jobs can only be used on files")
+                return 1
+            return detect_parallel(media_file, result_file, options)
         d = QrLipsyncDetector(media_file, result_file, options, mainloop)
         if d:
             GLib.idle_add(d.start)
@@ -5,6 +5,7 @@ import argparse
 import logging
 from gi.repository import GLib
 from qrlipsync.generate import QrLipsyncGenerator
+from qrlipsync.ticks import TICK_FREQUENCIES
 
 logger = logging.getLogger(__name__)
 
@@ -91,50 +92,7 @@ def main():
         "framerate": options.framerate,
         "qrcode_size_percent": 70,
         "extra_data_name": "tickfreq",
-        "freq_array": (
-            240,
-            480,
-            720,
-            960,
-            1200,
-            1440,
-            1680,
-            1920,
-            2160,
-            2400,
-            2640,
-            2880,
-            3120,
-            3360,
-            3600,
-            3840,
-            4080,
-            4320,
-            4560,
-            4800,
-            5040,
-            5280,
-            5520,
-            5760,
-            6000,
-            6240,
-            6480,
-            6720,
-            6960,
-            7200,
-            7440,
-            7680,
-            7920,
-            8160,
-            8400,
-            8640,
-            8880,
-            9120,
-            9360,
-            9600,
-            9840,
-            10080,
-        ),
+        "freq_array": TICK_FREQUENCIES,
         "background": options.background,
         "enable_textoverlay": True,
     }
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+import argparse
+import logging
+import sys
+import time
+from qrlipsync.synthetic import SyntheticCapture, write_data_file
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic qr-lipsync-detect data file, to test qr-lipsync-analyze without capturing",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("output_file", help="data file to write")
+    parser.add_argument("-d", "--duration", help="duration of the capture in s", type=float, default=3600)
+    parser.add_argument("-r", "--framerate", help="framerate", type=str, default="30")
+    parser.add_argument("-q", "--qrcode-name", help="name of the qrcodes", default="CAM1")
+    parser.add_argument("--beep-interval", help="interval between beeps in s", type=float, default=1)
+    parser.add_argument("--delay-ms", help="constant audio delay in ms", type=float, default=0)
+    parser.add_argument("--drift-ms", help="additional audio delay in ms per second of capture", type=float, default=0)
+    parser.add_argument("--jitter-ms", help="maximum random offset of timestamps in ms", type=float, default=0)
+    parser.add_argument("--drop-rate", help="probability of a frame to be dropped", type=float, default=0)
+    parser.add_argument("--dup-rate", help="probability of a frame to be duplicated", type=float, default=0)
+    parser.add_argument("--backwards-rate", help="probability of a backwards jump after a frame", type=float, default=0)
+    parser.add_argument("--backwards-frames", help="frames replayed by a backwards jump", type=int, default=2)
+    parser.add_argument("--missing-beep-rate", help="probability of a beep not to be detected", type=float, default=0)
+    parser.add_argument("--seed", help="random seed, to write the same capture again", type=int)
+    parser.add_argument(
+        "-b",
+        "--binary",
+        help="write fixed-size binary records instead of json lines",
+        action="store_true",
+    )
+    options = parser.parse_args(sys.argv[1:])
+
+    logging.basicConfig(format="%(asctime)s %(name)s %(levelname)s %(message)s", level=logging.INFO)
+
+    capture = SyntheticCapture(
+        options.duration,
+        framerate=options.framerate,
+        qrcode_name=options.qrcode_name,
+        beep_interval=options.beep_interval,
+        delay_ms=options.delay_ms,
+        drift_ms=options.drift_ms,
+        jitter_ms=options.jitter_ms,
+        drop_rate=options.drop_rate,
+        dup_rate=options.dup_rate,
+        backwards_rate=options.backwards_rate,
+        backwards_frames=options.backwards_frames,
+        missing_beep_rate=options.missing_beep_rate,
+        seed=options.seed,
+    )
+    begin = time.time()
+    count = write_data_file(options.output_file, capture.records(), options.binary)
+    logger.info("Wrote %s records into %s in %.1fs" % (count, options.output_file, time.time() - begin))
+    logger.info(
+        "Injected %s dropped frames, %s duplicated frames, %s backwards jumps and %s missing beeps out of %s"
+        % (
+            capture.dropped_frames,
+            capture.duplicated_frames,
+            capture.backwards_jumps,
+            capture.missing_beeps,
+            capture.beeps,
+        )
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
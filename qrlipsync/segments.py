@@ -0,0 +1,87 @@
+import json
+import os
+
+from qrlipsync import binary
+
+SECOND = 1000000000
+
+
+def get_segments(duration, jobs):
+    # split the media in jobs consecutive (start, stop) ranges in s, the first
+    # and last ones being open so that no record can fall outside of them
+    bounds = [duration * i / jobs for i in range(1, jobs)]
+    return list(zip([None] + bounds, bounds + [None]))
+
+
+def in_segment(record, segment):
+    # records decoded in the margins belong to the neighbouring segments
+    timestamp = record.get("VIDEOTIMESTAMP", record.get("TIMESTAMP"))
+    start, stop = segment
+    return (
+        (start is None or timestamp >= start * SECOND)
+        and (stop is None or timestamp < stop * SECOND)
+    )
+
+
+def get_stats_file(result_file):
+    # as written by the detector of each segment
+    return "%s.stats.json" % result_file
+
+
+def merge_segments(result_file, segments_results, binary_format):
+    # each segment only holds the records of its own time range, so
+    # concatenating them in order gives a time ordered data file
+    with open(result_file, "wb") as f:
+        if binary_format:
+            f.write(binary.get_header())
+        for result in segments_results:
+            with open(result["result_file"], "rb") as part:
+                if binary_format:
+                    part.seek(len(binary.get_header()))
+                while True:
+                    data = part.read(1024 * 1024)
+                    if not data:
+                        break
+                    f.write(data)
+            os.remove(result["result_file"])
+        durations = {
+            "AUDIODURATION": max(result["audio_duration"] for result in segments_results),
+            "VIDEODURATION": max(result["video_duration"] for result in segments_results),
+        }
+        if binary_format:
+            f.write(binary.pack_record(durations))
+        else:
+            f.write((json.dumps(durations) + "\n").encode())
+
+
+def merge_stats(stats_file, segments_results):
+    """
+        Write the --stats reports of all segments into stats_file, along with
+        their totals (segments run in parallel, so durations add up to more
+        than the elapsed time), and remove the reports of the segments
+    """
+    segments = list()
+    for result in segments_results:
+        segment_stats_file = get_stats_file(result["result_file"])
+        with open(segment_stats_file) as f:
+            segments.append(json.load(f))
+        os.remove(segment_stats_file)
+    stages = dict()
+    counters = dict()
+    for report in segments:
+        for stage, stats in report["stages"].items():
+            total = stages.setdefault(stage, {"count": 0, "total_s": 0, "max_ms": 0})
+            total["count"] += stats["count"]
+            total["total_s"] += stats["total_s"]
+            total["max_ms"] = max(total["max_ms"], stats["max_ms"])
+        for counter, stats in report["counters"].items():
+            counters[counter] = counters.get(counter, 0) + stats["count"]
+    for stats in stages.values():
+        stats["total_s"] = round(stats["total_s"], 3)
+        stats["mean_ms"] = round(1000 * stats["total_s"] / stats["count"], 3)
+    with open(stats_file, "w") as f:
+        json.dump({
+            "stages": dict(sorted(stages.items())),
+            "counters": {counter: {"count": count} for counter, count in sorted(counters.items())},
+            "segments": segments,
+        }, f, indent=2)
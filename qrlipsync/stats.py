@@ -0,0 +1,209 @@
+import collections
+import copy
+import math
+
+
+class IntegerHistogram:
+    """
+        Exact distribution of integer values (e.g. delays rounded to the ms)
+        stored as value -> count, so that memory only depends on the range of
+        values and not on how many were added
+    """
+
+    def __init__(self):
+        self.counts = dict()
+        self.count = 0
+        self.total = 0
+
+    def add(self, value, count=1):
+        self.counts[value] = self.counts.get(value, 0) + count
+        self.count += count
+        self.total += value * count
+
+    def mean(self):
+        return self.total / self.count
+
+    def value_at(self, rank):
+        # value at the given 0-based rank, as if all values were sorted
+        seen = 0
+        for value in sorted(self.counts):
+            seen += self.counts[value]
+            if seen > rank:
+                return value
+
+    def median(self):
+        # same as statistics.median: mean of both middle values for an even count
+        if self.count % 2:
+            return self.value_at(self.count // 2)
+        return (self.value_at(self.count // 2 - 1) + self.value_at(self.count // 2)) / 2
+
+    def percentile(self, percent):
+        # same as numpy.percentile, interpolating linearly between ranks
+        rank = percent / 100 * (self.count - 1)
+        low = self.value_at(math.floor(rank))
+        high = self.value_at(math.ceil(rank))
+        return low + (high - low) * (rank - math.floor(rank))
+
+    def min(self):
+        return min(self.counts)
+
+    def max(self):
+        return max(self.counts)
+
+    def bins(self, width):
+        # counts by bins of the given width, centered on its multiples
+        bins = dict()
+        for value, count in self.counts.items():
+            index = round(value / width)
+            bins[index] = bins.get(index, 0) + count
+        return dict(sorted(bins.items()))
+
+
+class OnlineRegression:
+    """
+        Least squares fit of y = slope * x + intercept updated one point at a time
+        (Welford-style centered sums for numerical stability)
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean_x = 0
+        self.mean_y = 0
+        self.sxx = 0
+        self.sxy = 0
+        self.syy = 0
+
+    def add(self, x, y):
+        self.count += 1
+        dx = x - self.mean_x
+        dy = y - self.mean_y
+        self.mean_x += dx / self.count
+        self.mean_y += dy / self.count
+        self.sxx += dx * (x - self.mean_x)
+        self.sxy += dx * (y - self.mean_y)
+        self.syy += dy * (y - self.mean_y)
+
+    @property
+    def slope(self):
+        if self.count < 2 or not self.sxx or math.isnan(self.sxx):
+            return 0
+        return self.sxy / self.sxx
+
+    def predict(self, x):
+        return self.mean_y + self.slope * (x - self.mean_x)
+
+    @property
+    def residual_stddev(self):
+        if self.count < 3:
+            return math.inf
+        return math.sqrt(max(0, self.syy - self.slope * self.sxy) / (self.count - 2))
+
+    @property
+    def slope_stderr(self):
+        if self.count < 3 or not self.sxx:
+            return math.inf
+        return self.residual_stddev / math.sqrt(self.sxx)
+
+    def slope_interval(self, z=1.96):
+        # about 95% confidence interval of the slope (normal approximation)
+        margin = z * self.slope_stderr
+        return self.slope - margin, self.slope + margin
+
+
+class DriftDetector:
+    """
+        Online drift estimation: a regression of delays over the whole run, and
+        one per segment of constant drift, in constant memory
+
+        A new segment starts when delays move away from the current segment fit:
+        two-sided CUSUM of its residuals, in standard errors of prediction (at
+        least min_stddev_ms since perfect captures have no residuals at all),
+        beyond allowance and reaching threshold. Points that raised the CUSUM
+        are kept aside, and seed the next segment if a change is detected, so
+        that they do not bias the current one
+    """
+
+    def __init__(
+        self,
+        allowance=1,
+        threshold=10,
+        min_stddev_ms=2,
+        min_points=30,
+        max_points_aside=32,
+        max_segments=100,
+    ):
+        self.allowance = allowance
+        self.threshold = threshold
+        self.min_stddev_ms = min_stddev_ms
+        self.min_points = min_points
+        self.total = OnlineRegression()
+        self.segment = OnlineRegression()
+        self.segment_start = self.segment_end = None
+        # only the most recent segments are kept
+        self.segments = collections.deque(maxlen=max_segments)
+        self._aside = collections.deque()
+        self._max_points_aside = max_points_aside
+        self._cusum_high = self._cusum_low = 0
+
+    def add(self, x, y):
+        # return True if (x, y) starts a new segment
+        self.total.add(x, y)
+        if self.segment.count < self.min_points:
+            self.add_to_segment(x, y)
+            return False
+        residual = (y - self.segment.predict(x)) / self.get_prediction_stderr(x)
+        self._cusum_high = max(0, self._cusum_high + residual - self.allowance)
+        self._cusum_low = max(0, self._cusum_low - residual - self.allowance)
+        self._aside.append((x, y))
+        if max(self._cusum_high, self._cusum_low) > self.threshold:
+            self.segments.append(describe_segment(self.segment, self.segment_start, self.segment_end))
+            self.segment = OnlineRegression()
+            self.segment_start = None
+            self._cusum_high = self._cusum_low = 0
+            self.flush_aside()
+            return True
+        if not self._cusum_high and not self._cusum_low:
+            # back in line with the current segment
+            self.flush_aside()
+        while len(self._aside) > self._max_points_aside:
+            self.add_to_segment(*self._aside.popleft())
+        return False
+
+    def get_prediction_stderr(self, x):
+        # the further from the points of the segment, the less accurate
+        segment = self.segment
+        stddev = max(self.min_stddev_ms, segment.residual_stddev)
+        leverage = (x - segment.mean_x) ** 2 / segment.sxx if segment.sxx else 0
+        return stddev * math.sqrt(1 + 1 / segment.count + leverage)
+
+    def add_to_segment(self, x, y):
+        if self.segment_start is None:
+            self.segment_start = x
+        self.segment_end = x
+        self.segment.add(x, y)
+
+    def flush_aside(self):
+        while self._aside:
+            self.add_to_segment(*self._aside.popleft())
+
+    def get_segments(self):
+        # closed segments and the current one (including points kept aside)
+        segments = list(self.segments)
+        segment, start, end = copy.copy(self.segment), self.segment_start, self.segment_end
+        for x, y in self._aside:
+            segment.add(x, y)
+            end = x
+        if segment.count:
+            segments.append(describe_segment(segment, start if start is not None else self._aside[0][0], end))
+        return segments
+
+
+def describe_segment(regression, start, end, ndigits=3):
+    low, high = regression.slope_interval()
+    return {
+        "start": start,
+        "end": end,
+        "count": regression.count,
+        "drift_ms_per_s": round(regression.slope, ndigits),
+        "drift_ci95": [round(low, ndigits), round(high, ndigits)] if math.isfinite(low) else None,
+    }
@@ -0,0 +1,51 @@
+import csv
+import glob
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+MEDIA_EXTENSIONS = (".avi", ".flv", ".mkv", ".mov", ".mp4", ".mts", ".qt", ".ts", ".webm")
+SUMMARY_FIELDS = ["media_file", "result_file", "exit_code", "processing_duration", "error"]
+
+
+def find_media_files(inputs):
+    # inputs are media files, directories (media files directly inside) or globs
+    media_files = list()
+    for path in inputs:
+        if os.path.isdir(path):
+            media_files += sorted(
+                os.path.join(path, name)
+                for name in os.listdir(path)
+                if os.path.splitext(name)[1].lower() in MEDIA_EXTENSIONS
+            )
+        elif os.path.isfile(path):
+            media_files.append(path)
+        else:
+            media_files += sorted(glob.glob(path))
+    return list(dict.fromkeys(media_files))
+
+
+def get_csv_fields(results):
+    # nested results (histograms, intervals, drift segments) only go into
+    # the json summary, a field being left out if it is nested for any file
+    fields = list(SUMMARY_FIELDS)
+    nested = set()
+    for result in results:
+        for key, value in result.items():
+            if isinstance(value, (list, tuple, dict)):
+                nested.add(key)
+            elif key not in fields:
+                fields.append(key)
+    return [field for field in fields if field not in nested]
+
+
+def write_summary(summary, summary_prefix):
+    with open("%s.json" % summary_prefix, "w") as f:
+        json.dump(summary, f, indent=2)
+    with open("%s.csv" % summary_prefix, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=get_csv_fields(summary["files"]), extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(summary["files"])
+    logger.info("Wrote summary into %s.json and %s.csv" % (summary_prefix, summary_prefix))
@@ -0,0 +1,180 @@
+import json
+import random
+from fractions import Fraction
+
+from qrlipsync import binary
+from qrlipsync.ticks import TICK_FREQUENCIES
+
+SECOND = 1000000000
+MS = 1000000
+
+
+class SyntheticCapture:
+    """
+        Records qr-lipsync-detect would write for a capture of a
+        qr-lipsync-generate video: one qrcode per frame, and every beep_interval
+        seconds a beep carrying the frequency written in the qrcode
+
+        The capture can be impaired:
+        - delay_ms: constant audio delay
+        - drift_ms: additional audio delay per second of capture
+        - jitter_ms: maximum random offset of qrcode and beep timestamps
+        - drop_rate, dup_rate, backwards_rate: probability per frame of a
+          dropped frame, a duplicated frame, or backwards_frames replayed frames
+        - missing_beep_rate: probability per beep of not being detected
+
+        Frame impairments are only injected away from frames with a beep so
+        that they do not change the expected AV sync. The counters of injected
+        impairments are updated as records are yielded, and the same seed
+        always gives the same capture.
+
+        The capture starts at running time start (in s), since the analyzer
+        considers beeps at 0 as not found
+    """
+    def __init__(
+        self,
+        duration,
+        framerate=30,
+        qrcode_name="CAM1",
+        beep_interval=1,
+        start=1,
+        delay_ms=0,
+        drift_ms=0,
+        jitter_ms=0,
+        drop_rate=0,
+        dup_rate=0,
+        backwards_rate=0,
+        backwards_frames=2,
+        missing_beep_rate=0,
+        seed=None,
+    ):
+        self.framerate = Fraction(framerate).limit_denominator(1001)
+        self.frame_duration = SECOND / self.framerate
+        self.frames_count = int(duration * self.framerate)
+        self.beep_frames = max(1, round(beep_interval * self.framerate))
+        self.qrcode_name = qrcode_name
+        self.start = start
+        self.delay_ms = delay_ms
+        self.drift_ms = drift_ms
+        self.jitter_ms = jitter_ms
+        self.drop_rate = drop_rate
+        self.dup_rate = dup_rate
+        self.backwards_rate = backwards_rate
+        self.backwards_frames = backwards_frames
+        self.missing_beep_rate = missing_beep_rate
+        self.random = random.Random(seed)
+
+        self.beeps = 0
+        self.dropped_frames = 0
+        self.duplicated_frames = 0
+        self.backwards_jumps = 0
+        self.missing_beeps = 0
+
+    def get_timestamp(self, index):
+        return int(self.start * SECOND + index * self.frame_duration)
+
+    def get_jitter(self):
+        if not self.jitter_ms:
+            return 0
+        return round(self.random.uniform(-self.jitter_ms, self.jitter_ms) * MS)
+
+    def get_freq(self, index):
+        if index % self.beep_frames == 0:
+            return TICK_FREQUENCIES[(index // self.beep_frames) % len(TICK_FREQUENCIES)]
+
+    def can_impair(self, index):
+        # the frames replayed by a backwards jump must not carry a beep either
+        offset = index % self.beep_frames
+        return (
+            offset > self.backwards_frames
+            and offset < self.beep_frames - 1
+            and index < self.frames_count - 1
+        )
+
+    def get_impairment(self, index):
+        if not self.can_impair(index):
+            return
+        draw = self.random.random()
+        for impairment, rate in (
+            ("drop", self.drop_rate),
+            ("dup", self.dup_rate),
+            ("backwards", self.backwards_rate),
+        ):
+            if draw < rate:
+                return impairment
+            draw -= rate
+
+    def get_qrcode(self, index, timestamp):
+        record = {
+            "TIMESTAMP": self.get_timestamp(index),
+            "BUFFERCOUNT": index + 1,
+            "FRAMERATE": "%s/%s" % (self.framerate.numerator, self.framerate.denominator),
+            "NAME": self.qrcode_name,
+        }
+        freq = self.get_freq(index)
+        if freq:
+            record[binary.CUSTOM_DATA_NAME] = str(freq)
+        record["ELEMENTNAME"] = "qrcode_detector"
+        record["VIDEOTIMESTAMP"] = timestamp
+        return record
+
+    def get_beep(self, index):
+        timestamp = self.get_timestamp(index)
+        elapsed_s = index * self.frame_duration / SECOND
+        delay = round((self.delay_ms + self.drift_ms * elapsed_s) * MS)
+        return {
+            "ELEMENTNAME": "spectrum",
+            "TIMESTAMP": timestamp + delay + self.get_jitter(),
+            "PEAK": -30.0,
+            "FREQ": self.get_freq(index),
+        }
+
+    def records(self):
+        for index in range(self.frames_count):
+            timestamp = self.get_timestamp(index)
+            impairment = self.get_impairment(index)
+            if impairment == "drop":
+                self.dropped_frames += 1
+                continue
+            yield self.get_qrcode(index, timestamp + self.get_jitter())
+            if impairment == "dup":
+                self.duplicated_frames += 1
+                yield self.get_qrcode(index, int(timestamp + self.frame_duration / 2))
+            elif impairment == "backwards":
+                # the last frames are shown again within one frame duration
+                self.backwards_jumps += 1
+                replayed = self.backwards_frames + 1
+                for i in range(1, replayed + 1):
+                    yield self.get_qrcode(
+                        index - replayed + i, int(timestamp + i * self.frame_duration / (replayed + 1))
+                    )
+            if self.get_freq(index):
+                self.beeps += 1
+                if self.random.random() < self.missing_beep_rate:
+                    self.missing_beeps += 1
+                else:
+                    yield self.get_beep(index)
+        duration = self.get_timestamp(self.frames_count)
+        yield {"AUDIODURATION": duration, "VIDEODURATION": duration}
+
+
+def generate_records(duration, framerate=30, qrcode_name="CAM1", beep_interval=1, start=1, **impairments):
+    # records of a capture without any impairment unless specified
+    return SyntheticCapture(duration, framerate, qrcode_name, beep_interval, start, **impairments).records()
+
+
+def write_data_file(path, records, binary_format=False):
+    # records are written one at a time, so that files of any size can be made
+    count = 0
+    if binary_format:
+        with open(path, "wb") as f:
+            f.write(binary.get_header())
+            for record in records:
+                f.write(binary.pack_record(record))
+                count += 1
+    else:
+        with open(path, "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+                count += 1
+    return count
@@ -0,0 +1,185 @@
+import math
+
+import numpy as np
+
+SECOND = 1000000000
+
+# frequencies of the ticks rendered by qr-lipsync-generate
+TICK_FREQUENCIES = tuple(range(240, 10081, 240))
+
+# frequency resolution needed to tell apart ticks generated 240 Hz apart
+MAX_BAND_WIDTH_HZ = 100
+# samples are analyzed by batches of at least this duration (in s)
+CHUNK_DURATION_S = 0.5
+# the onset of a tick is where its amplitude reaches half of its peak (-6 dB)
+ONSET_RATIO_DB = 20 * math.log10(0.5)
+
+
+class TickDetector:
+    """
+        Detect audio ticks (short sine bursts) in raw mono float PCM with a
+        short-time Fourier transform computed by batches of frames, yielding the
+        same information as the spectrum element based detection with a finer
+        time resolution (one frame every hop_ms)
+
+        A tick is reported once the same frequency has been the loudest one for
+        min_tick_duration_ms; its timestamp is where the tick amplitude reaches
+        half of its peak, interpolated between frame centers
+    """
+
+    def __init__(self, samplerate, threshold_db, min_freq, min_tick_duration_ms, hop_ms=1):
+        self.samplerate = samplerate
+        self.threshold_db = threshold_db
+        self.min_freq = min_freq
+        self.window_size = self.get_window_size()
+        self.hop = max(1, int(samplerate * hop_ms / 1000))
+        self.set_min_tick_duration(min_tick_duration_ms)
+        self.chunk_size = max(int(samplerate * CHUNK_DURATION_S), self.window_size)
+        self.window = np.hanning(self.window_size).astype(np.float32)
+        # so that a full scale sine is at 0 dB
+        self.scale = 2 / float(np.sum(self.window))
+
+        self._samples = np.empty(0, dtype=np.float32)
+        self._timestamp = None
+
+        self._last_band = None
+        self._last_freq = 0
+        self._last_band_count = 0
+        # (timestamp, magnitude in dB) of the frames of the current tick
+        self._tick_frames = list()
+
+    def get_window_size(self):
+        return 2 ** math.ceil(math.log2(self.samplerate / MAX_BAND_WIDTH_HZ))
+
+    def set_min_tick_duration(self, duration_ms):
+        hop_ms = 1000 * self.hop / self.samplerate
+        self.count_threshold = max(1, int(duration_ms / hop_ms))
+
+    def process(self, samples, timestamp):
+        # samples starting at timestamp (running time in ns); return the ticks
+        # found as (timestamp in ns, frequency in Hz, peak in dB) tuples
+        if self._timestamp is not None:
+            expected = self._timestamp + len(self._samples) * SECOND / self.samplerate
+            if abs(timestamp - expected) > 2 * SECOND / self.samplerate:
+                # discontinuity, start over from this buffer
+                self._samples = np.empty(0, dtype=np.float32)
+                self._timestamp = None
+        if self._timestamp is None:
+            self._timestamp = timestamp
+        self._samples = np.concatenate((self._samples, samples))
+        if len(self._samples) >= self.chunk_size:
+            return self.flush()
+        return list()
+
+    def flush(self):
+        # analyze all complete frames received so far
+        frames_count = (len(self._samples) - self.window_size) // self.hop + 1
+        if frames_count <= 0:
+            return list()
+        centers = np.arange(frames_count) * self.hop + self.window_size / 2
+        timestamps = self._timestamp + centers * SECOND / self.samplerate
+        magnitudes, freqs = self.get_magnitudes(self._samples, frames_count)
+        ticks = self.find_ticks(magnitudes, freqs, timestamps)
+
+        consumed = frames_count * self.hop
+        self._samples = self._samples[consumed:]
+        self._timestamp += consumed * SECOND / self.samplerate
+        return ticks
+
+    def get_magnitudes(self, samples, frames_count):
+        # return the linear magnitude of each band for each frame and the
+        # frequency of each band
+        frames = np.lib.stride_tricks.sliding_window_view(samples, self.window_size)
+        frames = frames[::self.hop][:frames_count]
+        spectrum = np.abs(np.fft.rfft(frames * self.window, axis=1)) * self.scale
+        freqs = np.fft.rfftfreq(self.window_size, 1 / self.samplerate)
+        return spectrum, freqs
+
+    def get_peak_freqs(self, magnitudes, freqs, bands):
+        # refine the frequency of the loudest bands with a parabolic interpolation
+        rows = np.arange(len(bands))
+        inner = np.clip(bands, 1, magnitudes.shape[1] - 2)
+        before, peak, after = (
+            np.log(magnitudes[rows, inner + offset] + 1e-12) for offset in (-1, 0, 1)
+        )
+        curvature = before - 2 * peak + after
+        delta = np.where(curvature < 0, 0.5 * (before - after) / np.where(curvature < 0, curvature, 1), 0)
+        band_width = freqs[1] - freqs[0]
+        return freqs[bands] + np.where(bands == inner, delta, 0) * band_width
+
+    def find_ticks(self, magnitudes, freqs, timestamps):
+        # ignore lowest frequencies
+        first_band = int(np.searchsorted(freqs, self.min_freq))
+        bands = np.argmax(magnitudes[:, first_band:], axis=1) + first_band
+        peaks_db = 20 * np.log10(magnitudes[np.arange(len(bands)), bands] + 1e-12)
+        peak_freqs = self.get_peak_freqs(magnitudes, freqs, bands)
+        valid = np.flatnonzero((peaks_db > self.threshold_db) & (peak_freqs > self.min_freq))
+
+        ticks = list()
+        # only loud frames go through the same logic as the spectrum based detection
+        for i in valid.tolist():
+            band = int(bands[i])
+            if band == self._last_band:
+                self._last_band_count += 1
+            else:
+                self._last_band = band
+                self._last_freq = int(peak_freqs[i])
+                self._last_band_count = 0
+                self._tick_frames = list()
+            if self._last_band_count <= self.count_threshold:
+                self._tick_frames.append((float(timestamps[i]), float(peaks_db[i])))
+            if self._last_band_count == self.count_threshold:
+                ticks.append(self.get_tick())
+        return ticks
+
+    def get_tick(self):
+        peak_db = max(magnitude for _, magnitude in self._tick_frames)
+        onset_db = peak_db + ONSET_RATIO_DB
+        for i, (timestamp, magnitude) in enumerate(self._tick_frames):
+            if magnitude >= onset_db:
+                if i:
+                    # interpolate linearly (in amplitude) from the previous frame
+                    previous_timestamp, previous_magnitude = self._tick_frames[i - 1]
+                    previous, current, onset = (10 ** (m / 20) for m in (previous_magnitude, magnitude, onset_db))
+                    timestamp = previous_timestamp + (timestamp - previous_timestamp) * (onset - previous) / (current - previous)
+                return timestamp, self._last_freq, peak_db
+
+
+class GoertzelTickDetector(TickDetector):
+    """
+        Only look at the known tick frequencies: each frequency gets a
+        Goertzel filter (a single DFT bin) over a rectangular window computed
+        for every frame at once from running sums of the demodulated signal,
+        which is cheaper than a full spectrum and ignores noise elsewhere
+
+        The window lasts one period of the spacing between frequencies, so that
+        all of them fall on exact bins and do not leak into each other
+    """
+
+    def __init__(self, samplerate, frequencies, threshold_db, min_freq, min_tick_duration_ms, hop_ms=0.25):
+        self.frequencies = np.array(sorted(frequencies), dtype=np.float64)
+        super().__init__(samplerate, threshold_db, min_freq, min_tick_duration_ms, hop_ms)
+        self._phasors = np.empty((len(self.frequencies), 0), dtype=np.complex128)
+
+    def get_window_size(self):
+        spacing = np.gcd.reduce(self.frequencies.astype(np.int64))
+        return int(round(self.samplerate / spacing))
+
+    def get_phasors(self, length):
+        if self._phasors.shape[1] < length:
+            # chunks have slightly different sizes, avoid recomputing for each one
+            n = np.arange(2 * length)
+            self._phasors = np.exp(-2j * np.pi * np.outer(self.frequencies, n) / self.samplerate)
+        return self._phasors[:, :length]
+
+    def get_magnitudes(self, samples, frames_count):
+        demodulated = samples * self.get_phasors(len(samples))
+        sums = np.zeros((len(self.frequencies), len(samples) + 1), dtype=np.complex128)
+        np.cumsum(demodulated, axis=1, out=sums[:, 1:])
+        starts = np.arange(frames_count) * self.hop
+        bins = sums[:, starts + self.window_size] - sums[:, starts]
+        # so that a full scale sine is at 1
+        return (np.abs(bins) * 2 / self.window_size).T, self.frequencies
+
+    def get_peak_freqs(self, magnitudes, freqs, bands):
+        return freqs[bands]
@@ -0,0 +1,179 @@
+import csv
+import logging
+import statistics
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# events counted in each window
+COUNT_COLUMNS = ("frames", "dropped_frames", "duplicated_frames", "missing_beeps")
+COLUMNS = (
+    "start_s",
+    "frames",
+    "framerate",
+    "dropped_frames",
+    "duplicated_frames",
+    "beeps",
+    "median_delay_ms",
+    "missing_beeps",
+)
+
+
+def parse_windows(windows):
+    # "1,10,60" -> [1.0, 10.0, 60.0]
+    return sorted({float(w) for w in windows.split(",") if w.strip()})
+
+
+def format_window(window_s):
+    return "%gs" % window_s
+
+
+def read_csv(path):
+    # columns of a time series csv file, nan where there was no delay
+    with open(path, newline="") as f:
+        rows = list(csv.reader(f))[1:]
+    columns = dict()
+    for index, name in enumerate(COLUMNS):
+        values = [float(row[index]) if row[index] else np.nan for row in rows]
+        if name in ("start_s", "framerate", "median_delay_ms"):
+            columns[name] = np.array(values, dtype=np.float64)
+        else:
+            columns[name] = np.array(values, dtype=np.int64)
+    return columns
+
+
+class WindowedSeries:
+    """
+        Lipsync metrics aggregated over consecutive windows of window_s
+        seconds of running time: distinct frames (and the effective framerate
+        they give), dropped and duplicated frames, the number of beeps found
+        with their median delay, and missed beeps
+
+        Events can be added one at a time or as whole arrays, in any order.
+        Once written into a csv file with flush(), windows are forgotten, so
+        that memory stays constant when events are added in about time order
+    """
+
+    def __init__(self, window_s):
+        self.window_s = window_s
+        # index of the first window kept in memory
+        self._offset = 0
+        self._counts = np.zeros((0, len(COUNT_COLUMNS)), dtype=np.int64)
+        # window -> delays in ms
+        self._delays = dict()
+        self._file = None
+        self._writer = None
+        # events of windows already written, which are left out
+        self.late_events = 0
+
+    def get_rows(self, timestamps):
+        # rows of _counts for these timestamps, growing it as needed;
+        # negative for windows already written
+        rows = np.maximum(np.floor_divide(timestamps, self.window_s), 0).astype(np.int64) - self._offset
+        last = int(np.max(rows, initial=-1))
+        if last >= len(self._counts):
+            # grow by doubling so that adding events in time order is amortized
+            grown = np.zeros((max(last + 1, 2 * len(self._counts)), len(COUNT_COLUMNS)), dtype=np.int64)
+            grown[:len(self._counts)] = self._counts
+            self._counts = grown
+        return rows
+
+    def add(self, column, timestamps, counts=1):
+        # add counts (a scalar or one count per timestamp) to a COUNT_COLUMNS column
+        rows = self.get_rows(timestamps)
+        kept = rows >= 0
+        self.late_events += int(np.count_nonzero(~kept))
+        counts = np.broadcast_to(counts, rows.shape)
+        np.add.at(self._counts[:, COUNT_COLUMNS.index(column)], rows[kept], counts[kept])
+
+    def count(self, column, timestamp, count=1):
+        # same as add for a single event, without the overhead of arrays
+        row = max(int(timestamp // self.window_s), 0) - self._offset
+        if row < 0:
+            self.late_events += 1
+            return
+        if row >= len(self._counts):
+            self.get_rows(timestamp)
+        self._counts[row, COUNT_COLUMNS.index(column)] += count
+
+    def add_delay(self, timestamp, delay_ms):
+        window = max(int(timestamp // self.window_s), 0)
+        if window < self._offset:
+            self.late_events += 1
+            return
+        self._delays.setdefault(window, list()).append(delay_ms)
+
+    def get_length(self):
+        # number of windows kept in memory, up to the last one with an event
+        used = np.flatnonzero(self._counts.any(axis=1))
+        last = int(used[-1]) + 1 if len(used) else 0
+        if self._delays:
+            last = max(last, max(self._delays) - self._offset + 1)
+        return last
+
+    def iter_rows(self, length):
+        # rows of COLUMNS values of the first length windows kept in memory
+        counts = self._counts[:length].tolist()
+        counts += [[0] * len(COUNT_COLUMNS)] * (length - len(counts))
+        for row, (frames, dropped, duplicated, missing) in enumerate(counts):
+            window = self._offset + row
+            delays = self._delays.get(window, ())
+            yield (
+                window * self.window_s,
+                frames,
+                round(frames / self.window_s, 2),
+                dropped,
+                duplicated,
+                len(delays),
+                float(statistics.median(delays)) if delays else np.nan,
+                missing,
+            )
+
+    def get_columns(self):
+        # one array per column of COLUMNS, for the windows kept in memory
+        rows = list(self.iter_rows(self.get_length()))
+        columns = dict()
+        for index, name in enumerate(COLUMNS):
+            dtype = np.float64 if name in ("start_s", "framerate", "median_delay_ms") else np.int64
+            columns[name] = np.array([row[index] for row in rows], dtype=dtype)
+        return columns
+
+    def open_csv(self, path):
+        self._file = open(path, "w", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(COLUMNS)
+
+    def flush(self, before_s=None):
+        # write the windows ending before before_s (all of them if None) into
+        # the csv file and forget them
+        if before_s is None:
+            length = self.get_length()
+        else:
+            length = int(before_s // self.window_s) - self._offset
+            if length <= 0:
+                return
+        for row in self.iter_rows(length):
+            # empty cells for windows without any delay
+            self._writer.writerow(["" if value != value else value for value in row])
+        for window in range(self._offset, self._offset + length):
+            self._delays.pop(window, None)
+        self._counts = self._counts[length:].copy()
+        self._offset += length
+
+    def close(self):
+        self.flush()
+        self._file.close()
+        if self.late_events:
+            logger.warning(
+                "%s events were too late to be counted in the %s time series"
+                % (self.late_events, format_window(self.window_s))
+            )
+
+    def write_csv(self, path):
+        self.open_csv(path)
+        self.close()
+
+    def write_npz(self, path, csv_path):
+        # from the csv file, since written windows are not kept in memory
+        np.savez_compressed(path, window_s=self.window_s, **read_csv(csv_path))
@@ -1,6 +1,14 @@
+from qrlipsync import binary, incremental
 from qrlipsync.analyze import QrLipsyncAnalyzer
+from qrlipsync.incremental import QrLipsyncIncrementalAnalyzer
+from qrlipsync.synthetic import generate_records, write_data_file
+import glob
+import json
 import os
 
+import numpy as np
+import pytest
+
 os.environ["QRLIPSYNC_MIN_ACCEL_SAMPLES"] = "1"
 
 
@@ -86,3 +94,174 @@ def test_nobeeps():
     assert results['matching_missing'] == 30
     assert results['av_delay_accel'] == "could not measure"
     assert exit_code == 0
+
+
+def test_video_stats_frame_jumps():
+    q = QrLipsyncAnalyzer('unused_data.txt', Options())
+    # 1 duplicate (5), 2 dropped (8, 9) then backwards jumps (10 > 7, 8 > 1)
+    frame_numbers = [1, 2, 3, 4, 5, 5, 6, 7, 10, 7, 8, 1, 2, 3]
+    frame_numbers += list(range(4, 100))
+    for i, frame_number in enumerate(frame_numbers):
+        timestamp = i / 30
+        q.all_qrcodes.append(timestamp, timestamp, frame_number, 30, -1)
+    q.all_qrcodes.append(4, 4, 100, 30, -1)
+    q.check_video_stats()
+    assert q.duplicated_frames_count == 1
+    assert q.dropped_frames_count == 2
+    assert q.all_qrcode_framerates == [28, 30, 30, 21]
+
+
+def get_framerates_one_by_one(timestamps, counted, frame_duration):
+    # as the original analyzer computed them, one qrcode at a time
+    framerates = list()
+    framerate = 0
+    end_timestamp = None
+    for i, timestamp in enumerate(timestamps):
+        if i and counted[i - 1]:
+            framerate += 1
+        if end_timestamp is None:
+            end_timestamp = int(timestamp) + 1 - frame_duration
+        elif timestamp >= end_timestamp:
+            framerates.append(framerate)
+            end_timestamp = None
+            framerate = 0
+    return framerates
+
+
+def test_framerates_out_of_order():
+    rng = np.random.default_rng(1)
+    q = QrLipsyncAnalyzer('unused_data.txt', Options())
+    timestamps = np.arange(3000) / 30 + rng.uniform(-0.2, 0.2, 3000)
+    # a few timestamps far in the future, which the following windows went past
+    timestamps[rng.integers(0, 3000, 20)] += 50
+    counted = rng.random(2999) < 0.95
+    framerates = q.get_framerates(timestamps, counted, 1 / 30)
+    assert framerates == get_framerates_one_by_one(timestamps, counted, 1 / 30)
+
+
+@pytest.mark.parametrize('input_file', glob.glob('tests/*_data.txt'))
+def test_incremental_matches_batch(input_file):
+    options = Options()
+    batch_results, batch_exit_code = analyze_file(input_file)
+    q = QrLipsyncIncrementalAnalyzer(input_file, options)
+    with open(input_file) as f:
+        for line in f:
+            q.feed(line)
+    q.finish()
+    results = q.snapshot()
+    assert results == batch_results
+    assert q.get_exit_code(results) == batch_exit_code
+
+
+@pytest.mark.parametrize('input_file', glob.glob('tests/*_data.txt'))
+def test_fed_records_match_file(input_file):
+    # as done by the detector with records kept in memory
+    q = QrLipsyncAnalyzer(input_file, Options())
+    with open(input_file) as f:
+        for line in f:
+            q.feed(json.loads(line))
+    q.finish()
+    results = q.get_results_dict()
+    assert (results, q.get_exit_code(results)) == analyze_file(input_file)
+
+
+def test_incremental_windows_add_up():
+    input_file = 'tests/duplicated_data.txt'
+    total = QrLipsyncIncrementalAnalyzer(input_file, Options())
+    window = total.new_window()
+    windows = list()
+    with open(input_file) as f:
+        for i, line in enumerate(f):
+            total.feed(line)
+            window.feed(line)
+            if i % 200 == 199:
+                windows.append(window.snapshot())
+                window = window.new_window()
+    total.finish()
+    window.finish()
+    windows.append(window.snapshot())
+    results = total.snapshot()
+    for k in ['duplicated_frames', 'dropped_frames', 'total_frames', 'total_beeps', 'matching_missing']:
+        assert sum(w[k] for w in windows) == results[k]
+
+
+def test_beeps_out_of_order(tmp_path):
+    # a beep found later in time but written first is the one matched, as
+    # the incremental analyzer and the original analyzer match them
+    records = list(generate_records(12))
+    beeps = [i for i, record in enumerate(records) if record.get('ELEMENTNAME') == 'spectrum']
+    early = dict(records[beeps[5]], TIMESTAMP=records[beeps[5]]['TIMESTAMP'] + 200 * 1000000)
+    records.insert(beeps[5], early)
+    data_file = str(tmp_path / 'data.txt')
+    write_data_file(data_file, records)
+    q = QrLipsyncAnalyzer(data_file, Options())
+    q.start()
+    results = q.get_results_dict()
+    assert q.max_delay_ms == 200
+    assert sorted(q.audio_video_delays_ms) == [0] * (len(beeps) - 1) + [200]
+    incremental = QrLipsyncIncrementalAnalyzer(data_file, Options())
+    incremental.start()
+    assert incremental.get_results_dict() == results
+
+
+def test_find_beeps_file_order():
+    rng = np.random.default_rng(2)
+    q = QrLipsyncAnalyzer('unused_data.txt', Options())
+    beeps = [(float(ts), int(freq)) for ts, freq in zip(rng.uniform(0, 100, 300), rng.choice([1000, 1030, 2000], 300))]
+    for timestamp, freq in beeps:
+        q.all_audio_beeps.append(timestamp, -30.0, freq)
+    timestamps = rng.uniform(0, 100, 200)
+    frequencies = rng.choice([1000, 2000, 3000], 200)
+    found = q.find_beeps(timestamps, frequencies, 5)
+    for timestamp, frequency, beep_ts in zip(timestamps, frequencies, found):
+        in_file_order = [
+            ts for ts, freq in beeps
+            if timestamp - 2.5 < ts < timestamp + 2.5 and abs(freq - frequency) < 50
+        ]
+        if in_file_order:
+            assert beep_ts == in_file_order[0]
+        else:
+            assert np.isnan(beep_ts)
+
+
+def test_incremental_pending_overflow(monkeypatch):
+    # without any beep, qrcodes that overflow the pending ones are missing beeps
+    monkeypatch.setattr(incremental, 'MAX_PENDING_QRCODES', 4)
+    q = QrLipsyncIncrementalAnalyzer('data.txt', Options())
+    qrcodes = [
+        record for record in generate_records(12)
+        if record.get('ELEMENTNAME') == 'qrcode_detector'
+    ]
+    for record in qrcodes:
+        q.feed(record)
+    with_freq = sum(1 for record in qrcodes if 'TICKFREQ' in record)
+    assert with_freq > 4
+    assert q.missing_beeps_count == with_freq - 4
+    q.finish()
+    assert q.missing_beeps_count == with_freq
+
+
+@pytest.mark.parametrize('input_file', glob.glob('tests/*_data.txt'))
+def test_binary_matches_json(input_file, tmp_path):
+    binary_file = str(tmp_path / 'data.bin')
+    with open(input_file) as i, open(binary_file, 'wb') as o:
+        o.write(binary.get_header())
+        for line in i:
+            o.write(binary.pack_record(json.loads(line)))
+    assert analyze_file(binary_file) == analyze_file(input_file)
+
+
+def test_binary_name_length():
+    record = {
+        'TIMESTAMP': 0,
+        'BUFFERCOUNT': 1,
+        'FRAMERATE': '30/1',
+        'NAME': 'A' * 15,
+        'ELEMENTNAME': 'qrcode_detector',
+        'VIDEOTIMESTAMP': 0,
+    }
+    data = binary.pack_record(record)
+    assert binary.unpack_record(np.frombuffer(data, dtype=binary.RECORD_DTYPE)[0]) == record
+    record['NAME'] = 'A' * 16
+    with pytest.raises(ValueError):
+        binary.pack_record(record)
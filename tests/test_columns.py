@@ -0,0 +1,23 @@
+import numpy as np
+
+from qrlipsync.columns import ColumnStore
+
+
+def test_append_across_chunks():
+    store = ColumnStore((("timestamp", np.float64), ("freq", np.int64)), chunk_size=4)
+    for i in range(10):
+        store.append(i / 10, i * 240)
+    assert len(store) == 10
+    assert store.column("freq").tolist() == [i * 240 for i in range(10)]
+    store.append(1.0, 2400)
+    assert store.column("timestamp")[-1] == 1.0
+    assert len(store.column("freq")) == 11
+
+
+def test_extend_then_append():
+    store = ColumnStore((("timestamp", np.float64), ("freq", np.int64)), chunk_size=4)
+    store.append(0.0, 240)
+    store.extend(timestamp=np.array([1.0, 2.0]), freq=np.array([480, 720]))
+    store.append(3.0, 960)
+    assert store.column("timestamp").tolist() == [0.0, 1.0, 2.0, 3.0]
+    assert store.column("freq").tolist() == [240, 480, 720, 960]
@@ -40,6 +40,8 @@ def test_generate_and_analyze_pcm():
     assert r['video_duration'] == 30.0
     assert r['audio_duration'] == 30.0
     assert r['matching_missing'] == 0
+    # time series are only written on demand
+    assert not [name for name in os.listdir('.') if '.windows_' in name]
 
 
 def test_generate_and_analyze_aac():
@@ -107,3 +109,220 @@ def test_generate_and_analyze_noaudio():
     assert r['video_duration'] == 30.0
     assert r['audio_duration'] == 0
     assert r['matching_missing'] == 0
+
+
+def test_generate_and_detect_incremental():
+    assert run_cmd('generate.py')[0] == 0
+    assert run_cmd('detect.py --incremental cam1-qrcode-blue-30.qt')[0] == 0
+    with open('cam1-qrcode-blue-30_data.report.json', 'r') as f:
+        r = json.load(f)
+
+    assert r['duplicated_frames'] == 0
+    assert r['dropped_frames'] == 0
+    assert r['total_frames'] == 900
+    assert r['avg_real_framerate'] == 30
+    assert r['median_av_delay_ms'] == 0
+    assert r['video_duration'] == 30.0
+    assert r['audio_duration'] == 30.0
+    assert r['matching_missing'] == 0
+
+
+def test_monitor_udp_stream():
+    assert run_cmd('generate.py -f mp4')[0] == 0
+    sender = subprocess.Popen(
+        'gst-launch-1.0 filesrc location=cam1-qrcode-blue-30.mp4 ! qtdemux name=d '
+        'mpegtsmux name=mux ! udpsink host=127.0.0.1 port=5004 sync=true '
+        'd.video_0 ! queue ! h264parse ! mux. d.audio_0 ! queue ! aacparse ! mux.'.split(' '),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        assert run_cmd('detect.py --monitor-interval 2 --monitor-duration 12 udp://127.0.0.1:5004')[0] == 0
+    finally:
+        sender.kill()
+    with open('udp_127_0_0_1_5004_data.monitor.json', 'r') as f:
+        r = json.load(f)
+
+    assert r['window_end'] > r['window_start']
+    assert r['window']['dropped_frames'] == 0
+    assert r['total']['total_frames'] > 0
+    assert os.path.getsize('udp_127_0_0_1_5004_data.txt') < 100000
+    # report files would grow for as long as the source runs
+    assert not os.path.exists('udp_127_0_0_1_5004_data.graph.txt')
+
+
+def test_generate_and_analyze_binary():
+    assert run_cmd('generate.py')[0] == 0
+    assert run_cmd('detect.py -s --binary cam1-qrcode-blue-30.qt')[0] == 0
+    assert run_cmd('analyze.py cam1-qrcode-blue-30_data.bin')[0] == 0
+    with open('cam1-qrcode-blue-30_data.report.json', 'r') as f:
+        r = json.load(f)
+
+    assert r['duplicated_frames'] == 0
+    assert r['dropped_frames'] == 0
+    assert r['total_frames'] == 900
+    assert r['median_av_delay_ms'] == 0
+    assert r['matching_missing'] == 0
+
+
+@pytest.mark.parametrize("audio_detector", ["fft", "goertzel"])
+def test_generate_and_analyze_numpy_ticks(audio_detector):
+    assert run_cmd('generate.py')[0] == 0
+    assert run_cmd(f'detect.py -s --audio-detector {audio_detector} cam1-qrcode-blue-30.qt')[0] == 0
+    assert run_cmd('analyze.py cam1-qrcode-blue-30_data.txt')[0] == 0
+    with open('cam1-qrcode-blue-30_data.report.json', 'r') as f:
+        r = json.load(f)
+
+    assert r['total_beeps'] == 30
+    assert abs(r['median_av_delay_ms']) < 2
+    assert r['audio_duration'] == 30.0
+    assert r['matching_missing'] == 0
+
+
+@pytest.mark.parametrize('detect_args', ['', '--sync-results', '--sync-spectrum'])
+def test_generate_and_analyze_parallel(detect_args):
+    assert run_cmd('generate.py')[0] == 0
+    # the preroll frame of the first segment is not recorded before seeking
+    assert run_cmd('detect.py -s --jobs 3 %s cam1-qrcode-blue-30.qt' % detect_args)[0] == 0
+    with open('cam1-qrcode-blue-30_data.txt', 'r') as f:
+        records = [json.loads(line) for line in f]
+    frames = [r['BUFFERCOUNT'] for r in records if r.get('ELEMENTNAME') == 'qrcode_detector']
+    # segments are merged in order, without duplicates at their boundaries
+    assert frames == sorted(set(frames))
+    assert run_cmd('analyze.py cam1-qrcode-blue-30_data.txt')[0] == 0
+    with open('cam1-qrcode-blue-30_data.report.json', 'r') as f:
+        r = json.load(f)
+
+    assert r['duplicated_frames'] == 0
+    assert r['dropped_frames'] == 0
+    assert r['total_frames'] == 900
+    assert r['total_beeps'] == 30
+    assert r['median_av_delay_ms'] == 0
+    assert r['video_duration'] == 30.0
+    assert r['matching_missing'] == 0
+
+
+def test_batch():
+    assert run_cmd('generate.py')[0] == 0
+    assert run_cmd('generate.py -f mp4')[0] == 0
+    assert run_cmd('batch.py --workers 2 .')[0] == 0
+    with open('qr-lipsync-batch.json', 'r') as f:
+        summary = json.load(f)
+
+    assert summary['total_files'] == 2
+    assert summary['failed_files'] == 0
+    assert summary['files_per_minute'] > 0
+    for r in summary['files']:
+        assert r['total_frames'] == 900
+        assert r['matching_missing'] == 0
+    # per file reports are written next to each file
+    assert os.path.isfile('cam1-qrcode-blue-30_data.report.json')
+    with open('qr-lipsync-batch.csv', 'r') as f:
+        assert len(f.readlines()) == 3
+
+
+def test_generate_and_analyze_adaptive_roi():
+    assert run_cmd('generate.py')[0] == 0
+    ret, out = run_cmd('detect.py -s --adaptive-roi cam1-qrcode-blue-30.qt')
+    assert ret == 0
+    assert 'Found qrcode region of interest' in out
+    assert run_cmd('analyze.py cam1-qrcode-blue-30_data.txt')[0] == 0
+    with open('cam1-qrcode-blue-30_data.report.json', 'r') as f:
+        r = json.load(f)
+
+    # frames missed in the region of interest are found in the whole frame
+    assert r['duplicated_frames'] == 0
+    assert r['dropped_frames'] == 0
+    assert r['total_frames'] == 900
+    assert r['median_av_delay_ms'] == 0
+    assert r['matching_missing'] == 0
+
+
+def test_generate_and_analyze_discovered_area():
+    assert run_cmd('generate.py')[0] == 0
+    ret, out = run_cmd('detect.py -s --discover-area cam1-qrcode-blue-30.qt')
+    assert ret == 0
+    assert 'Using --area' in out
+    assert run_cmd('analyze.py cam1-qrcode-blue-30_data.txt')[0] == 0
+    with open('cam1-qrcode-blue-30_data.report.json', 'r') as f:
+        r = json.load(f)
+
+    assert r['dropped_frames'] == 0
+    assert r['total_frames'] == 900
+    assert r['matching_missing'] == 0
+
+
+def test_generate_and_analyze_luma():
+    assert run_cmd('generate.py -f mp4')[0] == 0
+    ret, out = run_cmd('detect.py -s --luma --decoder-threads 2 cam1-qrcode-blue-30.mp4')
+    assert ret == 0
+    assert 'Setting max-threads=2' in out
+    assert 'Scanning GRAY8 frames' in out or 'Scanning Y800 frames' in out
+    assert run_cmd('analyze.py cam1-qrcode-blue-30_data.txt')[0] == 0
+    with open('cam1-qrcode-blue-30_data.report.json', 'r') as f:
+        r = json.load(f)
+
+    assert r['dropped_frames'] == 0
+    assert r['total_frames'] == 900
+    assert r['matching_missing'] == 0
+
+
+def test_generate_and_analyze_sync_results():
+    assert run_cmd('generate.py')[0] == 0
+    ret, out = run_cmd('detect.py -s --sync-results --results-queue-size 10 cam1-qrcode-blue-30.qt')
+    assert ret == 0
+    assert 'Peak results queue depth' in out
+    assert 'Peak bus queue depth' in out
+    assert run_cmd('analyze.py cam1-qrcode-blue-30_data.txt')[0] == 0
+    with open('cam1-qrcode-blue-30_data.report.json', 'r') as f:
+        r = json.load(f)
+
+    assert r['dropped_frames'] == 0
+    assert r['total_frames'] == 900
+    assert r['total_beeps'] == 30
+    assert r['median_av_delay_ms'] == 0
+    assert r['matching_missing'] == 0
+
+
+def test_generate_and_detect_stats():
+    assert run_cmd('generate.py')[0] == 0
+    ret, out = run_cmd('detect.py -s --stats --downscale-width 320 cam1-qrcode-blue-30.qt')
+    assert ret == 0
+    assert 'Wrote stats into' in out
+    with open('cam1-qrcode-blue-30_data.stats.json', 'r') as f:
+        s = json.load(f)
+
+    assert s['stages']['zbar']['count'] == 900
+    assert s['stages']['video_decode']['count'] > 0
+    assert s['stages']['scale_convert']['count'] > 0
+    assert s['stages']['handle_barcode']['count'] == 900
+    assert s['counters']['barcode_messages']['count'] == 900
+    assert s['counters']['spectrum_messages']['count'] > 0
+    assert s['stages']['write']['count'] > 900
+    assert 'scaleq' in s['queues']
+
+
+def test_generate_and_detect_bounded_memory():
+    assert run_cmd('generate.py')[0] == 0
+    assert run_cmd('detect.py --bounded-memory --binary cam1-qrcode-blue-30.qt')[0] == 0
+    with open('cam1-qrcode-blue-30_data.report.json', 'r') as f:
+        r = json.load(f)
+
+    assert r['dropped_frames'] == 0
+    assert r['total_frames'] == 900
+    assert r['total_beeps'] == 30
+    assert r['matching_missing'] == 0
+    assert r['peak_rss_mb'] > 0
+    assert run_cmd('analyze.py --bounded-memory cam1-qrcode-blue-30_data.bin')[0] == 0
+    with open('cam1-qrcode-blue-30_data.report.json', 'r') as f:
+        assert json.load(f)['total_frames'] == 900
+
+
+def test_generate_and_detect_windows():
+    assert run_cmd('generate.py')[0] == 0
+    assert run_cmd('detect.py --windows 10 --windows-npz cam1-qrcode-blue-30.qt')[0] == 0
+    with open('cam1-qrcode-blue-30_data.windows_10s.csv', 'r') as f:
+        lines = f.readlines()
+    assert lines[0].startswith('start_s,frames,framerate')
+    assert len(lines) > 3
+    assert os.path.exists('cam1-qrcode-blue-30_data.windows_10s.npz')
+    assert not os.path.exists('cam1-qrcode-blue-30_data.windows_1s.csv')
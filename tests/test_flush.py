@@ -0,0 +1,37 @@
+from qrlipsync.flush import FlushPolicy
+
+
+class Clock:
+    def __init__(self):
+        self.time = 0
+
+    def __call__(self):
+        return self.time
+
+
+def test_flush_every_n_records():
+    policy = FlushPolicy(3, 1000, Clock())
+    assert [policy.add_record() for i in range(7)] == [False, False, True, False, False, True, False]
+    assert policy.unflushed_records == 1
+
+
+def test_flush_after_each_record():
+    policy = FlushPolicy(1, 1000, Clock())
+    assert [policy.add_record() for i in range(3)] == [True, True, True]
+
+
+def test_flush_interval():
+    clock = Clock()
+    policy = FlushPolicy(100, 500, clock)
+    assert not policy.add_record()
+    clock.time = 0.499
+    assert not policy.add_record()
+    # the record written once the interval elapsed flushes the others
+    clock.time = 0.5
+    assert policy.add_record()
+    assert policy.unflushed_records == 0
+    # and the interval restarts from that flush
+    clock.time = 0.9
+    assert not policy.add_record()
+    clock.time = 1.0
+    assert policy.add_record()
@@ -0,0 +1,17 @@
+from qrlipsync.instrumentation import StageStats
+
+
+def test_stage_stats_report():
+    stats = StageStats()
+    stats.add_time('zbar', 0.002)
+    stats.add_time('zbar', 0.004)
+    stats.count('barcode_messages', 2)
+    stats.add_queue_level('scaleq', 5, 10)
+    stats.add_queue_level('scaleq', 10, 10)
+    report = stats.get_report()
+    assert report['stages']['zbar']['count'] == 2
+    assert report['stages']['zbar']['mean_ms'] == 3
+    assert report['stages']['zbar']['max_ms'] == 4
+    assert report['counters']['barcode_messages']['count'] == 2
+    assert report['queues']['scaleq'] == {'max_size': 10, 'mean_level': 7.5, 'max_level': 10, 'full_percent': 50}
+    assert 'zbar 3.00ms' in stats.get_summary()
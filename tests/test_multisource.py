@@ -0,0 +1,85 @@
+from qrlipsync.analyze import QrLipsyncAnalyzer
+from qrlipsync.incremental import QrLipsyncIncrementalAnalyzer
+from qrlipsync.multisource import QrLipsyncMultiSourceAnalyzer, parse_sources
+from qrlipsync.synthetic import SyntheticCapture, write_data_file
+
+import heapq
+import json
+
+import pytest
+
+# total_frames (and percentages) of a single source analysis count the qrcodes of all sources
+PER_SOURCE_KEYS = ('total_frames', 'dropped_frames_percent', 'duplicated_frames_percent')
+
+
+class Options():
+    no_report_files = True
+    qrcode_name = 'CAM1'
+    qrcode_names = 'all'
+    custom_data_name = 'TICKFREQ'
+    desync_threshold_frames = 0
+
+
+def write_multi_source_file(data_file, binary_format, sources=4):
+    # several cameras with a single audio track, which carries the beeps of CAM1
+    captures = [
+        SyntheticCapture(120, qrcode_name='CAM%s' % i, drop_rate=0.01 * i, dup_rate=0.005, seed=i)
+        for i in range(1, sources + 1)
+    ]
+    streams = [
+        [r for r in c.records() if i == 0 or r.get('ELEMENTNAME') != 'spectrum']
+        for i, c in enumerate(captures)
+    ]
+    records = heapq.merge(*streams, key=lambda r: r.get('TIMESTAMP', float('inf')))
+    write_data_file(data_file, records, binary_format)
+    return captures
+
+
+def test_parse_sources():
+    assert parse_sources('all') is None
+    assert parse_sources('CAM1, CAM3') == ['CAM1', 'CAM3']
+
+
+@pytest.mark.parametrize('analyzer_class', [QrLipsyncAnalyzer, QrLipsyncIncrementalAnalyzer])
+@pytest.mark.parametrize('binary_format', [False, True])
+def test_single_pass_matches_single_sources(tmp_path, binary_format, analyzer_class):
+    data_file = str(tmp_path / 'data.txt')
+    captures = write_multi_source_file(data_file, binary_format)
+    q = QrLipsyncMultiSourceAnalyzer(data_file, Options(), analyzer_class)
+    assert q.start()
+    results = q.get_results_dict()
+    assert list(results) == ['CAM1', 'CAM2', 'CAM3', 'CAM4']
+    for capture in captures:
+        options = Options()
+        options.qrcode_name = capture.qrcode_name
+        single = analyzer_class(data_file, options)
+        assert single.start()
+        expected = single.get_results_dict()
+        source_results = results[capture.qrcode_name]
+        assert source_results['dropped_frames'] == capture.dropped_frames
+        assert source_results['duplicated_frames'] == capture.duplicated_frames
+        assert source_results['total_frames'] == capture.frames_count - capture.dropped_frames + capture.duplicated_frames
+        assert source_results['matching_missing'] == 0
+        for key in PER_SOURCE_KEYS:
+            del expected[key], source_results[key]
+        assert source_results == expected
+
+
+def test_expected_sources(tmp_path):
+    data_file = str(tmp_path / 'data.txt')
+    write_multi_source_file(data_file, False, sources=2)
+    options = Options()
+    options.no_report_files = False
+    options.qrcode_names = 'CAM2,CAM5'
+    options.windows = ''
+    q = QrLipsyncMultiSourceAnalyzer(data_file, options)
+    assert q.start()
+    assert q.missing_sources == ['CAM5']
+    # a missing source is an error
+    assert q.show_summary_and_exit() == 1
+    with open(str(tmp_path / 'data.sources.json')) as f:
+        results = json.load(f)
+    assert list(results) == ['CAM2']
+    with open(str(tmp_path / 'data.CAM2.report.json')) as f:
+        assert json.load(f)['dropped_frames'] == results['CAM2']['dropped_frames']
+    assert not (tmp_path / 'data.CAM1.report.json').exists()
@@ -0,0 +1,55 @@
+import threading
+
+import pytest
+
+from qrlipsync.results import ResultsQueue
+
+
+def test_results_are_handled_in_order():
+    handled = list()
+    results = ResultsQueue(lambda name, value: handled.append((name, value)), 2)
+    results.start()
+    for i in range(10):
+        results.put(("barcode", i))
+    results.stop()
+    assert handled == [("barcode", i) for i in range(10)]
+    assert results.peak_depth <= 2
+    # dropped once stopped
+    results.put(("barcode", 10))
+    assert len(handled) == 10
+
+
+def test_handler_errors():
+    handled = list()
+
+    def handler(name, value):
+        if value % 2:
+            raise ValueError("malformed %s" % value)
+        handled.append(value)
+
+    results = ResultsQueue(handler, 1)
+    results.start()
+    for i in range(6):
+        results.put(("barcode", i))
+    results.stop()
+    assert handled == [0, 2, 4]
+    assert results.errors == 3
+
+
+@pytest.mark.filterwarnings('ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_producers_do_not_block_once_the_thread_died():
+    def handler(name, value):
+        # not caught like handler errors, the thread exits
+        raise SystemExit()
+
+    results = ResultsQueue(handler, 1)
+    results.start()
+    results.put(("barcode", 0))
+    results._thread.join(timeout=5)
+    assert not results._thread.is_alive()
+    # a streaming thread putting into the full queue
+    producer = threading.Thread(target=lambda: [results.put(("spectrum", i)) for i in range(3)])
+    producer.start()
+    producer.join(timeout=5)
+    assert not producer.is_alive()
+    results.stop()
@@ -0,0 +1,45 @@
+from qrlipsync.roi import AdaptiveRoi
+
+
+def scan(roi, qrcode, frames):
+    # a qrcode is found when it is entirely within the scanned area
+    misses = 0
+    for _ in range(frames):
+        x1, y1, x2, y2 = roi.bounds
+        hit = x1 <= qrcode[0] and y1 <= qrcode[1] and x2 >= qrcode[2] and y2 >= qrcode[3]
+        misses += not hit
+        roi.update(hit)
+    return misses
+
+
+def test_roi_converges():
+    roi = AdaptiveRoi()
+    qrcode = (40, 20, 62, 55)
+    misses = scan(roi, qrcode, 100)
+    assert roi.settled
+    assert misses < 30
+    x1, y1, x2, y2 = roi.bounds
+    # within one step of the margin
+    assert 33 <= x1 <= 40 and 13 <= y1 <= 20 and 62 <= x2 <= 69 and 55 <= y2 <= 62
+    # no miss once settled
+    assert scan(roi, qrcode, 100) == 0
+
+
+def test_roi_within_area():
+    roi = AdaptiveRoi(area=(0, 30, 30, 80))
+    scan(roi, (5, 40, 20, 60), 100)
+    assert roi.settled
+    x1, y1, x2, y2 = roi.bounds
+    assert x1 >= 0 and y1 >= 30 and x2 <= 30 and y2 <= 80
+
+
+def test_roi_follows_moved_qrcode():
+    roi = AdaptiveRoi()
+    scan(roi, (10, 10, 30, 30), 100)
+    assert roi.settled
+    # the new position is found again after max_misses frames
+    scan(roi, (60, 60, 80, 80), 200)
+    assert roi.settled
+    x1, y1, x2, y2 = roi.bounds
+    assert x1 <= 60 and y1 <= 60 and x2 >= 80 and y2 >= 80
+    assert (x2 - x1) * (y2 - y1) < 40 * 40
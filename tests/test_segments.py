@@ -0,0 +1,74 @@
+import json
+import os
+
+import pytest
+
+from qrlipsync import binary
+from qrlipsync.segments import SECOND, get_segments, get_stats_file, in_segment, merge_segments, merge_stats
+from qrlipsync.synthetic import generate_records, write_data_file
+
+
+def test_get_segments():
+    assert get_segments(30, 1) == [(None, None)]
+    assert get_segments(30, 3) == [(None, 10), (10, 20), (20, None)]
+
+
+def test_in_segment():
+    qrcode = {"ELEMENTNAME": "qrcode_detector", "TIMESTAMP": 0, "VIDEOTIMESTAMP": 10 * SECOND}
+    beep = {"ELEMENTNAME": "spectrum", "TIMESTAMP": 10 * SECOND - 1}
+    # video records are placed by their decoded timestamp, the start is included
+    assert in_segment(qrcode, (10, 20))
+    assert not in_segment(qrcode, (None, 10))
+    assert in_segment(beep, (None, 10))
+    assert not in_segment(beep, (10, None))
+    assert in_segment(beep, (None, None))
+
+
+def split_records(records, segments):
+    # what the detector of each segment keeps, margins left out
+    return [[r for r in records if in_segment(r, segment)] for segment in segments]
+
+
+@pytest.mark.parametrize("binary_format", [False, True])
+def test_merge_segments(tmp_path, binary_format):
+    records = list(generate_records(30))[:-1]
+    segments = get_segments(31, 3)
+    results = list()
+    for i, segment_records in enumerate(split_records(records, segments)):
+        part_file = str(tmp_path / ("data.txt.part%s" % i))
+        write_data_file(part_file, segment_records, binary_format)
+        results.append({"result_file": part_file, "audio_duration": 31 * SECOND - i, "video_duration": 31 * SECOND})
+    result_file = str(tmp_path / "data.txt")
+    merge_segments(result_file, results, binary_format)
+    assert os.listdir(str(tmp_path)) == ["data.txt"]
+    if binary_format:
+        merged = [binary.unpack_record(r) for r in binary.read_records(result_file)]
+        timestamps = [r.get("VIDEOTIMESTAMP", r.get("TIMESTAMP")) for r in merged[:-1]]
+        assert timestamps == [r.get("VIDEOTIMESTAMP", r.get("TIMESTAMP")) for r in records]
+    else:
+        with open(result_file) as f:
+            merged = [json.loads(line) for line in f]
+        assert merged[:-1] == records
+    assert merged[-1] == {"AUDIODURATION": 31 * SECOND, "VIDEODURATION": 31 * SECOND}
+
+
+def test_merge_stats(tmp_path):
+    results = list()
+    for i in range(2):
+        part_file = str(tmp_path / ("data.txt.part%s" % i))
+        with open(get_stats_file(part_file), "w") as f:
+            json.dump({
+                "stages": {"zbar": {"count": 10, "total_s": 0.5 + i, "mean_ms": 0, "max_ms": 2 + i}},
+                "counters": {"barcode_messages": {"count": 5, "per_s": 1}},
+                "queues": {},
+            }, f)
+        results.append({"result_file": part_file})
+    stats_file = str(tmp_path / "data.stats.json")
+    merge_stats(stats_file, results)
+    assert os.listdir(str(tmp_path)) == ["data.stats.json"]
+    with open(stats_file) as f:
+        stats = json.load(f)
+    assert stats["stages"]["zbar"] == {"count": 20, "total_s": 2.0, "max_ms": 3, "mean_ms": 100.0}
+    assert stats["counters"]["barcode_messages"]["count"] == 10
+    assert len(stats["segments"]) == 2
+    assert stats["segments"][1]["stages"]["zbar"]["total_s"] == pytest.approx(1.5)
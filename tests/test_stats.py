@@ -0,0 +1,66 @@
+import random
+
+import numpy as np
+import pytest
+
+from qrlipsync.stats import DriftDetector, IntegerHistogram, OnlineRegression
+
+
+def get_delays(duration, drift_start, drift_ms, noise_ms=8, seed=1):
+    r = random.Random(seed)
+    for i in range(1, duration):
+        delay = 20 + r.uniform(-noise_ms, noise_ms) + max(0, i - drift_start) * drift_ms
+        yield float(i), round(delay)
+
+
+def test_integer_histogram_matches_numpy():
+    r = random.Random(1)
+    values = [round(r.gauss(20, 30)) for _ in range(1001)]
+    histogram = IntegerHistogram()
+    for value in values:
+        histogram.add(value)
+    for percent in (0, 1, 50, 95, 99, 100):
+        assert histogram.percentile(percent) == pytest.approx(np.percentile(values, percent))
+    assert histogram.median() == np.median(values)
+    assert histogram.min() == min(values)
+    assert histogram.max() == max(values)
+    bins = histogram.bins(33.3)
+    assert sum(bins.values()) == len(values)
+    assert bins[0] == sum(1 for v in values if abs(v) < 16.65)
+
+
+def test_online_regression_matches_polyfit():
+    points = list(get_delays(600, 0, 0.5))
+    regression = OnlineRegression()
+    for x, y in points:
+        regression.add(x, y)
+    slope, intercept = np.polyfit(*zip(*points), 1)
+    assert regression.slope == pytest.approx(slope)
+    assert regression.predict(0) == pytest.approx(intercept)
+    low, high = regression.slope_interval()
+    assert low < 0.5 < high
+    assert high - low < 0.01
+
+
+def test_drift_detector_no_change():
+    detector = DriftDetector()
+    changes = [x for x, y in get_delays(3600, 3600, 0) if detector.add(x, y)]
+    assert not changes
+    segments = detector.get_segments()
+    assert len(segments) == 1
+    assert segments[0]['count'] == 3599
+    low, high = segments[0]['drift_ci95']
+    assert low <= 0 <= high
+
+
+@pytest.mark.parametrize('noise_ms', [0, 8])
+def test_drift_detector_change(noise_ms):
+    detector = DriftDetector()
+    changes = [x for x, y in get_delays(600, 300, 1, noise_ms) if detector.add(x, y)]
+    # found within seconds
+    assert len(changes) == 1 and 300 < changes[0] < 320
+    before, after = detector.get_segments()
+    assert before['drift_ms_per_s'] == pytest.approx(0, abs=0.02)
+    assert after['drift_ms_per_s'] == pytest.approx(1, abs=0.02)
+    assert 295 < after['start'] <= changes[0]
+    assert detector.total.slope == pytest.approx(0.5, abs=0.05)
@@ -0,0 +1,67 @@
+import csv
+import json
+
+from qrlipsync.summary import find_media_files, write_summary
+
+
+def touch(path):
+    open(path, "w").close()
+
+
+def test_find_media_files(tmp_path):
+    captures = tmp_path / "captures"
+    captures.mkdir()
+    for name in ("b.mp4", "a.QT", "notes.txt", "a_data.txt"):
+        touch(captures / name)
+    (captures / "sub").mkdir()
+    touch(captures / "sub" / "c.mkv")
+    other = str(tmp_path / "other.webm")
+    touch(other)
+    a = str(captures / "a.QT")
+    b = str(captures / "b.mp4")
+    # directories are not recursed into and files are only listed once
+    assert find_media_files([str(captures), other, a]) == [a, b, other]
+    # globs, missing files give nothing
+    assert find_media_files([str(captures / "*.mp4")]) == [b]
+    assert find_media_files([str(tmp_path / "missing.mp4")]) == []
+
+
+def test_write_summary(tmp_path):
+    summary = {
+        "total_files": 2,
+        "failed_files": 1,
+        "files": [
+            {
+                "media_file": "a.qt",
+                "result_file": "a_data.txt",
+                "exit_code": 0,
+                "processing_duration": 1.5,
+                "error": None,
+                "median_av_delay_ms": 20.0,
+                "av_delay_histogram_frames": {"0": 3, "1": 1},
+                "av_delay_drift_ci95": [0.1, 0.3],
+                "drift_segments": [],
+            },
+            {
+                "media_file": "b.qt",
+                "result_file": "b_data.txt",
+                "exit_code": 1,
+                "processing_duration": 0.5,
+                "error": "no qrcode named CAM1 found",
+                "av_delay_drift_ci95": "nan",
+            },
+        ],
+    }
+    prefix = str(tmp_path / "summary")
+    write_summary(summary, prefix)
+    with open("%s.json" % prefix) as f:
+        assert json.load(f) == summary
+    with open("%s.csv" % prefix, newline="") as f:
+        rows = list(csv.DictReader(f))
+    # nested results are only in the json summary
+    assert list(rows[0]) == [
+        "media_file", "result_file", "exit_code", "processing_duration", "error", "median_av_delay_ms"
+    ]
+    assert rows[0]["median_av_delay_ms"] == "20.0"
+    assert rows[1]["median_av_delay_ms"] == ""
+    assert rows[1]["error"] == "no qrcode named CAM1 found"
@@ -0,0 +1,171 @@
+from qrlipsync.analyze import QrLipsyncAnalyzer
+from qrlipsync.incremental import QrLipsyncIncrementalAnalyzer
+from qrlipsync.synthetic import SyntheticCapture, generate_records, write_data_file
+
+import logging
+import tracemalloc
+
+import numpy as np
+import pytest
+
+
+class Options():
+    no_report_files = True
+    qrcode_name = 'CAM1'
+    custom_data_name = 'TICKFREQ'
+    desync_threshold_frames = 0
+
+
+@pytest.mark.parametrize('binary_format', [False, True])
+@pytest.mark.parametrize('framerate', [25, 30, 60])
+def test_perfect_capture(tmp_path, framerate, binary_format):
+    data_file = str(tmp_path / 'data.txt')
+    count = write_data_file(data_file, generate_records(60, framerate), binary_format)
+    assert count == 60 * framerate + 60 + 1
+    q = QrLipsyncAnalyzer(data_file, Options())
+    assert q.start()
+    results = q.get_results_dict()
+    assert results['total_frames'] == 60 * framerate
+    assert results['total_beeps'] == 60
+    assert results['dropped_frames'] == 0
+    assert results['duplicated_frames'] == 0
+    assert results['median_av_delay_ms'] == 0
+    assert results['matching_missing'] == 0
+    assert results['avg_real_framerate'] == pytest.approx(framerate, abs=0.1)
+    assert results['video_duration'] == 61
+
+
+@pytest.mark.parametrize('binary_format', [False, True])
+def test_impaired_capture(tmp_path, binary_format):
+    data_file = str(tmp_path / 'data.txt')
+    capture = SyntheticCapture(
+        300,
+        delay_ms=40,
+        drift_ms=1,
+        jitter_ms=2,
+        drop_rate=0.01,
+        dup_rate=0.01,
+        backwards_rate=0.001,
+        missing_beep_rate=0.05,
+        seed=1,
+    )
+    write_data_file(data_file, capture.records(), binary_format)
+    assert capture.dropped_frames and capture.duplicated_frames and capture.backwards_jumps and capture.missing_beeps
+    q = QrLipsyncAnalyzer(data_file, Options())
+    assert q.start()
+    results = q.get_results_dict()
+    assert results['dropped_frames'] == capture.dropped_frames
+    assert results['duplicated_frames'] == capture.duplicated_frames
+    assert results['matching_missing'] == capture.missing_beeps
+    assert results['total_beeps'] == capture.beeps - capture.missing_beeps
+    # delays go from 40 to 340ms
+    assert results['median_av_delay_ms'] == pytest.approx(190, abs=10)
+    delays = q.audio_video_delays_ms
+    assert results['av_delay_min_ms'] == delays.min()
+    assert results['av_delay_max_ms'] == delays.max()
+    for percent in (50, 95, 99):
+        assert results['av_delay_p%s_ms' % percent] == pytest.approx(np.percentile(delays, percent), abs=0.05)
+    histogram = results['av_delay_histogram_frames']
+    assert sum(b['count'] for b in histogram) == len(delays)
+    assert histogram[0]['frames'] == 1 and histogram[-1]['frames'] == 10
+    slope = np.polyfit(q.audio_video_delays_tc, q.audio_video_delays_ms, 1)[0]
+    assert slope == pytest.approx(1, abs=0.05)
+
+
+@pytest.mark.parametrize('analyzer_class', [QrLipsyncAnalyzer, QrLipsyncIncrementalAnalyzer])
+def test_delay_frames_rounding(tmp_path, analyzer_class):
+    # -965ms is -28.95 frames at 30 fps, which int(round(x, 1)) makes -28
+    # with python floats and -29 with numpy ones
+    data_file = str(tmp_path / 'data.txt')
+    write_data_file(data_file, SyntheticCapture(30, delay_ms=-965).records())
+    q = analyzer_class(data_file, Options())
+    assert q.start()
+    results = q.get_results_dict()
+    assert results['median_av_delay_ms'] == -965
+    assert results['median_av_delay_frames'] == -28
+    assert q.get_ms_to_frames(-965) == -28
+
+
+@pytest.mark.parametrize('binary_format', [False, True])
+def test_bounded_memory_matches(tmp_path, binary_format):
+    data_file = str(tmp_path / 'data.txt')
+    capture = SyntheticCapture(300, jitter_ms=2, drop_rate=0.01, dup_rate=0.01, missing_beep_rate=0.05, seed=2)
+    write_data_file(data_file, capture.records(), binary_format)
+    q = QrLipsyncAnalyzer(data_file, Options())
+    assert q.start()
+    bounded = QrLipsyncIncrementalAnalyzer(data_file, Options())
+    assert bounded.start()
+    assert bounded.get_results_dict() == q.get_results_dict()
+
+
+def test_bounded_memory(tmp_path):
+    # as qr-lipsync-detect --bounded-memory runs it, with report files and time series
+    options = Options()
+    options.no_report_files = False
+    options.windows = '1,10,60'
+    options.windows_npz = False
+    used = list()
+    for duration in (200, 2000):
+        data_file = str(tmp_path / ('%s_data.txt' % duration))
+        write_data_file(data_file, generate_records(duration))
+        # log records would be kept by pytest
+        logging.disable(logging.CRITICAL)
+        tracemalloc.start()
+        try:
+            q = QrLipsyncIncrementalAnalyzer(data_file, options)
+            assert q.start()
+            used.append(tracemalloc.get_traced_memory()[0])
+            q.show_summary_and_exit()
+        finally:
+            tracemalloc.stop()
+            logging.disable(logging.NOTSET)
+        with open(str(tmp_path / ('%s_data.windows_1s.csv' % duration))) as f:
+            assert len(f.readlines()) == duration + 2
+    # 10 times longer, but about the same memory (file buffers and numpy
+    # caches aside): keeping a row per second used to add about 65 kB
+    assert used[1] - used[0] < 40 * 1024
+
+
+class ReportOptions(Options):
+    no_report_files = False
+    windows = '1,10'
+    windows_npz = True
+
+
+@pytest.mark.parametrize('analyzer_class', [QrLipsyncAnalyzer, QrLipsyncIncrementalAnalyzer])
+def test_windowed_series(tmp_path, analyzer_class):
+    data_file = str(tmp_path / 'data.txt')
+    capture = SyntheticCapture(120, delay_ms=20, drop_rate=0.01, dup_rate=0.01, missing_beep_rate=0.1, seed=3)
+    write_data_file(data_file, capture.records())
+    q = analyzer_class(data_file, ReportOptions())
+    assert q.start()
+    results = q.get_results_dict()
+    q.show_summary_and_exit()
+    for window in (1, 10):
+        series = np.load(str(tmp_path / ('data.windows_%ss.npz' % window)))
+        assert series['window_s'] == window
+        assert len(series['start_s']) == 120 // window + 1
+        assert series['dropped_frames'].sum() == results['dropped_frames']
+        assert series['duplicated_frames'].sum() == results['duplicated_frames']
+        assert series['missing_beeps'].sum() == results['matching_missing']
+        assert series['beeps'].sum() + results['matching_missing'] == capture.beeps
+        assert np.nanmedian(series['median_delay_ms']) == 20
+        # a distinct frame every frame duration, except dropped ones
+        assert series['framerate'][2] == pytest.approx(30, abs=3)
+        with open(str(tmp_path / ('data.windows_%ss.csv' % window))) as f:
+            assert len(f.readlines()) == len(series['start_s']) + 1
+
+
+def test_windowed_series_bounded_memory_matches(tmp_path):
+    # windows written along the way by the incremental analyzer are the same
+    files = list()
+    for analyzer_class in (QrLipsyncAnalyzer, QrLipsyncIncrementalAnalyzer):
+        data_file = str(tmp_path / ('%s_data.txt' % analyzer_class.__name__))
+        capture = SyntheticCapture(300, delay_ms=20, jitter_ms=2, drop_rate=0.01, dup_rate=0.01, missing_beep_rate=0.1, seed=4)
+        write_data_file(data_file, capture.records())
+        q = analyzer_class(data_file, ReportOptions())
+        assert q.start()
+        q.show_summary_and_exit()
+        with open(data_file.replace('.txt', '.windows_1s.csv')) as f:
+            files.append(f.read())
+    assert files[0] == files[1]
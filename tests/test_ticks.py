@@ -0,0 +1,63 @@
+import numpy as np
+
+from qrlipsync.ticks import GoertzelTickDetector, TickDetector, SECOND, TICK_FREQUENCIES
+
+SAMPLERATE = 48000
+FREQS = [240, 480, 720, 5040, 10080]
+
+
+def get_ticks_signal(onsets, freqs, duration, tick_duration=1 / 30, noise=0):
+    t = np.arange(int(duration * SAMPLERATE)) / SAMPLERATE
+    signal = np.random.default_rng(0).normal(0, noise, len(t)) if noise else np.zeros(len(t))
+    for onset, freq in zip(onsets, freqs):
+        start = int(onset * SAMPLERATE)
+        end = start + int(tick_duration * SAMPLERATE)
+        signal[start:end] += 0.8 * np.sin(2 * np.pi * freq * (t[start:end] - t[start]))
+    return signal.astype(np.float32)
+
+
+def detect(detector, signal, timestamp=0):
+    ticks = list()
+    # feed buffers of varying sizes like a decoder would
+    sizes = [1024, 441, 4096, 2000]
+    position = 0
+    i = 0
+    while position < len(signal):
+        size = sizes[i % len(sizes)]
+        ticks += detector.process(signal[position:position + size], timestamp + position * SECOND / SAMPLERATE)
+        position += size
+        i += 1
+    return ticks + detector.flush()
+
+
+def test_fft_ticks():
+    onsets = [0.5 + i + 0.0123 * i for i in range(len(FREQS))]
+    signal = get_ticks_signal(onsets, FREQS, len(FREQS) + 1, noise=0.001)
+    detector = TickDetector(SAMPLERATE, -48, 200, 16)
+    ticks = detect(detector, signal, timestamp=10 * SECOND)
+    assert len(ticks) == len(FREQS)
+    for (timestamp, freq, peak), onset, expected_freq in zip(ticks, onsets, FREQS):
+        assert abs(timestamp - (10 + onset) * SECOND) < SECOND / 1000
+        assert abs(freq - expected_freq) < 50
+        assert peak > -48
+
+
+def test_fft_ticks_discontinuity():
+    signal = get_ticks_signal([0.5], [1200], 1)
+    detector = TickDetector(SAMPLERATE, -48, 200, 16)
+    ticks = detect(detector, signal[:SAMPLERATE // 4])
+    # a gap of 10s between both buffers
+    ticks += detect(detector, signal[SAMPLERATE // 4:], timestamp=10 * SECOND)
+    assert len(ticks) == 1
+    assert abs(ticks[0][0] - 10.25 * SECOND) < SECOND / 1000
+
+
+def test_goertzel_ticks():
+    onsets = [0.5 + i + 0.0123 * i for i in range(len(FREQS))]
+    signal = get_ticks_signal(onsets, FREQS, len(FREQS) + 1, noise=0.05)
+    detector = GoertzelTickDetector(SAMPLERATE, TICK_FREQUENCIES, -48, 200, 16)
+    ticks = detect(detector, signal, timestamp=10 * SECOND)
+    assert len(ticks) == len(FREQS)
+    for (timestamp, freq, peak), onset, expected_freq in zip(ticks, onsets, FREQS):
+        assert abs(timestamp - (10 + onset) * SECOND) < SECOND / 2000
+        assert freq == expected_freq
@@ -0,0 +1,64 @@
+import random
+
+import numpy as np
+
+from qrlipsync.timeseries import WindowedSeries, parse_windows, read_csv
+
+
+def test_parse_windows():
+    assert parse_windows("60,1, 10") == [1, 10, 60]
+    assert parse_windows("") == []
+
+
+def test_single_events_match_arrays():
+    r = random.Random(1)
+    timestamps = [r.uniform(0, 100) for _ in range(1000)]
+    one_by_one = WindowedSeries(10)
+    for ts in reversed(timestamps):
+        one_by_one.count("frames", ts)
+        one_by_one.count("dropped_frames", ts, 2)
+    arrays = WindowedSeries(10)
+    arrays.add("frames", np.array(timestamps))
+    arrays.add("dropped_frames", np.array(timestamps), np.full(len(timestamps), 2))
+    for name, column in one_by_one.get_columns().items():
+        assert np.array_equal(column, arrays.get_columns()[name], equal_nan=True)
+    assert one_by_one.get_columns()["frames"].sum() == 1000
+
+
+def test_median_delays():
+    r = random.Random(2)
+    series = WindowedSeries(5)
+    delays = dict()
+    for _ in range(300):
+        ts = r.uniform(0, 60)
+        delay = r.randint(-50, 50)
+        series.add_delay(ts, delay)
+        delays.setdefault(int(ts // 5), list()).append(delay)
+    # no delay but a missed beep in the last window
+    series.count("missing_beeps", 62)
+    columns = series.get_columns()
+    assert len(columns["start_s"]) == 13
+    for window, values in delays.items():
+        assert columns["median_delay_ms"][window] == np.median(values)
+        assert columns["beeps"][window] == len(values)
+    assert np.isnan(columns["median_delay_ms"][12])
+
+
+def test_flushed_windows_are_forgotten(tmp_path):
+    series = WindowedSeries(1)
+    series.open_csv(str(tmp_path / "series.csv"))
+    for i in range(3000):
+        ts = i / 10
+        series.count("frames", ts)
+        if i % 10 == 0:
+            series.add_delay(ts, i % 7)
+        series.flush(ts - 15)
+        assert len(series.get_columns()["start_s"]) <= 17
+    # too late, its window was written
+    series.count("frames", 10)
+    series.close()
+    assert series.late_events == 1
+    columns = read_csv(str(tmp_path / "series.csv"))
+    assert columns["start_s"].tolist() == list(range(300))
+    assert columns["frames"].tolist() == [10] * 300
+    assert columns["median_delay_ms"].tolist() == [i * 10 % 7 for i in range(300)]